@@ -0,0 +1,135 @@
+import argparse
+import asyncio
+import datetime as dt
+import os
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import main
+from main import Base
+
+ACTIONS = ["chat", "customer_created", "service_created", "invoice_generated"]
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process."""
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def seed(path: str, rows: int, tenants: int, rng: random.Random):
+    """Bulk load chat logs with plain sqlite3, one per minute going back."""
+    start = dt.datetime.now() - dt.timedelta(minutes=rows)
+    conn = sqlite3.connect(path)
+    batch = []
+    for i in range(rows):
+        timestamp = start + dt.timedelta(minutes=i)
+        batch.append(
+            (
+                rng.randint(1, tenants),
+                timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                rng.choice(ACTIONS),
+                f"Message: question {i}, Response: answer {rng.random():.6f}",
+            )
+        )
+        if len(batch) == 100_000:
+            conn.executemany(
+                "INSERT INTO logs (customer_id, timestamp, action, details) VALUES (?, ?, ?, ?)",
+                batch,
+            )
+            batch = []
+    if batch:
+        conn.executemany(
+            "INSERT INTO logs (customer_id, timestamp, action, details) VALUES (?, ?, ?, ?)",
+            batch,
+        )
+    conn.commit()
+    conn.close()
+
+
+async def export(label: str, **params):
+    """Drain the export endpoint's response body, tracking size and RSS."""
+    defaults = {"fmt": "ndjson", "gzip": False, "customer_id": None, "start": None, "end": None}
+    response = await main.export_table("logs", **{**defaults, **params})
+    before = rss_mb()
+    peak = before
+    size = 0
+    chunks = 0
+    started = time.perf_counter()
+    async for data in response.body_iterator:
+        size += len(data)
+        chunks += 1
+        if chunks % 100 == 0:
+            peak = max(peak, rss_mb())
+    seconds = time.perf_counter() - started
+    peak = max(peak, rss_mb())
+    print(
+        f"{label:<22}{seconds:>9.1f}{size / 1024 / 1024:>11.1f}"
+        f"{size / 1024 / 1024 / seconds:>10.1f}{before:>11.1f}{peak:>11.1f}"
+    )
+    return peak - before
+
+
+async def run_benchmark(
+    rows: int, tenants: int, max_rss_growth_mb: float, fixture: Optional[str]
+):
+    if fixture:
+        path = fixture
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        print(f"Using {path}")
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench_export.db")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        started = time.perf_counter()
+        seed(path, rows, tenants, random.Random(5))
+        print(f"Seeded {rows} logs in {time.perf_counter() - started:.1f}s into {path}")
+
+    # Point the export at the benchmark database
+    main.read_engine = engine
+    today = dt.date.today()
+    print(
+        f"{'export':<22}{'seconds':>9}{'MiB out':>11}{'MiB/s':>10}"
+        f"{'RSS before':>11}{'RSS peak':>11}"
+    )
+    growth = [
+        await export("ndjson"),
+        await export("csv.gz", fmt="csv", gzip=True),
+        await export(
+            "one tenant, 30 days",
+            customer_id=1,
+            start=today - dt.timedelta(days=30),
+            end=today,
+        ),
+    ]
+    await engine.dispose()
+    peak_growth = max(growth)
+    print(
+        f"Peak RSS growth {peak_growth:.1f} MiB"
+        f" (cap {max_rss_growth_mb:.0f} MiB, max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB)"
+    )
+    return peak_growth <= max_rss_growth_mb
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Stream large log exports and check memory stays flat"
+    )
+    parser.add_argument("--rows", type=int, default=5_000_000)
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=100)
+    parser.add_argument("--db", help="existing database from seed.py to export instead")
+    args = parser.parse_args()
+    ok = asyncio.run(
+        run_benchmark(args.rows, args.tenants, args.max_rss_growth_mb, args.db)
+    )
+    sys.exit(0 if ok else 1)
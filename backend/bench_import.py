@@ -0,0 +1,102 @@
+import argparse
+import csv
+import io
+import os
+import random
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import main
+from main import Base
+
+CATEGORIES = ["food", "drinks", "tools", "cleaning", "retail", "spare parts"]
+
+
+def make_items(count: int, rng: random.Random, customer_id: int = 1):
+    return [
+        {
+            "customer_id": customer_id,
+            "name": f"Item {i}",
+            "quantity": rng.randint(0, 500),
+            "price": round(rng.uniform(0.5, 250), 2),
+            "category": rng.choice(CATEGORIES),
+        }
+        for i in range(count)
+    ]
+
+
+def to_csv(items) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(items[0]))
+    writer.writeheader()
+    writer.writerows(items)
+    return buffer.getvalue()
+
+
+def timed(label: str, fn, rows: int):
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+    print(f"{label:<28}{rows:>8}{seconds:>10.2f}{rows / seconds:>12.0f}")
+    return result
+
+
+def run_benchmark(items: int, singles: int, seed: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench_import.db")
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    # Point the endpoints at the benchmark database
+    main.bind_database(f"sqlite+aiosqlite:///{path}")
+    rng = random.Random(seed)
+    client = TestClient(main.app)
+
+    print(f"{'import':<28}{'rows':>8}{'seconds':>10}{'rows/s':>12}")
+    rows = make_items(items, rng, customer_id=1)
+    report = timed(
+        "JSON array, insert",
+        lambda: client.post("/api/import/inventory", json=rows).json(),
+        items,
+    )
+    assert report["inserted"] == items, report
+    report = timed(
+        "CSV, insert",
+        lambda: client.post(
+            "/api/import/inventory",
+            content=to_csv(make_items(items, rng, customer_id=2)),
+            headers={"content-type": "text/csv"},
+        ).json(),
+        items,
+    )
+    assert report["inserted"] == items, report
+    report = timed(
+        "JSON array, upsert (updates)",
+        lambda: client.post(
+            "/api/import/inventory?mode=upsert", json=make_items(items, rng)
+        ).json(),
+        items,
+    )
+    assert report["updated"] == items, report
+
+    single_rows = make_items(singles, rng, customer_id=3)
+
+    def post_singles():
+        for row in single_rows:
+            client.post("/api/inventory", json=row).raise_for_status()
+
+    started = time.perf_counter()
+    timed("single-row POSTs", post_singles, singles)
+    per_row = (time.perf_counter() - started) / singles
+    print(f"  extrapolated to {items} rows: {per_row * items:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Bulk inventory import versus one POST per item"
+    )
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--singles", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=9)
+    args = parser.parse_args()
+    run_benchmark(args.items, args.singles, args.seed)
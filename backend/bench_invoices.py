@@ -0,0 +1,201 @@
+import argparse
+import asyncio
+import datetime as dt
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from main import Base, Invoice, parse_day, rebuild_revenue_rollups, revenue_series
+
+
+STATUSES = ["paid", "paid", "paid", "unpaid", "overdue"]
+
+
+def seed(path: str, rows: int, tenants: int, days: int, rng: random.Random):
+    """Bulk load invoices with plain sqlite3, in the Date column storage format."""
+    first_day = dt.date.today() - dt.timedelta(days=days)
+    conn = sqlite3.connect(path)
+    batch = []
+    for _ in range(rows):
+        created = first_day + dt.timedelta(days=rng.randrange(days))
+        batch.append(
+            (
+                rng.randint(1, tenants),
+                round(rng.uniform(5, 500), 2),
+                rng.choice(STATUSES),
+                created.isoformat(),
+                (created + dt.timedelta(days=30)).isoformat(),
+            )
+        )
+        if len(batch) == 50_000:
+            conn.executemany(
+                "INSERT INTO invoices (customer_id, total_amount, status, created_date, due_date) "
+                "VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch = []
+    if batch:
+        conn.executemany(
+            "INSERT INTO invoices (customer_id, total_amount, status, created_date, due_date) "
+            "VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return first_day
+
+
+async def timed(repeats: int, fn):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples)) * 1000
+
+
+async def run_benchmark(
+    rows: int, tenants: int, days: int, repeats: int, fixture: Optional[str]
+):
+    if fixture:
+        # A database from seed.py: query its busiest tenant over its date span
+        path = fixture
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with engine.connect() as conn:
+            customer = (
+                await conn.execute(
+                    select(Invoice.customer_id)
+                    .group_by(Invoice.customer_id)
+                    .order_by(func.count().desc())
+                    .limit(1)
+                )
+            ).scalar_one()
+            first_day, last_day = (
+                await conn.execute(
+                    select(func.min(Invoice.created_date), func.max(Invoice.created_date))
+                )
+            ).one()
+        days = (last_day - first_day).days + 1
+        print(f"Using {path}, customer {customer}")
+    else:
+        path = os.path.join(tempfile.mkdtemp(), "bench_invoices.db")
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        started = time.perf_counter()
+        first_day = seed(path, rows, tenants, days, random.Random(3))
+        print(f"Seeded {rows} invoices in {time.perf_counter() - started:.1f}s into {path}")
+        customer = 1
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        rollup_rows = await rebuild_revenue_rollups(conn)
+    print(f"Rebuilt {rollup_rows} rollup rows in {time.perf_counter() - started:.1f}s")
+
+    main.async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    day = (first_day + dt.timedelta(days=days // 2)).isoformat()
+    month_start = (first_day + dt.timedelta(days=days // 2)).replace(day=1)
+    month_end = (month_start + dt.timedelta(days=32)).replace(day=1)
+
+    def paid_sum(predicate):
+        async def run():
+            async with engine.connect() as conn:
+                await conn.execute(
+                    select(func.sum(Invoice.total_amount)).where(
+                        Invoice.customer_id == customer, Invoice.status == "paid", predicate
+                    )
+                )
+
+        return run
+
+    start = parse_day(day)
+    end = start + dt.timedelta(days=1)
+    year_start = month_start.replace(year=month_start.year - 1)
+
+    def rollup_series(first, last, granularity):
+        async def run():
+            async with main.async_session() as session:
+                await revenue_series(session, customer, first, last, granularity)
+
+        return run
+
+    async def raw_months():
+        async with engine.connect() as conn:
+            await conn.execute(
+                select(
+                    func.strftime("%Y-%m", Invoice.created_date),
+                    func.sum(Invoice.total_amount),
+                    func.count(),
+                )
+                .where(
+                    Invoice.customer_id == customer,
+                    Invoice.status == "paid",
+                    Invoice.created_date >= year_start,
+                    Invoice.created_date < month_end,
+                )
+                .group_by(func.strftime("%Y-%m", Invoice.created_date))
+            )
+    cases = [
+        (
+            "day, indexed range",
+            paid_sum((Invoice.created_date >= start) & (Invoice.created_date < end)),
+            (Invoice.created_date >= start) & (Invoice.created_date < end),
+        ),
+        (
+            "month, indexed range",
+            paid_sum(
+                (Invoice.created_date >= month_start) & (Invoice.created_date < month_end)
+            ),
+            (Invoice.created_date >= month_start) & (Invoice.created_date < month_end),
+        ),
+        (
+            "month, strftime() scan",
+            paid_sum(
+                func.strftime("%Y-%m", Invoice.created_date)
+                == month_start.strftime("%Y-%m")
+            ),
+            func.strftime("%Y-%m", Invoice.created_date) == month_start.strftime("%Y-%m"),
+        ),
+    ]
+    print(f"{'query':<28}{'median ms':>12}  plan")
+    for label, fn, predicate in cases:
+        ms = await timed(repeats, fn)
+        stmt = select(Invoice.id).where(
+            Invoice.customer_id == customer, Invoice.status == "paid", predicate
+        )
+        compiled = stmt.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+        async with engine.connect() as conn:
+            plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}")).all()
+        print(f"{label:<28}{ms:>12.2f}  {plan[0][-1]}")
+    for label, fn in [
+        ("month, rollups", rollup_series(month_start, month_end, "month")),
+        ("12 months, invoices", raw_months),
+        ("12 months, rollups", rollup_series(year_start, month_end, "month")),
+        ("12 months by week, rollups", rollup_series(year_start, month_end, "week")),
+    ]:
+        print(f"{label:<28}{await timed(repeats, fn):>12.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Revenue range queries over a large invoices table"
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tenants", type=int, default=20)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--db", help="existing database from seed.py to query instead")
+    args = parser.parse_args()
+    asyncio.run(
+        run_benchmark(args.rows, args.tenants, args.days, args.repeats, args.db)
+    )
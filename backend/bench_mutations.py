@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import datetime as dt
+import os
+import tempfile
+import time
+
+import httpx
+import numpy as np
+from sqlalchemy import create_engine
+
+import main
+from main import Base
+
+TODAY = dt.date.today().isoformat()
+
+# Create payload and the field each PUT changes, per mutating route
+ROUTES = {
+    "customers": (
+        {"name": "Bench", "email": "bench@example.com", "phone": "555-0100"},
+        "phone",
+    ),
+    "services": (
+        {"customer_id": 1, "name": "Haircut", "price": 25.0, "duration": 30},
+        "price",
+    ),
+    "inventory": (
+        {"customer_id": 1, "name": "Shampoo", "quantity": 10, "price": 8.5},
+        "quantity",
+    ),
+    "invoices": (
+        {
+            "customer_id": 1,
+            "total_amount": 120.0,
+            "status": "paid",
+            "created_date": TODAY,
+            "due_date": TODAY,
+            "items": "[]",
+        },
+        "total_amount",
+    ),
+    "business-hours": (
+        {"customer_id": 1, "day_of_week": 0, "open_time": "09:00", "close_time": "17:00"},
+        "close_time",
+    ),
+    "unanswered-questions": (
+        {"customer_id": 1, "question": "Do you open on holidays?", "timestamp": TODAY},
+        "response",
+    ),
+    "business-services": (
+        {"customer_id": 1, "name": "Color", "category": "service", "price": 60.0},
+        "price",
+    ),
+    "business-facts": (
+        {"customer_id": 1, "title": "Parking", "content": "Free parking", "category": "info"},
+        "content",
+    ),
+    "policies": (
+        {"customer_id": 1, "title": "Refunds", "content": "Within 30 days", "category": "refund"},
+        "content",
+    ),
+}
+DELETE_ROUTES = ["inventory", "business-services", "business-facts", "policies"]
+ROUTES_TIMED = [("PUT", route) for route in ROUTES] + [
+    ("DELETE", route) for route in DELETE_ROUTES
+]
+
+
+def changed_value(field: str, i: int):
+    if field in ("price", "total_amount"):
+        return 10.0 + i % 50
+    if field == "quantity":
+        return i % 100
+    return f"value {i}"
+
+
+async def orm_update_row(model, row_id: int, values: dict):
+    """The previous write path: load the row into the session, set the
+    attributes and let the flush write them."""
+
+    async def apply(session):
+        row = await session.get(model, row_id)
+        if row is not None:
+            for name, value in values.items():
+                setattr(row, name, value)
+        return row
+
+    return await main.write_queue.run(apply)
+
+
+async def orm_delete_row(model, row_id: int) -> bool:
+    async def apply(session):
+        row = await session.get(model, row_id)
+        if row is None:
+            return False
+        await session.delete(row)
+        return True
+
+    return await main.write_queue.run(apply)
+
+
+PATHS = {
+    "orm": (orm_update_row, orm_delete_row),
+    "returning": (main.update_row, main.delete_row),
+}
+
+
+async def create(client: httpx.AsyncClient, route: str) -> dict:
+    response = await client.post(f"/api/{route}", json=ROUTES[route][0])
+    response.raise_for_status()
+    return response.json()
+
+
+async def timed_requests(send, count: int) -> np.ndarray:
+    seconds = []
+    for i in range(count):
+        started = time.perf_counter()
+        (await send(i)).raise_for_status()
+        seconds.append(time.perf_counter() - started)
+    return np.array(seconds) * 1000
+
+
+async def run_benchmark(requests: int):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench_mutations.db")
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    main.bind_database(f"sqlite+aiosqlite:///{path}")
+    main.knowledge_store = main.KnowledgeStore(os.path.join(directory, "knowledge"))
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        rows = {route: await create(client, route) for route in ROUTES}
+        # Both paths take turns per route so drift in the database file
+        # doesn't favour whichever runs last
+        for method, route in ROUTES_TIMED:
+            for label, (update_row, delete_row) in PATHS.items():
+                # The endpoints look the helpers up at call time
+                main.update_row, main.delete_row = update_row, delete_row
+                if method == "PUT":
+                    row, field = rows[route], ROUTES[route][1]
+                    send = lambda i: client.put(
+                        f"/api/{route}/{row['id']}",
+                        json={**row, field: changed_value(field, i)},
+                    )
+                else:
+                    ids = [(await create(client, route))["id"] for _ in range(requests)]
+                    send = lambda i: client.delete(f"/api/{route}/{ids[i]}")
+                results[(method, route, label)] = await timed_requests(send, requests)
+        main.update_row, main.delete_row = PATHS["returning"]
+
+    print(f"{requests} sequential requests per route, latency in ms")
+    print(
+        f"{'route':<34}{'orm p50':>10}{'orm p99':>10}"
+        f"{'ret p50':>10}{'ret p99':>10}{'p50 gain':>10}"
+    )
+    for method, route in ROUTES_TIMED:
+        orm = results[(method, route, "orm")]
+        returning = results[(method, route, "returning")]
+        print(
+            f"{method + ' /api/' + route + '/{id}':<34}"
+            f"{np.percentile(orm, 50):>10.2f}{np.percentile(orm, 99):>10.2f}"
+            f"{np.percentile(returning, 50):>10.2f}{np.percentile(returning, 99):>10.2f}"
+            f"{np.percentile(orm, 50) / np.percentile(returning, 50):>9.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Per-request latency of every PUT and DELETE route: "
+        "load-and-flush versus a single UPDATE/DELETE ... RETURNING"
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.requests))
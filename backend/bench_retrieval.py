@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from main import KnowledgeIndex
+
+
+TOPICS = (
+    "parking wifi vegan gluten patio delivery refund holiday brunch espresso"
+    " pastry catering reservation birthday allergy kids dogs wheelchair tasting"
+    " seasonal organic garage weekend membership haircut massage facial manicure"
+    " pedicure coloring highlights shave consultation whitening cleaning braces"
+    " implant xray tutoring algebra calculus chemistry essay pizza pasta salad"
+    " lasagna tiramisu risotto burger sandwich smoothie latte cappuccino"
+).split()
+FILLER = "the our we offer available please ask staff for more details about".split()
+
+
+def make_chunk(rng: random.Random, i: int):
+    keywords = rng.sample(TOPICS, 4) + [f"item{i}"]
+    body = keywords + rng.choices(FILLER, k=12)
+    rng.shuffle(body)
+    return keywords, f"{keywords[0].title()} {i}: " + " ".join(body)
+
+
+def make_query(rng: random.Random, keywords):
+    """A question that mentions some of the target chunk's keywords."""
+    picked = rng.sample(keywords, 3)
+    return "do you have " + " and ".join(picked) + "?"
+
+
+def run(size: int, queries: int, k: int, rng: random.Random):
+    path = os.path.join(tempfile.mkdtemp(), "bench")
+    index = KnowledgeIndex(path)
+    chunk_keywords = []
+    started = time.perf_counter()
+    for i in range(size):
+        keywords, chunk = make_chunk(rng, i)
+        chunk_keywords.append(keywords)
+        index.upsert("fact", i, [chunk])
+    index.dirty = True
+    index.save()
+    build_seconds = time.perf_counter() - started
+
+    # Reopen from disk so searches run against the memory-mapped file
+    index = KnowledgeIndex.open(path)
+    hits_at_1 = 0
+    hits_at_k = 0
+    latencies = []
+    for _ in range(queries):
+        target = rng.randrange(size)
+        query = make_query(rng, chunk_keywords[target])
+        started = time.perf_counter()
+        results = index.search(query, k)
+        latencies.append(time.perf_counter() - started)
+        found = [key[1] for _, key, _ in results]
+        hits_at_1 += int(found[:1] == [target])
+        hits_at_k += int(target in found)
+
+    ms = np.array(latencies) * 1000
+    print(
+        f"{size:>8}{build_seconds:>10.1f}{hits_at_1 / queries:>10.3f}"
+        f"{hits_at_k / queries:>10.3f}{np.percentile(ms, 50):>10.3f}"
+        f"{np.percentile(ms, 95):>10.3f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recall and latency of the local knowledge index"
+    )
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(
+        f"{'chunks':>8}{'build s':>10}{'recall@1':>10}"
+        f"{'recall@' + str(args.k):>10}{'p50 ms':>10}{'p95 ms':>10}"
+    )
+    for size in [int(s) for s in args.sizes.split(",")]:
+        run(size, args.queries, args.k, rng)
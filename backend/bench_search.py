@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from main import Base, BusinessFact, ensure_search_index
+
+
+WORDS = (
+    "parking wifi vegan gluten patio delivery refund holiday brunch espresso"
+    " pastry catering reservation birthday allergy kids dogs wheelchair tasting"
+    " seasonal organic local parking garage street evening weekend membership"
+).split()
+QUERIES = ["parking", "vegan brunch", "dogs patio", "refund policy", "wheelchair"]
+
+
+def make_fact(rng: random.Random, customer_id: int, i: int) -> dict:
+    return {
+        "customer_id": customer_id,
+        "title": " ".join(rng.sample(WORDS, 2)).title() + f" {i}",
+        "content": " ".join(rng.choices(WORDS, k=30)),
+        "category": rng.choice(["general", "services", "location", "hours"]),
+        "is_public": True,
+    }
+
+
+async def scan_search(session, customer_id: int, query: str):
+    """The pre-FTS implementation: load every public fact, substring match."""
+    result = await session.execute(
+        select(BusinessFact).where(
+            BusinessFact.customer_id == customer_id, BusinessFact.is_public == True
+        )
+    )
+    query_lower = query.lower()
+    return [
+        f
+        for f in result.scalars().all()
+        if query_lower in f.title.lower()
+        or query_lower in f.content.lower()
+        or query_lower in f.category.lower()
+    ]
+
+
+async def run_benchmark(facts_per_tenant: int, tenants: int, repeats: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench_search.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    rng = random.Random(7)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await ensure_search_index(conn)
+        for customer_id in range(1, tenants + 1):
+            rows = [make_fact(rng, customer_id, i) for i in range(facts_per_tenant)]
+            for start in range(0, len(rows), 1000):
+                await conn.execute(insert(BusinessFact), rows[start : start + 1000])
+    print(f"Seeded {tenants} tenants x {facts_per_tenant} facts into {path}")
+
+    # Point the tool at the benchmark database
+    main.read_session = session_factory
+    print(f"{'query':<16}{'scan ms':>10}{'fts ms':>10}{'speedup':>10}")
+    for query in QUERIES:
+        scan_times = []
+        fts_times = []
+        for _ in range(repeats):
+            async with session_factory() as session:
+                started = time.perf_counter()
+                await scan_search(session, 1, query)
+                scan_times.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            await main.search_business_facts.coroutine(1, query)
+            fts_times.append(time.perf_counter() - started)
+        scan_ms = float(np.median(scan_times)) * 1000
+        fts_ms = float(np.median(fts_times)) * 1000
+        print(f"{query:<16}{scan_ms:>10.2f}{fts_ms:>10.2f}{scan_ms / fts_ms:>9.1f}x")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the FTS5 fact search with the old substring scan"
+    )
+    parser.add_argument("--facts", type=int, default=10_000)
+    parser.add_argument("--tenants", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run_benchmark(args.facts, args.tenants, args.repeats))
@@ -0,0 +1,93 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from main import SemanticCache, embed_text
+
+
+SUBJECTS = [
+    "haircut",
+    "beard trim",
+    "parking",
+    "wifi",
+    "gift cards",
+    "vegan options",
+    "outdoor seating",
+    "private events",
+    "delivery",
+    "refunds",
+    "appointments",
+    "walk ins",
+]
+DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+TEMPLATES = [
+    "do you have {subject}",
+    "how much is {subject}",
+    "is {subject} available on {day}",
+    "what time do you open on {day}",
+    "can i book {subject} for {day}",
+    "tell me about {subject} {n}",
+    "question {n} about {subject} on {day}",
+]
+
+
+def make_question(rng: random.Random) -> str:
+    return rng.choice(TEMPLATES).format(
+        subject=rng.choice(SUBJECTS), day=rng.choice(DAYS), n=rng.randint(0, 10**6)
+    )
+
+
+def percentile(samples, pct):
+    return float(np.percentile(np.array(samples) * 1000, pct))
+
+
+def run_benchmark(size: int, lookups: int, seed: int):
+    rng = random.Random(seed)
+    cache = SemanticCache(threshold=0.8, max_per_customer=size, path="/dev/null")
+
+    print(f"Filling one customer index with {size} questions...")
+    started = time.perf_counter()
+    for i in range(size):
+        question = make_question(rng)
+        cache.put(1, question, f"answer {i}")
+    print(f"  fill time: {time.perf_counter() - started:.2f}s")
+
+    queries = [make_question(rng) for _ in range(lookups)]
+    embed_times = []
+    search_times = []
+    total_times = []
+    index = cache._indexes[1]
+    for query in queries:
+        started = time.perf_counter()
+        vector = embed_text(query)
+        embedded = time.perf_counter()
+        index.top1(vector)
+        searched = time.perf_counter()
+        cache.get(1, query)
+        total_times.append(time.perf_counter() - searched)
+        embed_times.append(embedded - started)
+        search_times.append(searched - embedded)
+
+    print(f"Lookup latency over {lookups} queries (ms):")
+    for label, samples in [
+        ("embed", embed_times),
+        ("search", search_times),
+        ("cache.get", total_times),
+    ]:
+        print(
+            f"  {label:<10} p50={percentile(samples, 50):.3f}"
+            f" p95={percentile(samples, 95):.3f} p99={percentile(samples, 99):.3f}"
+        )
+    print(f"  index memory: {index.vectors.nbytes / 1024 / 1024:.1f} MiB")
+    print(f"  hit rate: {cache.stats()['hit_rate']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark semantic cache lookups")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run_benchmark(args.size, args.lookups, args.seed)
@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import datetime as dt
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import main
+from main import Base, BusinessService, Log
+
+
+def seed(path: str, tenants: int, services: int, logs: int, rng: random.Random):
+    """Bulk load services and chat logs with plain sqlite3."""
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO business_services (customer_id, name, description, category, price, duration, is_available)"
+        " VALUES (?, ?, ?, ?, ?, ?, 1)",
+        [
+            (
+                customer_id,
+                f"Service {i}",
+                f"Description of service {i} for customer {customer_id}",
+                rng.choice(["food", "service", "product"]),
+                round(rng.uniform(5, 200), 2),
+                f"{rng.choice([15, 30, 60])} min",
+            )
+            for customer_id in range(1, tenants + 1)
+            for i in range(services)
+        ],
+    )
+    start = dt.datetime.now() - dt.timedelta(minutes=logs)
+    conn.executemany(
+        "INSERT INTO logs (customer_id, timestamp, action, details) VALUES (?, ?, ?, ?)",
+        [
+            (
+                rng.randint(1, tenants),
+                (start + dt.timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                "chat",
+                f"Message: question {i}, Response: answer {rng.random():.6f}",
+            )
+            for i in range(logs)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+class Counters:
+    def __init__(self):
+        self.read_seconds = []
+        self.write_seconds = []
+        self.errors = 0
+
+
+async def reader(engine, tenants: int, deadline: float, counters: Counters, rng):
+    while time.monotonic() < deadline:
+        customer_id = rng.randint(1, tenants)
+        if rng.random() < 0.5:
+            stmt = select(BusinessService).where(
+                BusinessService.customer_id == customer_id,
+                BusinessService.is_available == True,
+            )
+        else:
+            stmt = (
+                select(Log)
+                .where(Log.customer_id == customer_id)
+                .order_by(Log.id.desc())
+                .limit(50)
+            )
+        started = time.perf_counter()
+        try:
+            async with engine.connect() as conn:
+                (await conn.execute(stmt)).all()
+        except OperationalError:
+            counters.errors += 1
+            continue
+        counters.read_seconds.append(time.perf_counter() - started)
+
+
+async def writer(engine, tenants: int, services: int, deadline: float, counters, rng):
+    """A chat log insert plus a tool-style price update per transaction."""
+    while time.monotonic() < deadline:
+        customer_id = rng.randint(1, tenants)
+        started = time.perf_counter()
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(
+                    insert(Log).values(
+                        customer_id=customer_id,
+                        timestamp=dt.datetime.now(),
+                        action="chat",
+                        details="Message: bench, Response: bench",
+                    )
+                )
+                await conn.execute(
+                    update(BusinessService)
+                    .where(
+                        BusinessService.customer_id == customer_id,
+                        BusinessService.name == f"Service {rng.randrange(services)}",
+                    )
+                    .values(price=round(rng.uniform(5, 200), 2))
+                )
+        except OperationalError:
+            counters.errors += 1
+            continue
+        counters.write_seconds.append(time.perf_counter() - started)
+
+
+def percentiles(seconds: list) -> str:
+    if not seconds:
+        return f"{'-':>10}{'-':>10}"
+    ms = np.array(seconds) * 1000
+    return f"{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 99):>10.2f}"
+
+
+async def run_config(label: str, path: str, profile, args):
+    url = f"sqlite+aiosqlite:///{path}"
+    if profile is None:
+        # The old setup: one default engine for reads and writes
+        write_engine = read_engine = create_async_engine(url)
+    else:
+        write_engine, read_engine = main.create_engines(
+            url, profile, read_pool=args.read_pool
+        )
+    counters = Counters()
+    rng = random.Random(args.seed)
+    deadline = time.monotonic() + args.seconds
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[
+            reader(read_engine, args.tenants, deadline, counters, random.Random(rng.random()))
+            for _ in range(args.readers)
+        ],
+        *[
+            writer(
+                write_engine,
+                args.tenants,
+                args.services,
+                deadline,
+                counters,
+                random.Random(rng.random()),
+            )
+            for _ in range(args.writers)
+        ],
+    )
+    seconds = time.perf_counter() - started
+    await write_engine.dispose()
+    await read_engine.dispose()
+    print(
+        f"{label:<10}{len(counters.read_seconds) / seconds:>10.0f}"
+        f"{len(counters.write_seconds) / seconds:>10.0f}{counters.errors:>8}"
+        f"{percentiles(counters.read_seconds)}{percentiles(counters.write_seconds)}"
+    )
+
+
+async def run_benchmark(args):
+    directory = tempfile.mkdtemp()
+    seeded = os.path.join(directory, "seeded.db")
+    if args.db:
+        shutil.copyfile(args.db, seeded)
+    else:
+        started = time.perf_counter()
+        seed(seeded, args.tenants, args.services, args.logs, random.Random(args.seed))
+        print(f"Seeded in {time.perf_counter() - started:.1f}s into {seeded}")
+    print(
+        f"{args.readers} readers, {args.writers} writers, {args.seconds:.0f}s each"
+    )
+    print(
+        f"{'profile':<10}{'reads/s':>10}{'writes/s':>10}{'errors':>8}"
+        f"{'read p50':>10}{'read p99':>10}{'write p50':>10}{'write p99':>10}"
+    )
+    # Each run gets a fresh copy since WAL mode sticks to the file
+    for label, profile in (("default", None), ("tuned", main.storage_profile)):
+        path = os.path.join(directory, f"{label}.db")
+        shutil.copyfile(seeded, path)
+        await run_config(label, path, profile, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Mixed read/write throughput with the default engine versus "
+        "the tuned storage profile and reader/writer engines"
+    )
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--services", type=int, default=200)
+    parser.add_argument("--logs", type=int, default=200_000)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--read-pool", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument(
+        "--db", help="existing database from seed.py to copy instead of seeding"
+    )
+    asyncio.run(run_benchmark(parser.parse_args()))
@@ -0,0 +1,200 @@
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from sqlalchemy import create_engine, func, select
+
+import main
+from main import Base, BusinessService, InventoryItem, Service
+
+
+def seed(path: str, customer_id: int, rows: int, rng: random.Random):
+    """One tenant with rows services, inventory items and business services."""
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO services (customer_id, name, description, price, duration)"
+        " VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                customer_id,
+                f"Service {i}",
+                f"Description {i}",
+                round(rng.uniform(5, 200), 2),
+                rng.choice([15, 30, 60]),
+            )
+            for i in range(rows)
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO inventory (customer_id, name, quantity, price, category)"
+        " VALUES (?, ?, ?, ?, ?)",
+        [
+            (
+                customer_id,
+                f"Item {i}",
+                rng.randint(0, 500),
+                round(rng.uniform(1, 100), 2),
+                rng.choice(["food", "tools", None]),
+            )
+            for i in range(rows)
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO business_services (customer_id, name, description, category, price, duration, is_available)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                customer_id,
+                f"Business service {i}",
+                f"Description of business service {i}",
+                rng.choice(["food", "service", "product"]),
+                round(rng.uniform(5, 200), 2),
+                f"{rng.choice([15, 30, 60])} min",
+                rng.random() < 0.9,
+            )
+            for i in range(rows)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+
+async def orm_fetch_limited(stmt, limit: int):
+    """The previous read path: whole ORM entities, statements built per call."""
+    async with main.read_session() as session:
+        result = await session.execute(stmt.limit(limit))
+        rows = result.scalars().all()
+        if len(rows) < limit:
+            return rows
+        count_stmt = select(func.count()).select_from(
+            stmt.order_by(None).limit(None).subquery()
+        )
+        await session.execute(count_stmt)
+        return rows
+
+
+async def lean_fetch_limited(stmt, limit: int, params: dict):
+    async with main.read_session() as session:
+        rows, _ = await main.fetch_limited(session, stmt, limit, params)
+        return rows
+
+
+async def orm_cache_load(customer_id: int):
+    async with main.read_session() as session:
+        result = await session.execute(
+            select(BusinessService)
+            .where(BusinessService.customer_id == customer_id)
+            .order_by(BusinessService.id)
+        )
+        return tuple(result.scalars().all())
+
+
+async def lean_cache_load(customer_id: int):
+    main.kb_cache.invalidate(customer_id, "services")
+    return await main.kb_cache.get(customer_id, "services")
+
+
+def cases(customer_id: int, rows: int, limit: int):
+    params = {"customer_id": customer_id}
+    for label, limit in (("tool limit", limit), ("all rows", rows)):
+        yield (
+            f"services, {label}",
+            lambda: orm_fetch_limited(
+                select(Service).where(Service.customer_id == customer_id), limit
+            ),
+            lambda: lean_fetch_limited(main.SERVICE_LINES, limit, params),
+        )
+        yield (
+            f"inventory, {label}",
+            lambda: orm_fetch_limited(
+                select(InventoryItem).where(InventoryItem.customer_id == customer_id),
+                limit,
+            ),
+            lambda: lean_fetch_limited(main.INVENTORY_LINES, limit, params),
+        )
+    yield (
+        "business services load",
+        lambda: orm_cache_load(customer_id),
+        lambda: lean_cache_load(customer_id),
+    )
+
+
+async def timed(run, repeats: int) -> float:
+    seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await run()
+        seconds.append(time.perf_counter() - started)
+    return float(np.median(seconds)) * 1000
+
+
+async def allocations(run):
+    """Peak traced bytes while running and bytes still held by the result."""
+    tracemalloc.start()
+    result = await run()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak / 2**20, held / 2**20
+
+
+async def run_benchmark(args):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench_tool_reads.db")
+    started = time.perf_counter()
+    seed(path, 1, args.rows, random.Random(args.seed))
+    print(f"Seeded {args.rows} rows per table in {time.perf_counter() - started:.1f}s")
+    main.bind_database(f"sqlite+aiosqlite:///{path}")
+    main.kb_cache = main.KBCache(1 << 30)
+    # fetch_limited caps limits at tool_row_limit; the "all rows" cases read
+    # the whole table
+    main.tool_row_limit = max(args.limit, args.rows)
+
+    print(
+        f"{'query':<28}{'orm ms':>10}{'lean ms':>10}{'speedup':>9}"
+        f"{'orm peak MiB':>14}{'lean peak MiB':>15}{'orm held':>10}{'lean held':>11}"
+    )
+    for label, orm, lean in cases(1, args.rows, args.limit):
+        # Warm the pool, page cache and compiled statement caches first
+        await orm()
+        await lean()
+        orm_ms = await timed(orm, args.repeats)
+        lean_ms = await timed(lean, args.repeats)
+        orm_peak, orm_held = await allocations(orm)
+        lean_peak, lean_held = await allocations(lean)
+        print(
+            f"{label:<28}{orm_ms:>10.2f}{lean_ms:>10.2f}{orm_ms / lean_ms:>8.1f}x"
+            f"{orm_peak:>14.1f}{lean_peak:>15.1f}{orm_held:>10.1f}{lean_held:>11.1f}"
+        )
+
+    # The same tool call over a cache entry of ORM instances and of records
+    tool = lambda: main.list_business_services.ainvoke({"customer_id": 1})
+    main.kb_cache._entries[(1, "services")] = (await orm_cache_load(1), 0)
+    orm_ms = await timed(tool, args.repeats)
+    records = await lean_cache_load(1)
+    lean_ms = await timed(tool, args.repeats)
+    print(
+        f"{'list_business_services':<28}{orm_ms:>10.2f}{lean_ms:>10.2f}"
+        f"{orm_ms / lean_ms:>8.1f}x  over {len(records)} cached rows"
+    )
+    await main.read_engine.dispose()
+    await main.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Read tool queries for one large tenant: ORM entities versus "
+        "column-only rows and records from cached statements"
+    )
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--limit", type=int, default=main.tool_row_limit)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=21)
+    asyncio.run(run_benchmark(parser.parse_args()))
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import datetime as dt
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import main
+from main import Base, Invoice
+
+
+def make_invoice(rng: random.Random, tenants: int) -> Invoice:
+    # Paid invoices also exercise the revenue rollup upsert on every flush
+    return Invoice(
+        customer_id=rng.randint(1, tenants),
+        total_amount=round(rng.uniform(10, 500), 2),
+        status="paid",
+        created_date=dt.date.today(),
+        due_date=dt.date.today() + dt.timedelta(days=30),
+        items="[]",
+    )
+
+
+def session_writer(session_factory):
+    """The old write path: every caller opens its own session and commits."""
+
+    async def write(invoice: Invoice):
+        async with session_factory() as session:
+            session.add(invoice)
+            await session.commit()
+
+    return write
+
+
+async def queue_write(invoice: Invoice):
+    await main.write_queue.add(invoice)
+
+
+async def writer(write, count: int, tenants: int, latencies: list, errors: list, rng):
+    for _ in range(count):
+        invoice = make_invoice(rng, tenants)
+        started = time.perf_counter()
+        try:
+            await write(invoice)
+        except OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_config(label: str, write, args):
+    latencies = []
+    errors = []
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[
+            writer(
+                write,
+                args.writes,
+                args.tenants,
+                latencies,
+                errors,
+                random.Random(rng.random()),
+            )
+            for _ in range(args.writers)
+        ]
+    )
+    seconds = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    print(
+        f"{label:<22}{len(latencies) / seconds:>10.0f}{len(errors):>8}"
+        f"{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 95):>10.1f}"
+        f"{np.percentile(ms, 99):>10.1f}{ms.max():>10.1f}"
+    )
+
+
+def scratch_database(directory: str, label: str) -> str:
+    path = os.path.join(directory, f"{label}.db")
+    Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+    return f"sqlite+aiosqlite:///{path}"
+
+
+async def run_benchmark(args):
+    directory = tempfile.mkdtemp()
+    # Keep the KB hooks away from any real knowledge index in the working dir
+    main.knowledge_store = main.KnowledgeStore(os.path.join(directory, "knowledge"))
+    print(f"{args.writers} concurrent writers x {args.writes} invoice inserts")
+    print(
+        f"{'write path':<22}{'writes/s':>10}{'errors':>8}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    )
+
+    # Default journal and pool, one session per write
+    engine = create_async_engine(scratch_database(directory, "default"))
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await run_config("default, sessions", session_writer(session_factory), args)
+    await engine.dispose()
+
+    # Tuned profile and single writer connection, one session per write
+    main.bind_database(scratch_database(directory, "tuned"))
+    await run_config("tuned, sessions", session_writer(main.async_session), args)
+    await main.engine.dispose()
+
+    # Tuned profile with every write going through the group-commit queue
+    main.bind_database(scratch_database(directory, "queue"))
+    await run_config("tuned, write queue", queue_write, args)
+    await main.write_queue.stop()
+    stats = main.write_queue.stats()
+    print(
+        f"write queue: {stats['batches']} commits, avg batch {stats['avg_batch_size']},"
+        f" max batch {stats['max_batch_seen']}, avg commit {stats['avg_batch_ms']} ms"
+    )
+    await main.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Write latency under many concurrent writers: per-call "
+        "sessions versus the group-commit write queue"
+    )
+    parser.add_argument("--writers", type=int, default=500)
+    parser.add_argument("--writes", type=int, default=10)
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=17)
+    asyncio.run(run_benchmark(parser.parse_args()))
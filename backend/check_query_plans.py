@@ -0,0 +1,99 @@
+"""Assert that the hot tool queries use the composite indexes.
+
+Runs the read tools against a scratch database migrated with
+run_migrations, captures the SQL they issue and checks EXPLAIN QUERY PLAN
+for each one. Exits non-zero if any query does not use its index.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+from sqlalchemy import event
+
+import main
+from main import Base, run_migrations
+
+
+# table -> index its tool queries are expected to use
+EXPECTED_INDEXES = {
+    "appointments": "ix_appointments_customer_date_time",
+    "revenue_daily": "sqlite_autoindex_revenue_daily_1",
+    "business_services": "ix_business_services_customer_available",
+    "business_facts": "ix_business_facts_customer_category_title",
+}
+# Whole-customer loads by kb_cache only need some index on customer_id
+ALSO_ACCEPTED = {
+    "business_services": ("ix_business_services_customer_id",),
+    "business_facts": ("ix_business_facts_customer_id",),
+}
+
+
+async def run_tools():
+    await main.get_customer_appointments.coroutine(1)
+    await main.get_customer_schedule.coroutine(1)
+    await main.get_customer_revenue.coroutine(1, "2024-01-15")
+    await main.get_customer_revenue_trend.coroutine(1, "2024-01-01", "2024-06-30")
+    await main.list_business_services.coroutine(1)
+    await main.update_service_price.coroutine(1, "Haircut", 30.0)
+    await main.update_business_description_chat.coroutine(1, "Family bakery")
+
+
+async def check() -> bool:
+    path = os.path.join(tempfile.mkdtemp(), "query_plans.db")
+    main.bind_database(f"sqlite+aiosqlite:///{path}")
+    engine = main.engine
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        # Drop the model-declared indexes so the migrations are what creates them
+        for index in EXPECTED_INDEXES.values():
+            if not index.startswith("sqlite_autoindex"):
+                await conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+        await run_migrations(conn)
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    # Read tools go through the reader engine, write tools through the writer
+    for target in (engine, main.read_engine):
+        event.listen(target.sync_engine, "before_cursor_execute", capture)
+    await run_tools()
+    for target in (engine, main.read_engine):
+        event.remove(target.sync_engine, "before_cursor_execute", capture)
+
+    ok = True
+    checked = set()
+    async with engine.connect() as conn:
+        for statement, parameters in captured:
+            table = next(
+                (t for t in EXPECTED_INDEXES if f"FROM {t}" in statement), None
+            )
+            # Skip row counts and primary-key reloads after writes
+            if table is None or "count(" in statement or f"{table}.id = " in statement:
+                continue
+            rows = (
+                await conn.exec_driver_sql(
+                    f"EXPLAIN QUERY PLAN {statement}", parameters
+                )
+            ).all()
+            plan = " | ".join(row[-1] for row in rows)
+            accepted = (EXPECTED_INDEXES[table],) + ALSO_ACCEPTED.get(table, ())
+            passed = any(index in plan for index in accepted)
+            ok = ok and passed
+            checked.add(table)
+            print(f"{'PASS' if passed else 'FAIL'} {table}: {plan}")
+
+    missing = set(EXPECTED_INDEXES) - checked
+    for table in sorted(missing):
+        print(f"FAIL {table}: no tool query captured")
+    await engine.dispose()
+    await main.read_engine.dispose()
+    return ok and not missing
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(check()) else 1)
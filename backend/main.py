@@ -1,16 +1,57 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Literal, Optional
 import uvicorn
-from sqlalchemy import select
+from sqlalchemy import (
+    Date,
+    DateTime,
+    Index,
+    Time,
+    bindparam,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    literal,
+    select,
+    text,
+    tuple_,
+    union_all,
+    update,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
+from sqlalchemy.orm import (
+    DeclarativeBase,
+    Mapped,
+    Session,
+    mapped_column,
+    sessionmaker,
+)
+from collections import OrderedDict, namedtuple
 from contextlib import asynccontextmanager
+from contextvars import Context, ContextVar
+from itertools import chain
+from operator import attrgetter
+import asyncio
+import bisect
+import csv
+import datetime as dt
+import heapq
+import io
+import json
 import os
+import re
+import time
+import zlib
+import numpy as np
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.tools import tool
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -35,10 +76,14 @@ class Customer(Base):
 
 class Log(Base):
     __tablename__ = "logs"
+    __table_args__ = (
+        Index("ix_logs_customer_timestamp", "customer_id", "timestamp"),
+        Index("ix_logs_timestamp", "timestamp"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     customer_id: Mapped[Optional[int]] = mapped_column(index=True)
-    timestamp: Mapped[str] = mapped_column()
+    timestamp: Mapped[dt.datetime] = mapped_column(DateTime)
     action: Mapped[str] = mapped_column()
     details: Mapped[Optional[str]] = mapped_column()
 
@@ -67,12 +112,15 @@ class InventoryItem(Base):
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        Index("ix_appointments_customer_date_time", "customer_id", "date", "time"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     customer_id: Mapped[int] = mapped_column(index=True)
     service_id: Mapped[int] = mapped_column(index=True)
-    date: Mapped[str] = mapped_column()  # ISO format
-    time: Mapped[str] = mapped_column()  # HH:MM format
+    date: Mapped[dt.date] = mapped_column(Date)
+    time: Mapped[dt.time] = mapped_column(Time)
     status: Mapped[str] = mapped_column(
         default="scheduled"
     )  # scheduled, completed, cancelled
@@ -81,14 +129,19 @@ class Appointment(Base):
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index(
+            "ix_invoices_customer_status_created", "customer_id", "status", "created_date"
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     customer_id: Mapped[int] = mapped_column(index=True)
     appointment_id: Mapped[Optional[int]] = mapped_column()
     total_amount: Mapped[float] = mapped_column()
     status: Mapped[str] = mapped_column(default="unpaid")  # unpaid, paid, overdue
-    created_date: Mapped[str] = mapped_column()
-    due_date: Mapped[str] = mapped_column()
+    created_date: Mapped[dt.date] = mapped_column(Date)
+    due_date: Mapped[dt.date] = mapped_column(Date)
     items: Mapped[Optional[str]] = mapped_column()  # JSON string of items
 
 
@@ -115,6 +168,14 @@ class Policy(Base):
 
 class BusinessFact(Base):
     __tablename__ = "business_facts"
+    __table_args__ = (
+        Index(
+            "ix_business_facts_customer_category_title",
+            "customer_id",
+            "category",
+            "title",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     customer_id: Mapped[int] = mapped_column(index=True)
@@ -130,6 +191,9 @@ class BusinessFact(Base):
 
 class BusinessService(Base):
     __tablename__ = "business_services"
+    __table_args__ = (
+        Index("ix_business_services_customer_available", "customer_id", "is_available"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     customer_id: Mapped[int] = mapped_column(index=True)
@@ -156,13 +220,1595 @@ class UnansweredQuestion(Base):
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     customer_id: Mapped[int] = mapped_column(index=True)
     question: Mapped[str] = mapped_column()
-    timestamp: Mapped[str] = mapped_column()
+    timestamp: Mapped[dt.datetime] = mapped_column(DateTime)
     status: Mapped[str] = mapped_column(default="pending")  # pending, answered, ignored
     response: Mapped[Optional[str]] = mapped_column()  # Owner's response when answered
 
 
+class RevenueDaily(Base):
+    # Paid invoice totals per customer and day, kept in step with invoice
+    # writes by track_revenue_changes and rebuilt by rebuild_revenue_rollups
+    __tablename__ = "revenue_daily"
+
+    customer_id: Mapped[int] = mapped_column(primary_key=True)
+    day: Mapped[dt.date] = mapped_column(Date, primary_key=True)
+    total_amount: Mapped[float] = mapped_column(default=0.0)
+    invoice_count: Mapped[int] = mapped_column(default=0)
+
+
+class KBVersion(Base):
+    # Per-customer count of knowledge base writes, bumped by triggers so that
+    # writes from any process (a second worker, seed.py, populate scripts)
+    # move it. Persisted caches compare against it when they are loaded.
+    __tablename__ = "kb_versions"
+
+    customer_id: Mapped[int] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0)
+
+
+# Knowledge base tables whose changes affect what the assistant answers
+KB_MODELS = (BusinessFact, BusinessService, BusinessHours, Policy)
+# Per-customer rows held by kb_cache, by entity name
+KB_CACHE_ENTITIES = {
+    Customer: "customer",
+    BusinessHours: "hours",
+    BusinessService: "services",
+    BusinessFact: "facts",
+    Policy: "policies",
+}
+
+
+class KBRevisions:
+    """Per-customer knowledge base revision counters.
+
+    A revision is bumped after every committed change to a KB row, and the
+    subscribed caches drop or ignore entries built on an older revision.
+    """
+
+    def __init__(self):
+        self._revisions = {}
+        self._subscribers = []
+
+    def get(self, customer_id: int) -> int:
+        return self._revisions.get(customer_id, 0)
+
+    def bump(self, customer_id: int) -> int:
+        revision = self._revisions.get(customer_id, 0) + 1
+        self._revisions[customer_id] = revision
+        for callback in self._subscribers:
+            callback(customer_id)
+        return revision
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+
+kb_revisions = KBRevisions()
+
+
+@event.listens_for(Session, "after_flush")
+def track_kb_changes(session, flush_context):
+    changed = session.info.setdefault("kb_changed_customers", set())
+    knowledge_changes = session.info.setdefault("knowledge_changes", [])
+    cache_keys = session.info.setdefault("kb_cache_keys", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        entity = KB_CACHE_ENTITIES.get(type(obj))
+        if entity is not None:
+            # A row moved to another customer leaves both cached lists stale
+            column = "id" if entity == "customer" else "customer_id"
+            cache_keys.add((previous_value(obj, column), entity))
+            cache_keys.add((getattr(obj, column), entity))
+        if isinstance(obj, KB_MODELS) and obj.customer_id is not None:
+            changed.add(obj.customer_id)
+            kind = KNOWLEDGE_KINDS.get(type(obj))
+            if kind is not None:
+                chunks = None if obj in session.deleted else knowledge_chunks(obj)
+                knowledge_changes.append((obj.customer_id, kind, obj.id, chunks))
+
+
+@event.listens_for(Session, "after_commit")
+def bump_kb_revisions(session):
+    for customer_id, entity in session.info.pop("kb_cache_keys", ()):
+        kb_cache.invalidate(customer_id, entity)
+    for customer_id in session.info.pop("kb_changed_customers", ()):
+        kb_revisions.bump(customer_id)
+    knowledge_store.apply(session.info.pop("knowledge_changes", ()))
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_kb_changes(session):
+    session.info.pop("kb_changed_customers", None)
+    session.info.pop("knowledge_changes", None)
+    session.info.pop("kb_cache_keys", None)
+
+
+def previous_value(obj, attr: str):
+    """The value attr had before the pending flush."""
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+def track_statement_changes(session, model, rows, deleted: bool = False):
+    """Record model rows returned by an UPDATE/DELETE ... RETURNING the way
+    track_kb_changes records flushed objects. Such statements never go
+    through a flush, so without this bump_kb_revisions would miss them."""
+    entity = KB_CACHE_ENTITIES.get(model)
+    kind = KNOWLEDGE_KINDS.get(model)
+    changed = session.info.setdefault("kb_changed_customers", set())
+    knowledge_changes = session.info.setdefault("knowledge_changes", [])
+    cache_keys = session.info.setdefault("kb_cache_keys", set())
+    for row in rows:
+        if entity is not None:
+            cache_keys.add((row.id if entity == "customer" else row.customer_id, entity))
+        if model in KB_MODELS and row.customer_id is not None:
+            changed.add(row.customer_id)
+            if kind is not None:
+                chunks = None if deleted else knowledge_chunks(model(**row._mapping))
+                knowledge_changes.append((row.customer_id, kind, row.id, chunks))
+
+
+def revenue_upsert(rows: List[dict]):
+    """Add each row's total_amount and invoice_count to its revenue_daily row."""
+    stmt = sqlite_insert(RevenueDaily).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["customer_id", "day"],
+        set_={
+            "total_amount": RevenueDaily.total_amount + stmt.excluded.total_amount,
+            "invoice_count": RevenueDaily.invoice_count + stmt.excluded.invoice_count,
+        },
+    )
+
+
+def invoice_revenue_delta(columns: tuple):
+    """revenue_daily change for setting columns on invoice :row_id to the
+    :new_<column> parameters, as one INSERT ... SELECT that reads the old row
+    before it is overwritten: its paid amount comes off the old day and the
+    new paid amount goes on."""
+    table = Invoice.__table__
+
+    def new(name: str):
+        if name in columns:
+            return bindparam(f"new_{name}", type_=table.c[name].type)
+        return table.c[name]
+
+    moves = union_all(
+        select(
+            table.c.customer_id,
+            table.c.created_date.label("day"),
+            (-table.c.total_amount).label("total_amount"),
+            literal(-1).label("invoice_count"),
+        ).where(table.c.id == bindparam("row_id"), table.c.status == "paid"),
+        select(
+            new("customer_id"),
+            new("created_date"),
+            new("total_amount"),
+            literal(1),
+        ).where(table.c.id == bindparam("row_id"), new("status") == "paid"),
+    ).subquery()
+    net = (
+        select(
+            moves.c.customer_id,
+            moves.c.day,
+            func.sum(moves.c.total_amount),
+            func.sum(moves.c.invoice_count),
+        )
+        .group_by(moves.c.customer_id, moves.c.day)
+        .having(
+            (func.sum(moves.c.total_amount) != 0)
+            | (func.sum(moves.c.invoice_count) != 0)
+        )
+    )
+    # Against the table, so executing with parameters stays a plain Core
+    # statement rather than an ORM bulk insert
+    rollup = RevenueDaily.__table__
+    stmt = sqlite_insert(rollup).from_select(
+        ["customer_id", "day", "total_amount", "invoice_count"], net
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=["customer_id", "day"],
+        set_={
+            "total_amount": rollup.c.total_amount + stmt.excluded.total_amount,
+            "invoice_count": rollup.c.invoice_count + stmt.excluded.invoice_count,
+        },
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def track_revenue_changes(session, flush_context):
+    """Apply the flushed invoice changes to revenue_daily in the same
+    transaction: the old paid amount comes off its day, the new one goes on."""
+    deltas = {}
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Invoice):
+            continue
+        if obj not in session.new and previous_value(obj, "status") == "paid":
+            key = (previous_value(obj, "customer_id"), previous_value(obj, "created_date"))
+            total, count = deltas.get(key, (0.0, 0))
+            deltas[key] = (total - previous_value(obj, "total_amount"), count - 1)
+        if obj not in session.deleted and obj.status == "paid":
+            key = (obj.customer_id, obj.created_date)
+            total, count = deltas.get(key, (0.0, 0))
+            deltas[key] = (total + obj.total_amount, count + 1)
+    rows = [
+        {"customer_id": customer_id, "day": day, "total_amount": total, "invoice_count": count}
+        for (customer_id, day), (total, count) in deltas.items()
+        if total or count
+    ]
+    if rows:
+        session.connection().execute(revenue_upsert(rows))
+
+
+def normalize_message(message: str) -> str:
+    return re.sub(r"\s+", " ", message.lower()).strip(" \t\n?!.,")
+
+
+class ResponseCache:
+    """LRU + TTL cache of chat replies keyed by (customer, message, KB revision)."""
+
+    # Rough per-entry bookkeeping overhead added to the text sizes
+    ENTRY_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._by_customer = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _key(self, customer_id: int, message: str):
+        return (customer_id, normalize_message(message), kb_revisions.get(customer_id))
+
+    def get(self, customer_id: int, message: str) -> Optional[str]:
+        key = self._key(customer_id, message)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        response_text, expires_at, _ = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response_text
+
+    def put(self, customer_id: int, message: str, response_text: str):
+        key = self._key(customer_id, message)
+        if key in self._entries:
+            self._remove(key)
+        size = (
+            len(key[1].encode()) + len(response_text.encode()) + self.ENTRY_OVERHEAD_BYTES
+        )
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (response_text, time.monotonic() + self.ttl_seconds, size)
+        self._by_customer.setdefault(customer_id, set()).add(key)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, customer_id: int):
+        keys = self._by_customer.pop(customer_id, set())
+        for key in keys:
+            _, _, size = self._entries.pop(key)
+            self.bytes -= size
+        self.invalidations += len(keys)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+        customer_keys = self._by_customer.get(key[0])
+        if customer_keys is not None:
+            customer_keys.discard(key)
+            if not customer_keys:
+                del self._by_customer[key[0]]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "3600")),
+)
+kb_revisions.subscribe(response_cache.invalidate)
+
+
+class KBCache:
+    """Read-through LRU of one customer's rows per entity (KB_CACHE_ENTITIES).
+
+    Entries hold every row of the entity for the customer in id order, as
+    namedtuple records rather than ORM instances, and are shared by the read
+    tools and the GET endpoints, which filter and page them in memory.
+    Committed writes invalidate just the (customer, entity) pairs they
+    touched. Loads are coalesced per key, and a load that raced with an
+    invalidation is returned but not stored.
+    """
+
+    # Rough per-row overhead of a record tuple and its value objects
+    ROW_OVERHEAD_BYTES = 400
+    ENTRY_OVERHEAD_BYTES = 200
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._generations = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.entity_stats = {
+            entity: {"hits": 0, "misses": 0} for entity in KB_CACHE_ENTITIES.values()
+        }
+        # One column-only statement per entity with the customer as a bound
+        # parameter, so each is built and compiled once, and the record type
+        # its rows are kept as
+        self._statements = {}
+        self._records = {}
+        for model, entity in KB_CACHE_ENTITIES.items():
+            table = model.__table__
+            self._records[entity] = namedtuple(
+                f"{model.__name__}Record", [column.name for column in table.c]
+            )
+            column = table.c.id if entity == "customer" else table.c.customer_id
+            self._statements[entity] = (
+                select(*table.c)
+                .where(column == bindparam("customer_id"))
+                .order_by(table.c.id)
+            )
+
+    async def get(self, customer_id: int, entity: str) -> tuple:
+        key = (customer_id, entity)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.entity_stats[entity]["hits"] += 1
+            return entry[0]
+        self.entity_stats[entity]["misses"] += 1
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key))
+            self._loading[key] = task
+        # Shielded so one cancelled caller does not fail the others waiting
+        return await asyncio.shield(task)
+
+    async def get_one(self, customer_id: int, entity: str):
+        rows = await self.get(customer_id, entity)
+        return rows[0] if rows else None
+
+    async def _load(self, key) -> tuple:
+        customer_id, entity = key
+        generation = self._generations.get(key, 0)
+        try:
+            async with read_session() as session:
+                result = await session.execute(
+                    self._statements[entity], {"customer_id": customer_id}
+                )
+                rows = tuple(map(self._records[entity]._make, result))
+        finally:
+            if self._loading.get(key) is asyncio.current_task():
+                del self._loading[key]
+        if self._generations.get(key, 0) == generation:
+            self._put(key, rows)
+        return rows
+
+    def _row_bytes(self, row) -> int:
+        return self.ROW_OVERHEAD_BYTES + sum(len(str(value)) for value in row)
+
+    def _put(self, key, rows: tuple):
+        if key in self._entries:
+            self._remove(key)
+        size = self.ENTRY_OVERHEAD_BYTES + sum(self._row_bytes(row) for row in rows)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (rows, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def invalidate(self, customer_id: int, entity: str):
+        key = (customer_id, entity)
+        self._generations[key] = self._generations.get(key, 0) + 1
+        # Later readers must not join a load that may predate the write
+        self._loading.pop(key, None)
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    async def warm(self, tenants: int, days: int = 7) -> int:
+        """Load every entity for the customers with the most chat logs over
+        the last days. Returns the number of customers loaded."""
+        since = dt.datetime.now() - dt.timedelta(days=days)
+        async with read_session() as session:
+            result = await session.execute(
+                select(Log.customer_id)
+                .where(Log.timestamp >= since, Log.customer_id.is_not(None))
+                .group_by(Log.customer_id)
+                .order_by(func.count().desc())
+                .limit(tenants)
+            )
+            customer_ids = result.scalars().all()
+        for customer_id in customer_ids:
+            for entity in self._statements:
+                await self._load((customer_id, entity))
+        return len(customer_ids)
+
+    def stats(self) -> dict:
+        entities = {}
+        for entity, counts in self.entity_stats.items():
+            lookups = counts["hits"] + counts["misses"]
+            entities[entity] = {
+                **counts,
+                "hit_rate": round(counts["hits"] / lookups, 4) if lookups else 0.0,
+            }
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entities": entities,
+        }
+
+
+kb_cache = KBCache(
+    max_bytes=int(os.environ.get("KB_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+# Most active customers to load into kb_cache at startup (0 disables warm-up)
+kb_cache_warm_tenants = int(os.environ.get("KB_CACHE_WARM_TENANTS", "0"))
+
+
+# Words that carry no meaning for matching questions against each other
+STOPWORDS = frozenset(
+    "a an the is are was were be do does did you your we our i me my it its of on"
+    " in at to for and or there what when how any have has can will with this that"
+    " please".split()
+)
+EMBEDDING_DIM = 256
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[: -len(suffix)]
+    return word
+
+
+NEGATIONS = frozenset("not no never without none nothing cannot".split())
+# Words that flip or pin down what a question asks; two questions that
+# differ in these are different questions however similar the rest is
+MEANING_WORDS = NEGATIONS | frozenset(
+    "monday tuesday wednesday thursday friday saturday sunday today tomorrow"
+    " tonight weekend weekday before after until since".split()
+)
+
+# "don't", "isn’t", and the same without the apostrophe
+NEGATED_CONTRACTION = re.compile(
+    r"\b(do|does|did|is|are|was|were|ca|wo|would|should|could|have|has)n['’]?t\b"
+)
+
+
+def meaning_tokens(text: str) -> frozenset:
+    """Negation, day, time-order words and numbers in text, with every form
+    of negation (including n't contractions) as "not"."""
+    text = NEGATED_CONTRACTION.sub(r"\1 not", normalize_message(text))
+    tokens = set()
+    for word in re.findall(r"\w+", text):
+        word = _stem(word)
+        if word in NEGATIONS:
+            tokens.add("not")
+        elif word in MEANING_WORDS or any(c.isdigit() for c in word):
+            tokens.add(word)
+    return frozenset(tokens)
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Locally computed embedding: signed hashing of words and their character
+    trigrams, L2-normalized so a dot product is the cosine similarity."""
+    words = re.findall(r"\w+", normalize_message(text))
+    content_words = [_stem(w) for w in words if w not in STOPWORDS] or words
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in content_words:
+        padded = f" {word} "
+        tokens = [(padded[i : i + 3], 1.0) for i in range(len(padded) - 2)]
+        tokens.append(("w:" + word, 2.0))
+        for token, weight in tokens:
+            h = zlib.crc32(token.encode())
+            vector[h % dim] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticIndex:
+    """One customer's cached questions as a growable (n, dim) matrix.
+
+    When full, the oldest entry is overwritten.
+    """
+
+    def __init__(self, max_size: int, revision: int, dim: int = EMBEDDING_DIM):
+        self.max_size = max_size
+        self.revision = revision
+        self.vectors = np.zeros((min(64, max_size), dim), dtype=np.float32)
+        self.questions = []
+        self.answers = []
+        self.next_slot = 0
+
+    def __len__(self):
+        return len(self.answers)
+
+    def add(self, vector: np.ndarray, question: str, answer: str):
+        if len(self) < self.max_size:
+            if len(self) == len(self.vectors):
+                grown = np.zeros(
+                    (min(len(self.vectors) * 2, self.max_size), self.vectors.shape[1]),
+                    dtype=np.float32,
+                )
+                grown[: len(self)] = self.vectors[: len(self)]
+                self.vectors = grown
+            slot = len(self)
+            self.questions.append(question)
+            self.answers.append(answer)
+        else:
+            slot = self.next_slot
+            self.next_slot = (slot + 1) % self.max_size
+            self.questions[slot] = question
+            self.answers[slot] = answer
+        self.vectors[slot] = vector
+
+    def top1(self, vector: np.ndarray):
+        if not self.answers:
+            return None, 0.0
+        scores = self.vectors[: len(self)] @ vector
+        best = int(np.argmax(scores))
+        return best, float(scores[best])
+
+
+class SemanticCache:
+    """Near-duplicate question cache: cosine top-1 over per-customer indexes.
+
+    An index is dropped whenever its customer's KB revision changes, and all
+    indexes can be saved to and loaded from disk across restarts. The
+    revision is the only invalidation, so callers only put replies that
+    depend on nothing but the knowledge base (see generate_chat_response).
+    In-memory revisions start over on restart, so each saved index carries
+    its customer's kb_versions value and is not loaded once that has moved.
+    """
+
+    def __init__(self, threshold: float, max_per_customer: int, path: str):
+        self.threshold = threshold
+        self.max_per_customer = max_per_customer
+        self.path = path
+        self._indexes = {}
+        self.hits = 0
+        self.misses = 0
+        self.lookup_seconds = 0.0
+
+    def get(self, customer_id: int, message: str) -> Optional[str]:
+        started = time.perf_counter()
+        answer = None
+        index = self._indexes.get(customer_id)
+        if index is not None and index.revision != kb_revisions.get(customer_id):
+            del self._indexes[customer_id]
+            index = None
+        if index is not None:
+            slot, score = index.top1(embed_text(message))
+            if (
+                slot is not None
+                and score >= self.threshold
+                and meaning_tokens(index.questions[slot]) == meaning_tokens(message)
+            ):
+                answer = index.answers[slot]
+        self.lookup_seconds += time.perf_counter() - started
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def put(self, customer_id: int, message: str, answer: str):
+        revision = kb_revisions.get(customer_id)
+        index = self._indexes.get(customer_id)
+        if index is None or index.revision != revision:
+            index = SemanticIndex(self.max_per_customer, revision)
+            self._indexes[customer_id] = index
+        index.add(embed_text(message), message, answer)
+
+    def invalidate(self, customer_id: int):
+        self._indexes.pop(customer_id, None)
+
+    async def save(self, session):
+        rows = []
+        vectors = []
+        versions = await load_kb_versions(session, self._indexes)
+        for customer_id, index in self._indexes.items():
+            for question, answer in zip(index.questions, index.answers):
+                rows.append([customer_id, question, answer])
+            vectors.append(index.vectors[: len(index)])
+        matrix = (
+            np.concatenate(vectors)
+            if vectors
+            else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        )
+        meta = json.dumps({"versions": list(versions.items()), "rows": rows})
+        # Vectors and rows share one file, replaced in a single step, so a
+        # crash can't leave one without the other
+        with open(self.path + ".npz.tmp", "wb") as f:
+            np.savez(f, vectors=matrix, meta=np.array(meta))
+        os.replace(self.path + ".npz.tmp", self.path + ".npz")
+
+    async def load(self, session):
+        """Restore the saved indexes whose customer's knowledge base has not
+        been written since they were saved."""
+        if not os.path.exists(self.path + ".npz"):
+            return
+        with np.load(self.path + ".npz") as saved:
+            matrix = saved["vectors"]
+            meta = json.loads(str(saved["meta"]))
+        self._indexes = {}
+        if len(meta["rows"]) != len(matrix):
+            print(f"[semantic_cache] ignoring {self.path}.npz: rows and vectors differ")
+            return
+        saved_versions = dict(meta["versions"])
+        current = await load_kb_versions(session, saved_versions)
+        for (customer_id, question, answer), vector in zip(meta["rows"], matrix):
+            if saved_versions[customer_id] != current[customer_id]:
+                continue
+            index = self._indexes.get(customer_id)
+            if index is None:
+                index = SemanticIndex(self.max_per_customer, kb_revisions.get(customer_id))
+                self._indexes[customer_id] = index
+            index.add(vector, question, answer)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "customers": len(self._indexes),
+            "entries": sum(len(index) for index in self._indexes.values()),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_lookup_seconds": round(self.lookup_seconds / lookups, 6) if lookups else 0.0,
+        }
+
+
+semantic_cache_enabled = os.environ.get("SEMANTIC_CACHE_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+semantic_cache = SemanticCache(
+    threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.8")),
+    max_per_customer=int(os.environ.get("SEMANTIC_CACHE_MAX_PER_CUSTOMER", "5000")),
+    path=os.environ.get("SEMANTIC_CACHE_PATH", "./semantic_cache"),
+)
+kb_revisions.subscribe(semantic_cache.invalidate)
+
+
+# Rows that feed retrieve_relevant_knowledge, by model
+KNOWLEDGE_KINDS = {BusinessFact: "fact", BusinessService: "service", Policy: "policy"}
+# Longer texts are split so each chunk stays focused
+KNOWLEDGE_CHUNK_CHARS = 600
+
+
+def chunk_text(title: str, body: str, max_chars: int = KNOWLEDGE_CHUNK_CHARS):
+    body = body or ""
+    pieces = [body[i : i + max_chars] for i in range(0, len(body), max_chars)] or [""]
+    return [f"{title}: {piece}".rstrip(": ") for piece in pieces]
+
+
+def knowledge_chunks(obj) -> Optional[List[str]]:
+    """Chunks to index for a fact, service or policy row; None when the row
+    should not be retrievable (private facts, unavailable services)."""
+    if isinstance(obj, BusinessFact):
+        if not obj.is_public:
+            return None
+        return chunk_text(obj.title, obj.content)
+    if isinstance(obj, BusinessService):
+        if not obj.is_available:
+            return None
+        details = [obj.category]
+        if obj.price is not None:
+            details.append(f"${obj.price}")
+        if obj.duration:
+            details.append(obj.duration)
+        return chunk_text(
+            f"{obj.name} ({', '.join(details)})", obj.description or ""
+        )
+    if isinstance(obj, Policy):
+        return chunk_text(f"{obj.title} ({obj.category} policy)", obj.content)
+    return None
+
+
+class KnowledgeIndex:
+    """One customer's knowledge chunks and their embeddings.
+
+    Vectors live in a memory-mapped float32 file (<path>.f32) and chunk
+    metadata in <path>.json. Slots of removed rows are reused. The metadata
+    carries a checksum of the used vectors, so a pair of files left out of
+    step by a crash between the two writes is not opened.
+    """
+
+    def __init__(self, path: Optional[str], dim: int = EMBEDDING_DIM):
+        self.path = path
+        self.dim = dim
+        self.keys = []
+        self.texts = []
+        self.free = []
+        self.slots = {}
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.keys) - len(self.free)
+
+    @classmethod
+    def open(cls, path: str, dim: int = EMBEDDING_DIM) -> Optional["KnowledgeIndex"]:
+        if not (os.path.exists(path + ".json") and os.path.exists(path + ".f32")):
+            return None
+        with open(path + ".json") as f:
+            meta = json.load(f)
+        index = cls(path, dim)
+        index.keys = [tuple(key) if key else None for key in meta["keys"]]
+        index.texts = meta["texts"]
+        if os.path.getsize(path + ".f32") != meta["capacity"] * dim * 4:
+            return None
+        index.vectors = np.memmap(
+            path + ".f32", dtype=np.float32, mode="r+", shape=(meta["capacity"], dim)
+        )
+        if meta.get("checksum") != index._checksum():
+            return None
+        for slot, key in enumerate(index.keys):
+            if key is None:
+                index.free.append(slot)
+            else:
+                index.slots.setdefault(key[:2], []).append(slot)
+        return index
+
+    def _checksum(self) -> int:
+        return zlib.crc32(np.ascontiguousarray(self.vectors[: len(self.keys)]))
+
+    def _grow(self, capacity: int):
+        if self.path is None:
+            grown = np.zeros((capacity, self.dim), dtype=np.float32)
+        else:
+            if isinstance(self.vectors, np.memmap):
+                self.vectors.flush()
+            grown = np.memmap(
+                self.path + ".f32.tmp",
+                dtype=np.float32,
+                mode="w+",
+                shape=(capacity, self.dim),
+            )
+        grown[: len(self.vectors)] = self.vectors
+        if self.path is not None:
+            grown.flush()
+            del self.vectors
+            os.replace(self.path + ".f32.tmp", self.path + ".f32")
+            grown = np.memmap(
+                self.path + ".f32",
+                dtype=np.float32,
+                mode="r+",
+                shape=(capacity, self.dim),
+            )
+        self.vectors = grown
+
+    def _take_slot(self) -> int:
+        if self.free:
+            return self.free.pop()
+        slot = len(self.keys)
+        if slot >= len(self.vectors):
+            self._grow(max(64, len(self.vectors) * 2))
+        self.keys.append(None)
+        self.texts.append("")
+        return slot
+
+    def remove(self, kind: str, row_id: int):
+        for slot in self.slots.pop((kind, row_id), []):
+            self.keys[slot] = None
+            self.texts[slot] = ""
+            self.vectors[slot] = 0
+            self.free.append(slot)
+        self.dirty = True
+
+    def upsert(self, kind: str, row_id: int, chunks: List[str], vectors=None):
+        self.remove(kind, row_id)
+        for part, chunk in enumerate(chunks):
+            slot = self._take_slot()
+            self.keys[slot] = (kind, row_id, part)
+            self.texts[slot] = chunk
+            self.vectors[slot] = (
+                embed_text(chunk, self.dim) if vectors is None else vectors[part]
+            )
+            self.slots.setdefault((kind, row_id), []).append(slot)
+
+    def search(self, query: str, k: int):
+        used = len(self.keys)
+        if used == len(self.free):
+            return []
+        scores = np.asarray(self.vectors[:used] @ embed_text(query, self.dim))
+        if self.free:
+            scores[self.free] = -np.inf
+        k = max(1, min(k, len(self)))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[slot]), self.keys[slot], self.texts[slot]) for slot in top]
+
+    def save(self):
+        if self.path is None or not self.dirty:
+            return
+        if isinstance(self.vectors, np.memmap):
+            self.vectors.flush()
+        else:
+            self._grow(max(len(self.vectors), 64))
+        with open(self.path + ".json.tmp", "w") as f:
+            json.dump(
+                {
+                    "capacity": len(self.vectors),
+                    "checksum": self._checksum(),
+                    "keys": self.keys,
+                    "texts": self.texts,
+                },
+                f,
+            )
+        os.replace(self.path + ".json.tmp", self.path + ".json")
+        self.dirty = False
+
+
+class KnowledgeStore:
+    """Per-customer KnowledgeIndex objects, opened from disk or built from
+    the database on first use and kept current from committed writes.
+
+    Builds are serialized per customer, and changes committed while a build
+    is reading are replayed onto it before it is published.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._indexes = {}
+        self._locks = {}
+        # Changes seen while a customer's build runs; None once it is stale
+        self._pending = {}
+        self.builds = 0
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def _path(self, customer_id: int) -> str:
+        return os.path.join(self.directory, f"customer_{customer_id}")
+
+    def _open(self, customer_id: int) -> Optional[KnowledgeIndex]:
+        index = self._indexes.get(customer_id)
+        if index is None:
+            index = KnowledgeIndex.open(self._path(customer_id))
+            if index is not None:
+                self._indexes[customer_id] = index
+        return index
+
+    async def get(self, customer_id: int) -> KnowledgeIndex:
+        index = self._open(customer_id)
+        if index is not None:
+            return index
+        lock = self._locks.setdefault(customer_id, asyncio.Lock())
+        async with lock:
+            # Another request may have built it while this one waited
+            index = self._open(customer_id)
+            if index is None:
+                index = await self.build(customer_id)
+        return index
+
+    async def build(self, customer_id: int) -> KnowledgeIndex:
+        """Build from the database. Callers hold the customer's lock."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(customer_id)
+        pending = None
+        while pending is None:
+            for suffix in (".json", ".f32"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            index = KnowledgeIndex(path)
+            self._pending[customer_id] = []
+            try:
+                async with db_reader() as session:
+                    for model, kind in KNOWLEDGE_KINDS.items():
+                        result = await session.execute(
+                            select(model).where(model.customer_id == customer_id)
+                        )
+                        for row in result.scalars():
+                            chunks = knowledge_chunks(row)
+                            if chunks:
+                                index.upsert(kind, row.id, chunks)
+            finally:
+                pending = self._pending.pop(customer_id)
+        for _, kind, row_id, chunks in pending:
+            if chunks:
+                index.upsert(kind, row_id, chunks)
+            else:
+                index.remove(kind, row_id)
+        index.dirty = True
+        index.save()
+        self._indexes[customer_id] = index
+        self.builds += 1
+        return index
+
+    def apply(self, changes):
+        """Apply (customer_id, kind, row_id, chunks-or-None) changes to indexes
+        that already exist or are being built; missing ones will be built
+        fresh on first use. Touched indexes are saved straight away so the
+        metadata on disk matches the vectors written in place."""
+        touched = {}
+        for change in changes:
+            customer_id, kind, row_id, chunks = change
+            pending = self._pending.get(customer_id)
+            if pending is not None:
+                pending.append(change)
+                continue
+            index = self._open(customer_id)
+            if index is None:
+                continue
+            if chunks:
+                index.upsert(kind, row_id, chunks)
+            else:
+                index.remove(kind, row_id)
+            touched[customer_id] = index
+        for index in touched.values():
+            index.save()
+
+    async def search(self, customer_id: int, query: str, k: int):
+        index = await self.get(customer_id)
+        started = time.perf_counter()
+        results = index.search(query, k)
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - started
+        return results
+
+    def discard(self, customer_id: int):
+        """Drop a customer's index so it is rebuilt on next use, for writes
+        that bypass the session events."""
+        self._indexes.pop(customer_id, None)
+        if customer_id in self._pending:
+            # A build that is reading now may have missed those writes
+            self._pending[customer_id] = None
+        for suffix in (".json", ".f32"):
+            path = self._path(customer_id) + suffix
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save_all(self):
+        for index in self._indexes.values():
+            index.save()
+
+    def stats(self) -> dict:
+        return {
+            "customers_loaded": len(self._indexes),
+            "chunks": sum(len(index) for index in self._indexes.values()),
+            "builds": self.builds,
+            "searches": self.searches,
+            "avg_search_ms": round(self.search_seconds / self.searches * 1000, 3)
+            if self.searches
+            else 0.0,
+        }
+
+
+knowledge_store = KnowledgeStore(
+    os.environ.get("KNOWLEDGE_INDEX_DIR", "./knowledge_index")
+)
+# Chunks scoring below this are hash-collision noise rather than matches
+knowledge_min_score = float(os.environ.get("KNOWLEDGE_MIN_SCORE", "0.2"))
+
+
 # Gemini AI setup
 gemini_api_key = os.environ.get("GOOGLE_API_KEY")
+gemini_model = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+# Upper bound for a single model round trip, and how often a running chat
+# checks whether its client has gone away
+llm_timeout_seconds = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))
+disconnect_poll_seconds = float(os.environ.get("DISCONNECT_POLL_SECONDS", "0.5"))
+
+
+class WriteQueue:
+    """Single-writer actor that applies write commands in group commits.
+
+    run(command) queues an async command(session) and waits for its result.
+    The actor takes every command already waiting (up to max_batch, after
+    waiting up to max_wait seconds for stragglers), runs them in order on
+    one writer session and commits once, so concurrent writers share a
+    transaction and its fsync. If a batch fails, its commands are retried
+    one transaction each so a bad command fails only its own caller.
+
+    Commands run inside the actor: they must not call run() themselves or
+    open another writer session, and they should not commit.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = None
+        self._task = None
+        self.commands = 0
+        self.batches = 0
+        self.retried_batches = 0
+        self.failed = 0
+        self.max_batch_seen = 0
+        self.batch_seconds_total = 0.0
+        self.batch_seconds_max = 0.0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            # A fresh context, so an actor started lazily from a request does
+            # not run its writes under that request's request_db
+            self._task = asyncio.create_task(self._run(), context=Context())
+
+    async def stop(self):
+        """Apply every command queued so far, then stop the actor."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def run(self, command):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((command, future))
+        return await future
+
+    async def add(self, obj):
+        """Insert one ORM object and return it with its id set."""
+
+        async def command(session):
+            session.add(obj)
+
+        await self.run(command)
+        return obj
+
+    async def _next_batch(self):
+        """The next commands to apply together, and whether stop() was called."""
+        item = await self._queue.get()
+        if item is None:
+            return [], True
+        if self.max_wait and self._queue.qsize() < self.max_batch - 1:
+            await asyncio.sleep(self.max_wait)
+        batch = [item]
+        while len(batch) < self.max_batch and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _run(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            # Callers that gave up before their turn are skipped
+            batch = [(command, future) for command, future in batch if not future.done()]
+            if batch:
+                await self._apply(batch)
+            if stopping:
+                return
+
+    async def _apply(self, batch: list):
+        started = time.perf_counter()
+        try:
+            results = await self._transaction([command for command, _ in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                results = [e]
+            else:
+                self.retried_batches += 1
+                results = []
+                for command, _ in batch:
+                    try:
+                        results.extend(await self._transaction([command]))
+                    except Exception as e:
+                        results.append(e)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                self.failed += 1
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        seconds = time.perf_counter() - started
+        self.commands += len(batch)
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        self.batch_seconds_total += seconds
+        self.batch_seconds_max = max(self.batch_seconds_max, seconds)
+
+    async def _transaction(self, commands: list) -> list:
+        async with async_session() as session:
+            results = [await command(session) for command in commands]
+            await session.commit()
+        return results
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "commands": self.commands,
+            "batches": self.batches,
+            "avg_batch_size": round(self.commands / self.batches, 2)
+            if self.batches
+            else 0.0,
+            "max_batch_seen": self.max_batch_seen,
+            "max_batch": self.max_batch,
+            "retried_batches": self.retried_batches,
+            "failed": self.failed,
+            "avg_batch_ms": round(self.batch_seconds_total / self.batches * 1000, 2)
+            if self.batches
+            else 0.0,
+            "max_batch_ms": round(self.batch_seconds_max * 1000, 2),
+        }
+
+
+write_queue = WriteQueue(
+    max_batch=int(os.environ.get("WRITE_BATCH_MAX", "64")),
+    max_wait=float(os.environ.get("WRITE_BATCH_WAIT_MS", "0")) / 1000,
+)
+
+
+class LogWriter:
+    """Background writer that batches Log rows off the request path.
+
+    Rows are queued by submit() and written with one multi-row INSERT when
+    batch_size rows are waiting or flush_interval seconds have passed. When
+    the queue is full the overflow policy decides what happens: "block"
+    waits for room, "drop_newest" discards the new row and "drop_oldest"
+    discards the oldest queued row.
+
+    With retention_days set, logs older than that are deleted once at
+    start-up and then every PRUNE_INTERVAL_SECONDS.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest")
+    PRUNE_INTERVAL_SECONDS = 3600
+
+    def __init__(
+        self,
+        max_queue: int,
+        batch_size: int,
+        flush_interval: float,
+        overflow: str,
+        retention_days: int = 0,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log overflow policy: {overflow}")
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.retention_days = retention_days
+        self._next_prune = 0.0
+        self._queue = None
+        self._batch_ready = None
+        self._task = None
+        self._stopping = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.max_depth_seen = 0
+        self.pruned = 0
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue(maxsize=self.max_queue)
+            self._batch_ready = asyncio.Event()
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the background task."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._batch_ready.set()
+        await self._task
+        self._task = None
+
+    async def submit(self, row: dict):
+        self.start()
+        if self._queue.full():
+            if self.overflow == "drop_newest":
+                self.dropped += 1
+                return
+            if self.overflow == "drop_oldest":
+                self._queue.get_nowait()
+                self.dropped += 1
+        await self._queue.put(row)
+        self.enqueued += 1
+        self.max_depth_seen = max(self.max_depth_seen, self._queue.qsize())
+        if self._queue.qsize() >= self.batch_size:
+            self._batch_ready.set()
+
+    async def _run(self):
+        while True:
+            # A backlog of a full batch or more is written straight away
+            # rather than one batch per flush_interval
+            if not self._stopping and self._queue.qsize() < self.batch_size:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), timeout=self.flush_interval
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+            batch = []
+            while not self._queue.empty() and len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+            if batch:
+                await self._flush(batch)
+            elif self._stopping:
+                return
+            if self.retention_days and time.monotonic() >= self._next_prune:
+                self._next_prune = time.monotonic() + self.PRUNE_INTERVAL_SECONDS
+                await self.prune()
+
+    async def prune(self) -> int:
+        """Delete logs older than retention_days as one timestamp range delete."""
+        cutoff = dt.datetime.now() - dt.timedelta(days=self.retention_days)
+
+        async def delete_logs(session):
+            result = await session.execute(delete(Log).where(Log.timestamp < cutoff))
+            return result.rowcount
+
+        try:
+            deleted = await write_queue.run(delete_logs)
+        except Exception as e:
+            print(f"Error pruning chat logs: {e}")
+            return 0
+        self.pruned += deleted
+        return deleted
+
+    async def _flush(self, rows: list):
+        started = time.perf_counter()
+
+        async def insert_logs(session):
+            await session.execute(insert(Log).values(rows))
+
+        try:
+            await write_queue.run(insert_logs)
+            self.written += len(rows)
+        except Exception as e:
+            self.flush_errors += 1
+            print(f"Error writing {len(rows)} chat logs: {e}")
+        seconds = time.perf_counter() - started
+        self.flushes += 1
+        self.flush_seconds_total += seconds
+        self.flush_seconds_max = max(self.flush_seconds_max, seconds)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_depth_seen": self.max_depth_seen,
+            "max_queue": self.max_queue,
+            "overflow": self.overflow,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "avg_flush_ms": round(
+                self.flush_seconds_total / self.flushes * 1000, 2
+            )
+            if self.flushes
+            else 0.0,
+            "max_flush_ms": round(self.flush_seconds_max * 1000, 2),
+            "retention_days": self.retention_days,
+            "pruned": self.pruned,
+        }
+
+
+log_writer = LogWriter(
+    max_queue=int(os.environ.get("LOG_QUEUE_MAX", "10000")),
+    batch_size=int(os.environ.get("LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.environ.get("LOG_FLUSH_INTERVAL_SECONDS", "1.0")),
+    overflow=os.environ.get("LOG_QUEUE_OVERFLOW", "drop_oldest"),
+    retention_days=int(os.environ.get("LOG_RETENTION_DAYS", "0")),
+)
+
+
+# Formats accepted besides ISO 8601 when migrating legacy string columns
+LEGACY_TEMPORAL_FORMATS = {
+    "date": ("%Y/%m/%d", "%m/%d/%Y", "%d.%m.%Y"),
+    "time": ("%I:%M %p", "%I:%M%p", "%I %p", "%I%p"),
+    "datetime": ("%Y/%m/%d %H:%M:%S", "%m/%d/%Y %H:%M:%S", "%m/%d/%Y %H:%M"),
+}
+
+
+def parse_temporal(value: str, kind: str):
+    """Parse a stored "date", "time" or "datetime" string into its Python
+    type. Timezone-aware values are converted to naive local time."""
+    value = value.strip()
+    try:
+        if kind == "time":
+            parsed = dt.time.fromisoformat(value)
+        else:
+            parsed = dt.datetime.fromisoformat(value)
+    except ValueError:
+        for fmt in LEGACY_TEMPORAL_FORMATS[kind]:
+            try:
+                parsed = dt.datetime.strptime(value.upper(), fmt)
+            except ValueError:
+                continue
+            if kind == "time":
+                parsed = parsed.time()
+            break
+        else:
+            raise ValueError(f"Unrecognized {kind}: {value!r}")
+    if parsed.tzinfo is not None:
+        if kind == "time":
+            parsed = parsed.replace(tzinfo=None)
+        else:
+            parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.date() if kind == "date" else parsed
+
+
+# Columns that were ISO strings before they became Date, Time and DateTime
+TEMPORAL_COLUMNS = [
+    (Appointment.__table__.c.date, "date"),
+    (Appointment.__table__.c.time, "time"),
+    (Invoice.__table__.c.created_date, "date"),
+    (Invoice.__table__.c.due_date, "date"),
+    (Log.__table__.c.timestamp, "datetime"),
+    (UnansweredQuestion.__table__.c.timestamp, "datetime"),
+]
+
+
+async def rebuild_revenue_rollups(conn, customer_id: Optional[int] = None) -> int:
+    """Recompute revenue_daily from the paid invoices, for one customer or
+    all of them. Returns the number of rollup rows written."""
+    clear = delete(RevenueDaily)
+    source = (
+        select(
+            Invoice.customer_id,
+            Invoice.created_date,
+            func.sum(Invoice.total_amount),
+            func.count(),
+        )
+        .where(Invoice.status == "paid")
+        .group_by(Invoice.customer_id, Invoice.created_date)
+    )
+    if customer_id is not None:
+        clear = clear.where(RevenueDaily.customer_id == customer_id)
+        source = source.where(Invoice.customer_id == customer_id)
+    await conn.execute(clear)
+    result = await conn.execute(
+        insert(RevenueDaily).from_select(
+            ["customer_id", "day", "total_amount", "invoice_count"], source
+        )
+    )
+    return result.rowcount
+
+
+async def normalize_temporal_columns(conn):
+    """Rewrite legacy date and time strings in the typed columns' storage
+    format, so they load as Python values and sort correctly. Fails the
+    migration if any value cannot be parsed."""
+    for column, kind in TEMPORAL_COLUMNS:
+        table = column.table
+        rows = (
+            await conn.execute(
+                text(
+                    f"SELECT id, {column.name} FROM {table.name} "
+                    f"WHERE {column.name} IS NOT NULL"
+                )
+            )
+        ).all()
+        updates = []
+        invalid = []
+        for row_id, raw in rows:
+            try:
+                updates.append({"row_id": row_id, "value": parse_temporal(str(raw), kind)})
+            except ValueError:
+                invalid.append((row_id, raw))
+        if invalid:
+            raise ValueError(
+                f"Cannot convert {table.name}.{column.name} for rows {invalid[:10]}"
+            )
+        if updates:
+            await conn.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values({column.name: bindparam("value", type_=column.type)}),
+                updates,
+            )
+
+
+def kb_version_triggers() -> List[str]:
+    """Triggers that bump kb_versions on every write to a KB_MODELS table;
+    an update bumps both the old and the new customer."""
+    bump = (
+        "INSERT INTO kb_versions (customer_id, version) VALUES ({}.customer_id, 1) "
+        "ON CONFLICT (customer_id) DO UPDATE SET version = version + 1;"
+    )
+    statements = [
+        "CREATE TABLE IF NOT EXISTS kb_versions ("
+        "customer_id INTEGER PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)"
+    ]
+    for table in (model.__tablename__ for model in KB_MODELS):
+        for suffix, operation, rows in (
+            ("ai", "INSERT", ("new",)),
+            ("ad", "DELETE", ("old",)),
+            ("au", "UPDATE", ("old", "new")),
+        ):
+            body = " ".join(bump.format(row) for row in rows)
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_kb_version_{suffix} "
+                f"AFTER {operation} ON {table} BEGIN {body} END"
+            )
+    return statements
+
+
+async def load_kb_versions(session, customer_ids) -> dict:
+    """kb_versions for the given customers; customers never written are 0."""
+    table = KBVersion.__table__
+    result = await session.execute(
+        select(table.c.customer_id, table.c.version).where(
+            table.c.customer_id.in_(list(customer_ids))
+        )
+    )
+    versions = dict.fromkeys(customer_ids, 0)
+    for customer_id, version in result:
+        versions[customer_id] = version
+    return versions
+
+
+# Forward-only schema migrations as (version, name, steps). A step is a SQL
+# string or an async callable taking the connection. create_all only adds
+# missing tables, so changes to existing tables go here with the next version.
+MIGRATIONS = [
+    (
+        1,
+        "composite indexes for hot tool queries",
+        [
+            "CREATE INDEX IF NOT EXISTS ix_appointments_customer_date_time "
+            "ON appointments (customer_id, date, time)",
+            "CREATE INDEX IF NOT EXISTS ix_invoices_customer_status_created "
+            "ON invoices (customer_id, status, created_date)",
+            "CREATE INDEX IF NOT EXISTS ix_business_services_customer_available "
+            "ON business_services (customer_id, is_available)",
+            "CREATE INDEX IF NOT EXISTS ix_business_facts_customer_category_title "
+            "ON business_facts (customer_id, category, title)",
+        ],
+    ),
+    (
+        2,
+        "typed date and time columns",
+        [
+            normalize_temporal_columns,
+            "CREATE INDEX IF NOT EXISTS ix_logs_customer_timestamp "
+            "ON logs (customer_id, timestamp)",
+            "CREATE INDEX IF NOT EXISTS ix_logs_timestamp ON logs (timestamp)",
+        ],
+    ),
+    (3, "daily revenue rollups", [rebuild_revenue_rollups]),
+    (4, "knowledge base versions", kb_version_triggers()),
+]
+
+
+async def run_migrations(conn) -> List[int]:
+    """Apply pending migrations in order, each recorded in schema_migrations
+    within the caller's transaction. Returns the versions applied."""
+    await conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+        )
+    )
+    current = (
+        await conn.execute(text("SELECT MAX(version) FROM schema_migrations"))
+    ).scalar() or 0
+    if current >= MIGRATIONS[-1][0]:
+        return []
+
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        for step in steps:
+            if isinstance(step, str):
+                await conn.execute(text(step))
+            else:
+                await step(conn)
+        await conn.execute(
+            text(
+                "INSERT INTO schema_migrations (version, name, applied_at) "
+                "VALUES (:version, :name, :applied_at)"
+            ),
+            {
+                "version": version,
+                "name": name,
+                "applied_at": dt.datetime.now().isoformat(),
+            },
+        )
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+# FTS5 indexes over business facts and services, kept in sync by triggers
+SEARCH_INDEXES = {
+    "business_facts_fts": ("business_facts", ["title", "content", "category"]),
+    "business_services_fts": ("business_services", ["name", "description", "category"]),
+}
+
+
+async def ensure_search_index(conn):
+    """Create the FTS5 tables and their sync triggers, filling any new table
+    from the rows already stored."""
+    for fts_table, (table, columns) in SEARCH_INDEXES.items():
+        exists = (
+            await conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": fts_table},
+            )
+        ).first()
+        cols = ", ".join(columns)
+        new_cols = ", ".join(f"new.{c}" for c in columns)
+        old_cols = ", ".join(f"old.{c}" for c in columns)
+        statements = [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+            f"{cols}, content='{table}', content_rowid='id', tokenize='porter unicode61')",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) "
+            f"VALUES ('delete', old.id, {old_cols}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_fts_au AFTER UPDATE ON {table} BEGIN "
+            f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) "
+            f"VALUES ('delete', old.id, {old_cols}); "
+            f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.id, {new_cols}); END",
+        ]
+        for statement in statements:
+            await conn.execute(text(statement))
+        if not exists:
+            await conn.execute(
+                text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+            )
+
+
+def fts_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every keyword as a quoted prefix
+    term, OR-ed together so BM25 ranks rows matching more keywords first."""
+    words = re.findall(r"\w+", query.lower())
+    keywords = [w for w in words if w not in STOPWORDS] or words
+    if not keywords:
+        return None
+    return " OR ".join(f'"{w}"*' for w in dict.fromkeys(keywords))
 
 
 @asynccontextmanager
@@ -170,12 +1816,198 @@ async def lifespan(app: FastAPI):
     # Startup: Create database tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
+        await ensure_search_index(conn)
+    if kb_cache_warm_tenants:
+        started = time.perf_counter()
+        warmed = await kb_cache.warm(kb_cache_warm_tenants)
+        print(
+            f"[kb_cache] warmed {warmed} customers"
+            f" in {time.perf_counter() - started:.2f}s"
+        )
+    if semantic_cache_enabled:
+        async with read_session() as session:
+            await semantic_cache.load(session)
+    write_queue.start()
+    log_writer.start()
     yield
-    # Shutdown: Add cleanup logic here if needed
+    # Shutdown: write out queued chat logs and pending writes, then persist
+    # the semantic cache
+    await log_writer.stop()
+    await write_queue.stop()
+    knowledge_store.save_all()
+    if semantic_cache_enabled:
+        async with read_session() as session:
+            await semantic_cache.save(session)
+
+
+class RequestDB:
+    """Database state for one request: the read session shared by the
+    endpoint and every tool it runs, a lock so that session runs one
+    statement at a time (tools run concurrently, an AsyncSession cannot),
+    and the number of pool checkouts made while handling the request."""
+
+    __slots__ = ("session", "lock", "checkouts")
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.lock = asyncio.Lock()
+        self.checkouts = 0
+
+
+# Set by get_db for the duration of a request; tasks started while handling
+# it (tool calls, the SSE producer) inherit it
+request_db: ContextVar[Optional[RequestDB]] = ContextVar("request_db", default=None)
+
+
+class CheckoutStats:
+    """Connection pool checkouts per engine, and per request for requests
+    that go through get_db. Writes run in the write queue's own task, so
+    they count under the writer engine but not against a request."""
+
+    def __init__(self):
+        self.checkouts = {}
+        self.requests = 0
+        self.request_checkouts_total = 0
+        self.request_checkouts_max = 0
+        self.multi_checkout_requests = 0
+
+    def instrument(self, engine, name: str):
+        self.checkouts.setdefault(name, 0)
+
+        @event.listens_for(engine.sync_engine.pool, "checkout")
+        def count_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checkouts[name] += 1
+            state = request_db.get()
+            if state is not None:
+                state.checkouts += 1
+
+    def record_request(self, checkouts: int):
+        self.requests += 1
+        self.request_checkouts_total += checkouts
+        self.request_checkouts_max = max(self.request_checkouts_max, checkouts)
+        if checkouts > 1:
+            self.multi_checkout_requests += 1
+
+    def stats(self) -> dict:
+        return {
+            "checkouts": dict(self.checkouts),
+            "requests": self.requests,
+            "avg_checkouts_per_request": round(
+                self.request_checkouts_total / self.requests, 3
+            )
+            if self.requests
+            else 0.0,
+            "max_checkouts_per_request": self.request_checkouts_max,
+            "requests_over_one_checkout": self.multi_checkout_requests,
+        }
+
+
+checkout_stats = CheckoutStats()
+
+
+async def get_db():
+    """FastAPI dependency that opens one read session for the request.
+
+    Tools and helpers running on behalf of the request pick the same session
+    up through db_reader(), so a request checks out at most one reader
+    connection instead of one per query.
+    """
+    async with read_session() as session:
+        state = RequestDB(session)
+        token = request_db.set(state)
+        try:
+            yield session
+        finally:
+            request_db.reset(token)
+            checkout_stats.record_request(state.checkouts)
+
 
+@asynccontextmanager
+async def db_reader():
+    """The current request's read session, or a fresh one outside a request
+    (scripts, background tasks)."""
+    state = request_db.get()
+    if state is None:
+        async with read_session() as session:
+            yield session
+        return
+    async with state.lock:
+        yield state.session
+
+
+async def release_request_db():
+    """Hand the request's reader connection back to the pool, e.g. before a
+    slow model call. The session checks a connection out again if used."""
+    state = request_db.get()
+    if state is not None:
+        async with state.lock:
+            await state.session.close()
+
+
+# PRAGMAs run on every new SQLite connection. WAL lets the readers keep
+# going while the writer commits; busy_timeout comes first so switching the
+# journal mode waits for other connections instead of failing.
+storage_profile = {
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-65536")),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+read_pool_size = int(os.environ.get("SQLITE_READ_POOL_SIZE", "8"))
+
+
+def apply_storage_profile(engine, profile: dict, read_only: bool = False):
+    """Run profile's PRAGMAs on each connection engine opens. Reader
+    connections are also made query_only so a misrouted write fails loudly."""
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in profile.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def create_engines(
+    url: str, profile: Optional[dict] = None, read_pool: int = 0, echo: bool = False
+):
+    """A single-connection writer engine and a pooled reader engine for url.
+
+    SQLite allows one writer at a time, so writers queue for the one pooled
+    connection instead of contending for the file lock.
+    """
+    profile = storage_profile if profile is None else profile
+    writer = create_async_engine(url, echo=echo, pool_size=1, max_overflow=0)
+    reader = create_async_engine(
+        url, echo=echo, pool_size=read_pool or read_pool_size, max_overflow=0
+    )
+    apply_storage_profile(writer, profile)
+    apply_storage_profile(reader, profile, read_only=True)
+    checkout_stats.instrument(writer, "writer")
+    checkout_stats.instrument(reader, "reader")
+    return writer, reader
+
+
+def bind_database(url: str, echo: bool = False):
+    """Point the writer and reader engines and sessions at url, e.g. for the
+    scripts that run against a scratch database."""
+    global engine, read_engine, async_session, read_session
+    engine, read_engine = create_engines(url, echo=echo)
+    async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    # Read-only tools and GET endpoints use read_session
+    read_session = sessionmaker(
+        bind=read_engine, class_=AsyncSession, expire_on_commit=False
+    )
 
-engine = create_async_engine("sqlite+aiosqlite:///./customers.db", echo=True)
-async_session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+bind_database(
+    os.environ.get("DATABASE_URL", "sqlite+aiosqlite:///./customers.db"), echo=True
+)
 
 app = FastAPI(title="Simple API", version="1.0.0", lifespan=lifespan)
 
@@ -198,6 +2030,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -214,7 +2047,7 @@ class CustomerModel(BaseModel):
 
 class LogModel(BaseModel):
     id: Optional[int] = None
-    timestamp: str
+    timestamp: dt.datetime
     action: str
     details: Optional[str] = None
 
@@ -241,8 +2074,8 @@ class AppointmentModel(BaseModel):
     id: Optional[int] = None
     customer_id: int
     service_id: int
-    date: str
-    time: str
+    date: dt.date
+    time: dt.time
     status: str = "scheduled"
     notes: Optional[str] = None
 
@@ -253,8 +2086,8 @@ class InvoiceModel(BaseModel):
     appointment_id: Optional[int] = None
     total_amount: float
     status: str = "unpaid"
-    created_date: str
-    due_date: str
+    created_date: dt.date
+    due_date: dt.date
     items: Optional[str] = None
 
 
@@ -300,7 +2133,7 @@ class UnansweredQuestionModel(BaseModel):
     id: Optional[int] = None
     customer_id: int
     question: str
-    timestamp: str
+    timestamp: dt.datetime
     status: str = "pending"
     response: Optional[str] = None
 
@@ -311,62 +2144,198 @@ class ChatMessage(BaseModel):
     api_key: Optional[str] = None
 
 
+# Rough budget for each tool result that goes back into the prompt
+tool_output_token_budget = int(os.environ.get("TOOL_OUTPUT_TOKEN_BUDGET", "800"))
+# Default and largest number of rows a list tool reads before saying "N more"
+tool_row_limit = int(os.environ.get("TOOL_ROW_LIMIT", "50"))
+
+
+def clamp_limit(limit: int) -> int:
+    """A model-supplied row limit kept within 1..tool_row_limit. SQLite takes
+    a negative LIMIT as no limit at all, and 0 would hide every row."""
+    return max(1, min(limit, tool_row_limit))
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, about four characters per token for English text."""
+    return (len(text) + 3) // 4
+
+
+def fit_lines(
+    lines: List[str], total: Optional[int] = None, noun: str = "items"
+) -> List[str]:
+    """Keep the lines that fit in the tool output budget and say how many of
+    the total were left out."""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > tool_output_token_budget:
+            break
+        kept.append(line)
+        used += cost
+    remaining = (len(lines) if total is None else total) - len(kept)
+    if remaining > 0:
+        kept.append(f"… and {remaining} more {noun}")
+    return kept
+
+
+# Limited and counting forms of the fetch_limited statements, built once each
+limited_statements = {}
+
+
+async def fetch_limited(session, stmt, limit: int, params: dict):
+    """Run stmt with a row limit, returning (rows, total matching rows).
+
+    stmt should be one of the module-level statements below, which take their
+    values as bound parameters, so the limited and counting forms are built
+    and compiled once per query shape rather than on every call.
+    """
+    statements = limited_statements.get(stmt)
+    if statements is None:
+        statements = (
+            stmt.limit(bindparam("row_limit")),
+            select(func.count()).select_from(stmt.order_by(None).subquery()),
+        )
+        limited_statements[stmt] = statements
+    limited, count = statements
+    limit = clamp_limit(limit)
+    params = {**params, "row_limit": limit}
+    rows = (await session.execute(limited, params)).all()
+    if len(rows) < limit:
+        return rows, len(rows)
+    return rows, (await session.execute(count, params)).scalar_one()
+
+
+def appointment_lines(upcoming: bool):
+    appointments = Appointment.__table__
+    stmt = select(
+        appointments.c.date,
+        appointments.c.time,
+        appointments.c.status,
+        appointments.c.notes,
+    ).where(appointments.c.customer_id == bindparam("customer_id"))
+    if upcoming:
+        stmt = stmt.where(appointments.c.date >= bindparam("today"))
+    return stmt.order_by(appointments.c.date, appointments.c.time)
+
+
+# Just the columns the read tools format, as Core rows: no identity map or
+# instrumented instances for rows that only end up in a string
+SERVICE_LINES = select(
+    Service.__table__.c.name, Service.__table__.c.price, Service.__table__.c.duration
+).where(Service.__table__.c.customer_id == bindparam("customer_id"))
+INVENTORY_LINES = select(
+    InventoryItem.__table__.c.name,
+    InventoryItem.__table__.c.quantity,
+    InventoryItem.__table__.c.price,
+    InventoryItem.__table__.c.category,
+).where(InventoryItem.__table__.c.customer_id == bindparam("customer_id"))
+UPCOMING_APPOINTMENT_LINES = appointment_lines(upcoming=True)
+ALL_APPOINTMENT_LINES = appointment_lines(upcoming=False)
+CUSTOMER_LINES = select(
+    Customer.__table__.c.name,
+    Customer.__table__.c.email,
+    Customer.__table__.c.business_name,
+)
+
+
+def parse_day(day: str) -> dt.date:
+    """A date from "today" or YYYY-MM-DD."""
+    return dt.date.today() if day == "today" else dt.date.fromisoformat(day)
+
+
+REVENUE_GRANULARITIES = ("day", "week", "month")
+
+
+async def revenue_series(
+    session, customer_id: int, start: dt.date, end: dt.date, granularity: str = "day"
+) -> List[dict]:
+    """Paid revenue from start to end inclusive, summed in SQL from the
+    revenue_daily rollups per day, week (starting Monday) or month."""
+    if granularity == "week":
+        period = func.date(RevenueDaily.day, "weekday 0", "-6 days")
+    elif granularity == "month":
+        period = func.strftime("%Y-%m-01", RevenueDaily.day)
+    else:
+        period = RevenueDaily.day
+    result = await session.execute(
+        select(
+            period,
+            func.sum(RevenueDaily.total_amount),
+            func.sum(RevenueDaily.invoice_count),
+        )
+        .where(
+            RevenueDaily.customer_id == customer_id,
+            RevenueDaily.day >= start,
+            RevenueDaily.day <= end,
+        )
+        .group_by(period)
+        .order_by(period)
+    )
+    return [
+        {"period": str(p), "total_revenue": round(total, 2), "invoice_count": count}
+        for p, total, count in result.all()
+        if count
+    ]
+
+
 # Tool functions for LLM
 @tool
-async def get_customer_services(customer_id: int) -> str:
+async def get_customer_services(customer_id: int, limit: int = tool_row_limit) -> str:
     """Get the list of services for a customer."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(Service).where(Service.customer_id == customer_id)
+    async with db_reader() as session:
+        services, total = await fetch_limited(
+            session, SERVICE_LINES, limit, {"customer_id": customer_id}
         )
-        services = result.scalars().all()
         if not services:
             return "No services found."
         service_list = "\n".join(
-            [f"- {s.name}: ${s.price} ({s.duration} min)" for s in services]
+            fit_lines(
+                [f"- {s.name}: ${s.price} ({s.duration} min)" for s in services],
+                total,
+                "services",
+            )
         )
         return f"Services:\n{service_list}"
 
 
 @tool
-async def get_customer_schedule(customer_id: int) -> str:
-    """Get the complete schedule for a customer including appointments and business hours."""
+async def get_customer_schedule(
+    customer_id: int, include_past: bool = False, limit: int = 20
+) -> str:
+    """Get the complete schedule for a customer including business hours and appointments (upcoming only unless include_past is true)."""
     schedule_parts = []
 
     # Get business hours
-    async with async_session() as session:
-        hours_result = await session.execute(
-            select(BusinessHours).where(BusinessHours.customer_id == customer_id)
-        )
-        hours = hours_result.scalars().all()
-
-        if hours:
-            days = [
-                "Monday",
-                "Tuesday",
-                "Wednesday",
-                "Thursday",
-                "Friday",
-                "Saturday",
-                "Sunday",
-            ]
-            hours_list = []
-            for h in hours:
-                day_name = days[h.day_of_week]
-                if h.is_closed:
-                    hours_list.append(f"  {day_name}: Closed")
-                else:
-                    hours_list.append(f"  {day_name}: {h.open_time} - {h.close_time}")
-            schedule_parts.append(f"🕒 **Business Hours:**\n" + "\n".join(hours_list))
+    hours = await kb_cache.get(customer_id, "hours")
+    if hours:
+        days = [
+            "Monday",
+            "Tuesday",
+            "Wednesday",
+            "Thursday",
+            "Friday",
+            "Saturday",
+            "Sunday",
+        ]
+        hours_list = []
+        for h in hours:
+            day_name = days[h.day_of_week]
+            if h.is_closed:
+                hours_list.append(f"  {day_name}: Closed")
+            else:
+                hours_list.append(f"  {day_name}: {h.open_time} - {h.close_time}")
+        schedule_parts.append(f"🕒 **Business Hours:**\n" + "\n".join(hours_list))
 
     # Get appointments
-    async with async_session() as session:
-        appt_result = await session.execute(
-            select(Appointment)
-            .where(Appointment.customer_id == customer_id)
-            .order_by(Appointment.date, Appointment.time)
+    async with db_reader() as session:
+        appointments, total = await fetch_limited(
+            session,
+            ALL_APPOINTMENT_LINES if include_past else UPCOMING_APPOINTMENT_LINES,
+            limit,
+            {"customer_id": customer_id, "today": dt.date.today()},
         )
-        appointments = appt_result.scalars().all()
 
         if appointments:
             appt_list = []
@@ -377,9 +2346,12 @@ async def get_customer_schedule(customer_id: int) -> str:
                     "cancelled": "❌",
                 }.get(a.status, "❓")
                 appt_list.append(
-                    f"  {status_emoji} {a.date} {a.time}: {a.status.title()} ({a.notes or 'No notes'})"
+                    f"  {status_emoji} {a.date} {a.time:%H:%M}: {a.status.title()} ({a.notes or 'No notes'})"
                 )
-            schedule_parts.append(f"📋 **Appointments:**\n" + "\n".join(appt_list))
+            schedule_parts.append(
+                f"📋 **Appointments:**\n"
+                + "\n".join(fit_lines(appt_list, total, "appointments"))
+            )
         else:
             schedule_parts.append("📋 **Appointments:** No appointments scheduled")
 
@@ -391,22 +2363,28 @@ async def get_customer_schedule(customer_id: int) -> str:
 
 
 @tool
-async def get_customer_appointments(customer_id: int) -> str:
-    """Get the list of appointments for a customer."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(Appointment)
-            .where(Appointment.customer_id == customer_id)
-            .order_by(Appointment.date, Appointment.time)
+async def get_customer_appointments(
+    customer_id: int, include_past: bool = False, limit: int = 20
+) -> str:
+    """Get the list of appointments for a customer (upcoming only unless include_past is true)."""
+    async with db_reader() as session:
+        appointments, total = await fetch_limited(
+            session,
+            ALL_APPOINTMENT_LINES if include_past else UPCOMING_APPOINTMENT_LINES,
+            limit,
+            {"customer_id": customer_id, "today": dt.date.today()},
         )
-        appointments = result.scalars().all()
         if not appointments:
             return "No appointments found."
         appt_list = "\n".join(
-            [
-                f"- {a.date} {a.time}: {a.status.title()} ({a.notes or 'No notes'})"
-                for a in appointments
-            ]
+            fit_lines(
+                [
+                    f"- {a.date} {a.time:%H:%M}: {a.status.title()} ({a.notes or 'No notes'})"
+                    for a in appointments
+                ],
+                total,
+                "appointments",
+            )
         )
         return f"📅 **Your Appointments:**\n{appt_list}"
 
@@ -414,144 +2392,186 @@ async def get_customer_appointments(customer_id: int) -> str:
 @tool
 async def get_customer_revenue(customer_id: int, date: str = "today") -> str:
     """Get revenue information for a customer on a specific date."""
-    from datetime import datetime, timedelta
+    try:
+        day = parse_day(date)
+    except ValueError:
+        return f"Invalid date '{date}', expected YYYY-MM-DD or 'today'."
 
-    if date == "today":
-        today = datetime.now().date()
-        start_date = today.isoformat()
-        end_date = (today + timedelta(days=1)).isoformat()
-    else:
-        start_date = date
-        end_date = (datetime.fromisoformat(date) + timedelta(days=1)).isoformat()
+    async with db_reader() as session:
+        series = await revenue_series(session, customer_id, day, day)
+    total_revenue = series[0]["total_revenue"] if series else 0
+    invoice_count = series[0]["invoice_count"] if series else 0
+    return f"Revenue on {date}: ${total_revenue} from {invoice_count} invoices."
 
-    async with async_session() as session:
-        result = await session.execute(
-            select(Invoice).where(
-                Invoice.customer_id == customer_id,
-                Invoice.status == "paid",
-                Invoice.created_date >= start_date,
-                Invoice.created_date < end_date,
-            )
-        )
-        invoices = result.scalars().all()
-        total_revenue = sum(invoice.total_amount for invoice in invoices)
-        return f"Revenue on {date}: ${total_revenue} from {len(invoices)} invoices."
+
+@tool
+async def get_customer_revenue_trend(
+    customer_id: int,
+    start_date: str,
+    end_date: str = "today",
+    granularity: str = "month",
+) -> str:
+    """Get revenue between two dates (YYYY-MM-DD, inclusive) grouped by day, week or month, e.g. to compare revenue month over month."""
+    try:
+        start, end = parse_day(start_date), parse_day(end_date)
+    except ValueError:
+        return "Invalid date, expected YYYY-MM-DD or 'today'."
+    if granularity not in REVENUE_GRANULARITIES:
+        return f"Invalid granularity '{granularity}', use day, week or month."
+
+    async with db_reader() as session:
+        series = await revenue_series(session, customer_id, start, end, granularity)
+    if not series:
+        return f"No revenue from {start} to {end}."
+    total_revenue = round(sum(p["total_revenue"] for p in series), 2)
+    invoice_count = sum(p["invoice_count"] for p in series)
+    lines = [
+        f"- {p['period']}: ${p['total_revenue']} from {p['invoice_count']} invoices"
+        for p in series
+    ]
+    return (
+        f"Revenue from {start} to {end} by {granularity}: ${total_revenue} "
+        f"from {invoice_count} invoices.\n"
+        + "\n".join(fit_lines(lines, noun="periods"))
+    )
 
 
 @tool
 async def get_customer_business_hours(customer_id: int) -> str:
     """Get business hours for a customer."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessHours).where(BusinessHours.customer_id == customer_id)
-        )
-        hours = result.scalars().all()
-        if not hours:
-            return "No business hours set."
-        days = [
-            "Monday",
-            "Tuesday",
-            "Wednesday",
-            "Thursday",
-            "Friday",
-            "Saturday",
-            "Sunday",
-        ]
-        hours_list = []
-        for h in hours:
-            day_name = days[h.day_of_week]
-            if h.is_closed:
-                hours_list.append(f"- {day_name}: Closed")
-            else:
-                hours_list.append(f"- {day_name}: {h.open_time} - {h.close_time}")
-        return f"Business Hours:\n" + "\n".join(hours_list)
+    hours = await kb_cache.get(customer_id, "hours")
+    if not hours:
+        return "No business hours set."
+    days = [
+        "Monday",
+        "Tuesday",
+        "Wednesday",
+        "Thursday",
+        "Friday",
+        "Saturday",
+        "Sunday",
+    ]
+    hours_list = []
+    for h in hours:
+        day_name = days[h.day_of_week]
+        if h.is_closed:
+            hours_list.append(f"- {day_name}: Closed")
+        else:
+            hours_list.append(f"- {day_name}: {h.open_time} - {h.close_time}")
+    return f"Business Hours:\n" + "\n".join(hours_list)
 
 
 @tool
-async def get_customer_inventory(customer_id: int) -> str:
+async def get_customer_inventory(
+    customer_id: int, limit: int = tool_row_limit
+) -> str:
     """Get inventory items for a customer."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(InventoryItem).where(InventoryItem.customer_id == customer_id)
+    async with db_reader() as session:
+        items, total = await fetch_limited(
+            session, INVENTORY_LINES, limit, {"customer_id": customer_id}
         )
-        items = result.scalars().all()
         if not items:
             return "No inventory items found."
         item_list = "\n".join(
-            [
-                f"- {i.name}: {i.quantity} units @ ${i.price} each ({i.category or 'No category'})"
-                for i in items
-            ]
+            fit_lines(
+                [
+                    f"- {i.name}: {i.quantity} units @ ${i.price} each ({i.category or 'No category'})"
+                    for i in items
+                ],
+                total,
+                "items",
+            )
         )
         return f"Inventory:\n{item_list}"
 
 
 @tool
-async def get_all_customers() -> str:
+async def get_all_customers(limit: int = tool_row_limit) -> str:
     """Get a list of all customers in the system."""
-    async with async_session() as session:
-        result = await session.execute(select(Customer))
-        customers = result.scalars().all()
+    async with db_reader() as session:
+        customers, total = await fetch_limited(session, CUSTOMER_LINES, limit, {})
         if not customers:
             return "No customers found."
         customer_list = []
         for c in customers:
             business_info = f" - {c.business_name}" if c.business_name else ""
             customer_list.append(f"- **{c.name}** ({c.email}){business_info}")
-        return f"**All Customers:**\n" + "\n".join(customer_list)
+        return f"**All Customers:**\n" + "\n".join(
+            fit_lines(customer_list, total, "customers")
+        )
 
 
 @tool
-async def get_customer_business_facts(customer_id: int) -> str:
-    """Get public business facts and information for a customer."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessFact).where(
-                BusinessFact.customer_id == customer_id, BusinessFact.is_public == True
-            )
-        )
-        facts = result.scalars().all()
-        if not facts:
-            return "No business information available."
-        fact_list = []
-        for f in facts:
-            fact_list.append(f"**{f.title}:**\n{f.content}")
-        return f"**Business Information:**\n\n" + "\n\n".join(fact_list)
+async def get_customer_business_facts(
+    customer_id: int, limit: int = tool_row_limit
+) -> str:
+    """Get public business facts and information for a customer. For long knowledge bases prefer search_business_facts."""
+    facts = [f for f in await kb_cache.get(customer_id, "facts") if f.is_public]
+    if not facts:
+        return "No business information available."
+    fact_list = []
+    for f in facts[: clamp_limit(limit)]:
+        fact_list.append(f"**{f.title}:**\n{f.content}")
+    return f"**Business Information:**\n\n" + "\n\n".join(
+        fit_lines(fact_list, len(facts), "facts (use search_business_facts)")
+    )
 
 
 @tool
-async def search_business_facts(customer_id: int, query: str) -> str:
-    """Search business facts for specific information using keywords."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessFact).where(
-                BusinessFact.customer_id == customer_id, BusinessFact.is_public == True
+async def search_business_facts(customer_id: int, query: str, limit: int = 5) -> str:
+    """Search business facts for specific information using keywords. Returns the best matches first."""
+    match = fts_query(query)
+    facts = []
+    if match:
+        async with db_reader() as session:
+            result = await session.execute(
+                text(
+                    "SELECT f.title, f.content FROM business_facts_fts "
+                    "JOIN business_facts f ON f.id = business_facts_fts.rowid "
+                    "WHERE business_facts_fts MATCH :match "
+                    "AND f.customer_id = :customer_id AND f.is_public = 1 "
+                    "ORDER BY bm25(business_facts_fts, 10.0, 1.0, 2.0) LIMIT :limit"
+                ),
+                {
+                    "match": match,
+                    "customer_id": customer_id,
+                    "limit": clamp_limit(limit),
+                },
             )
-        )
-        facts = result.scalars().all()
+            facts = result.all()
 
-        if not facts:
+    if not facts:
+        titles = [
+            f.title for f in await kb_cache.get(customer_id, "facts") if f.is_public
+        ][:tool_row_limit]
+        if not titles:
             return "No business information available to search."
+        topics = fit_lines(titles, noun="topics")
+        return f"No information found for '{query}'. Available topics: {', '.join(topics)}"
+
+    fact_list = []
+    for f in facts:
+        fact_list.append(f"**{f.title}:**\n{f.content}")
+    return f"**Search Results for '{query}':**\n\n" + "\n\n".join(
+        fit_lines(fact_list, noun="matching facts")
+    )
 
-        # Simple keyword search in titles and content
-        query_lower = query.lower()
-        matching_facts = []
-
-        for f in facts:
-            if (
-                query_lower in f.title.lower()
-                or query_lower in f.content.lower()
-                or query_lower in f.category.lower()
-            ):
-                matching_facts.append(f)
-
-        if not matching_facts:
-            return f"No information found for '{query}'. Available topics: {', '.join([f.title for f in facts])}"
 
-        fact_list = []
-        for f in matching_facts:
-            fact_list.append(f"**{f.title}:**\n{f.content}")
-        return f"**Search Results for '{query}':**\n\n" + "\n\n".join(fact_list)
+@tool
+async def retrieve_relevant_knowledge(customer_id: int, query: str, k: int = 5) -> str:
+    """Retrieve the business facts, services and policies most relevant to a question. Prefer this over loading the whole knowledge base."""
+    # The model sometimes asks for k=0; that is a request for the best match,
+    # not for nothing
+    results = await knowledge_store.search(customer_id, query, max(k, 1))
+    if not results:
+        # Only an empty index returns nothing; weak matches are filtered below
+        return "No business information available."
+    chunks = [text for score, key, text in results if score >= knowledge_min_score]
+    if not chunks:
+        return f"No relevant information found for '{query}'."
+    return f"**Relevant information for '{query}':**\n" + "\n".join(
+        fit_lines([f"- {chunk}" for chunk in chunks], noun="chunks")
+    )
 
 
 @tool
@@ -560,18 +2580,16 @@ async def add_business_fact(
 ) -> str:
     """Add a new business fact to the knowledge base. Use this when customers provide new information about the business that should be stored for future reference."""
     try:
-        async with async_session() as session:
-            new_fact = BusinessFact(
+        await write_queue.add(
+            BusinessFact(
                 customer_id=customer_id,
                 title=title,
                 content=content,
                 category=category,
                 is_public=True,
             )
-            session.add(new_fact)
-            await session.commit()
-            await session.refresh(new_fact)
-            return f"✅ Successfully stored: **{title}**\n{content}"
+        )
+        return f"✅ Successfully stored: **{title}**\n{content}"
     except Exception as e:
         return f"❌ Failed to store business fact: {str(e)}"
 
@@ -580,99 +2598,100 @@ async def add_business_fact(
 async def store_unanswered_question(customer_id: int, question: str) -> str:
     """Store an unanswered customer question for the business owner to review and respond to manually."""
     try:
-        from datetime import datetime
-
-        async with async_session() as session:
-            unanswered_question = UnansweredQuestion(
+        await write_queue.add(
+            UnansweredQuestion(
                 customer_id=customer_id,
                 question=question,
-                timestamp=datetime.now().isoformat(),
+                timestamp=dt.datetime.now(),
                 status="pending",
             )
-            session.add(unanswered_question)
-            await session.commit()
-            await session.refresh(unanswered_question)
-            return f"📝 Question stored for owner review: '{question}'"
+        )
+        return f"📝 Question stored for owner review: '{question}'"
     except Exception as e:
         return f"❌ Failed to store unanswered question: {str(e)}"
 
 
 @tool
-async def list_business_services(customer_id: int) -> str:
+async def list_business_services(
+    customer_id: int, limit: int = tool_row_limit
+) -> str:
     """Get all available business services and offerings."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessService).where(
-                BusinessService.customer_id == customer_id,
-                BusinessService.is_available == True,
-            )
-        )
-        services = result.scalars().all()
-        if not services:
-            return "No services are currently available."
+    services = [s for s in await kb_cache.get(customer_id, "services") if s.is_available]
+    if not services:
+        return "No services are currently available."
+    total = len(services)
+    # Cached rows are in id order, so the first by category are also the
+    # first by (category, id)
+    services = heapq.nsmallest(
+        clamp_limit(limit), services, key=attrgetter("category")
+    )
 
-        # Group services by category
-        categories = {}
-        for service in services:
-            if service.category not in categories:
-                categories[service.category] = []
-            categories[service.category].append(service)
-
-        response_parts = []
-        for category, service_list in categories.items():
-            response_parts.append(f"**{category.title()} Services:**")
-            for service in service_list:
-                price_info = f" - ${service.price}" if service.price else ""
-                duration_info = f" ({service.duration})" if service.duration else ""
-                desc_info = f" - {service.description}" if service.description else ""
-                response_parts.append(
-                    f"• **{service.name}**{price_info}{duration_info}{desc_info}"
-                )
-            response_parts.append("")  # Empty line between categories
+    # Group services by category; a category header rides along with the
+    # first service under it so the budget counts whole services
+    response_parts = []
+    current_category = None
+    for service in services:
+        price_info = f" - ${service.price}" if service.price else ""
+        duration_info = f" ({service.duration})" if service.duration else ""
+        desc_info = f" - {service.description}" if service.description else ""
+        line = f"• **{service.name}**{price_info}{duration_info}{desc_info}"
+        if service.category != current_category:
+            current_category = service.category
+            # Empty line between categories
+            line = f"\n**{service.category.title()} Services:**\n{line}"
+        response_parts.append(line)
 
-        return "\n".join(response_parts).strip()
+    return "\n".join(fit_lines(response_parts, total, "services")).strip()
 
 
 @tool
-async def search_business_services(customer_id: int, query: str) -> str:
-    """Search for specific business services by name or description."""
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessService).where(
-                BusinessService.customer_id == customer_id,
-                BusinessService.is_available == True,
+async def search_business_services(customer_id: int, query: str, limit: int = 5) -> str:
+    """Search for specific business services by name or description. Returns the best matches first."""
+    match = fts_query(query)
+    matching_services = []
+    if match:
+        async with db_reader() as session:
+            result = await session.execute(
+                text(
+                    "SELECT s.name, s.description, s.price, s.duration "
+                    "FROM business_services_fts "
+                    "JOIN business_services s ON s.id = business_services_fts.rowid "
+                    "WHERE business_services_fts MATCH :match "
+                    "AND s.customer_id = :customer_id AND s.is_available = 1 "
+                    "ORDER BY bm25(business_services_fts, 10.0, 1.0, 2.0) LIMIT :limit"
+                ),
+                {
+                    "match": match,
+                    "customer_id": customer_id,
+                    "limit": clamp_limit(limit),
+                },
             )
-        )
-        services = result.scalars().all()
+            matching_services = result.all()
 
-        if not services:
+    if not matching_services:
+        categories = {
+            s.category
+            for s in await kb_cache.get(customer_id, "services")
+            if s.is_available
+        }
+        if not categories:
             return "No services are currently available."
+        categories = fit_lines(sorted(categories), noun="categories")
+        return f"No services found matching '{query}'. Available categories: {', '.join(categories)}"
+
+    response_parts = []
+    for service in matching_services:
+        price_info = f" - ${service.price}" if service.price else ""
+        duration_info = f" ({service.duration})" if service.duration else ""
+        desc_info = f"\n  {service.description}" if service.description else ""
+        response_parts.append(
+            f"• **{service.name}**{price_info}{duration_info}{desc_info}"
+        )
 
-        # Simple keyword search
-        query_lower = query.lower()
-        matching_services = []
-
-        for service in services:
-            if (
-                query_lower in service.name.lower()
-                or (service.description and query_lower in service.description.lower())
-                or query_lower in service.category.lower()
-            ):
-                matching_services.append(service)
-
-        if not matching_services:
-            return f"No services found matching '{query}'. Available categories: {', '.join(set(s.category for s in services))}"
-
-        response_parts = [f"**Services matching '{query}':**"]
-        for service in matching_services:
-            price_info = f" - ${service.price}" if service.price else ""
-            duration_info = f" ({service.duration})" if service.duration else ""
-            desc_info = f"\n  {service.description}" if service.description else ""
-            response_parts.append(
-                f"• **{service.name}**{price_info}{duration_info}{desc_info}"
-            )
-
-        return "\n".join(response_parts)
+    return "\n".join(
+        [f"**Services matching '{query}':**"]
+        + fit_lines(response_parts, noun="matching services")
+    )
 
 
 @tool
@@ -686,8 +2705,8 @@ async def add_business_service(
 ) -> str:
     """Add a new business service or offering."""
     try:
-        async with async_session() as session:
-            new_service = BusinessService(
+        await write_queue.add(
+            BusinessService(
                 customer_id=customer_id,
                 name=name,
                 description=description,
@@ -696,15 +2715,11 @@ async def add_business_service(
                 duration=duration,
                 is_available=True,
             )
-            session.add(new_service)
-            await session.commit()
-            await session.refresh(new_service)
+        )
 
-            price_info = f" at ${price}" if price else ""
-            duration_info = f" ({duration})" if duration else ""
-            return (
-                f"✅ Successfully added service: **{name}**{price_info}{duration_info}"
-            )
+        price_info = f" at ${price}" if price else ""
+        duration_info = f" ({duration})" if duration else ""
+        return f"✅ Successfully added service: **{name}**{price_info}{duration_info}"
     except Exception as e:
         return f"❌ Failed to add service: {str(e)}"
 
@@ -716,27 +2731,28 @@ async def update_service_price_chat(
     new_price: float,
 ) -> str:
     """Update price of an existing service."""
-    try:
-        async with async_session() as session:
-            # Find service by name
-            result = await session.execute(
-                select(BusinessService).where(
-                    BusinessService.customer_id == customer_id,
-                    BusinessService.name == service_name,
-                    BusinessService.is_available == True,
-                )
-            )
-            service = result.scalar_one_or_none()
-
-            if not service:
-                return f"❌ Service '{service_name}' not found. Available services: {await list_business_services(customer_id)}"
 
-            old_price = service.price
-            service.price = new_price
-            await session.commit()
-            await session.refresh(service)
+    async def set_price(session):
+        # Find service by name
+        result = await session.execute(
+            select(BusinessService).where(
+                BusinessService.customer_id == customer_id,
+                BusinessService.name == service_name,
+                BusinessService.is_available == True,
+            )
+        )
+        service = result.scalar_one_or_none()
+        if not service:
+            return False, None
+        old_price = service.price
+        service.price = new_price
+        return True, old_price
 
-            return f"✅ Updated **{service_name}** price: ${old_price} → ${new_price}"
+    try:
+        found, old_price = await write_queue.run(set_price)
+        if not found:
+            return f"❌ Service '{service_name}' not found. Available services: {await list_business_services.coroutine(customer_id)}"
+        return f"✅ Updated **{service_name}** price: ${old_price} → ${new_price}"
     except Exception as e:
         return f"❌ Failed to update service price: {str(e)}"
 
@@ -747,37 +2763,37 @@ async def update_business_description_chat(
     description: str,
 ) -> str:
     """Update the business description."""
-    try:
-        async with async_session() as session:
-            # Check if business description fact exists
-            result = await session.execute(
-                select(BusinessFact).where(
-                    BusinessFact.customer_id == customer_id,
-                    BusinessFact.category == "general",
-                    BusinessFact.title == "Business Description",
-                )
+
+    async def set_description(session):
+        # Check if business description fact exists
+        result = await session.execute(
+            select(BusinessFact).where(
+                BusinessFact.customer_id == customer_id,
+                BusinessFact.category == "general",
+                BusinessFact.title == "Business Description",
             )
-            existing_fact = result.scalar_one_or_none()
-
-            if existing_fact:
-                # Update existing description
-                existing_fact.content = description
-                await session.commit()
-                await session.refresh(existing_fact)
-                return f"✅ Updated business description"
-            else:
-                # Create new description fact
-                new_fact = BusinessFact(
-                    customer_id=customer_id,
-                    title="Business Description",
-                    content=description,
-                    category="general",
-                    is_public=True,
-                )
-                session.add(new_fact)
-                await session.commit()
-                await session.refresh(new_fact)
-                return f"✅ Set business description"
+        )
+        existing_fact = result.scalar_one_or_none()
+        if existing_fact:
+            # Update existing description
+            existing_fact.content = description
+            return True
+        # Create new description fact
+        session.add(
+            BusinessFact(
+                customer_id=customer_id,
+                title="Business Description",
+                content=description,
+                category="general",
+                is_public=True,
+            )
+        )
+        return False
+
+    try:
+        if await write_queue.run(set_description):
+            return f"✅ Updated business description"
+        return f"✅ Set business description"
     except Exception as e:
         return f"❌ Failed to update business description: {str(e)}"
 
@@ -789,62 +2805,59 @@ async def update_business_location_chat(
     service_areas: Optional[str] = None,
 ) -> str:
     """Update business location and service areas."""
-    try:
-        async with async_session() as session:
-            # Update location fact
-            location_result = await session.execute(
-                select(BusinessFact).where(
-                    BusinessFact.customer_id == customer_id,
-                    BusinessFact.category == "location",
-                    BusinessFact.title == "Address",
-                )
-            )
-            location_fact = location_result.scalar_one_or_none()
 
-            if location_fact:
-                location_fact.content = address
-                await session.commit()
-                await session.refresh(location_fact)
-            else:
-                location_fact = BusinessFact(
+    async def set_location(session):
+        # Update location fact
+        location_result = await session.execute(
+            select(BusinessFact).where(
+                BusinessFact.customer_id == customer_id,
+                BusinessFact.category == "location",
+                BusinessFact.title == "Address",
+            )
+        )
+        location_fact = location_result.scalar_one_or_none()
+        if location_fact:
+            location_fact.content = address
+        else:
+            session.add(
+                BusinessFact(
                     customer_id=customer_id,
                     title="Address",
                     content=address,
                     category="location",
                     is_public=True,
                 )
-                session.add(location_fact)
-
-            # Update service areas if provided
-            if service_areas:
-                areas_result = await session.execute(
-                    select(BusinessFact).where(
-                        BusinessFact.customer_id == customer_id,
-                        BusinessFact.category == "location",
-                        BusinessFact.title == "Service Areas",
-                    )
-                )
-                areas_fact = areas_result.scalar_one_or_none()
+            )
 
-                if areas_fact:
-                    areas_fact.content = service_areas
-                    await session.commit()
-                    await session.refresh(areas_fact)
-                else:
-                    areas_fact = BusinessFact(
+        # Update service areas if provided
+        if service_areas:
+            areas_result = await session.execute(
+                select(BusinessFact).where(
+                    BusinessFact.customer_id == customer_id,
+                    BusinessFact.category == "location",
+                    BusinessFact.title == "Service Areas",
+                )
+            )
+            areas_fact = areas_result.scalar_one_or_none()
+            if areas_fact:
+                areas_fact.content = service_areas
+            else:
+                session.add(
+                    BusinessFact(
                         customer_id=customer_id,
                         title="Service Areas",
                         content=service_areas,
                         category="location",
                         is_public=True,
                     )
-                    session.add(areas_fact)
+                )
 
-            await session.commit()
-            response = f"✅ Updated business address: **{address}**"
-            if service_areas:
-                response += f"\n✅ Updated service areas: **{service_areas}**"
-            return response
+    try:
+        await write_queue.run(set_location)
+        response = f"✅ Updated business address: **{address}**"
+        if service_areas:
+            response += f"\n✅ Updated service areas: **{service_areas}**"
+        return response
     except Exception as e:
         return f"❌ Failed to update business location: {str(e)}"
 
@@ -858,9 +2871,9 @@ async def add_staff_member_chat(
 ) -> str:
     """Add a new staff member."""
     try:
-        async with async_session() as session:
-            # Create staff member as a business fact
-            staff_fact = BusinessFact(
+        # Create staff member as a business fact
+        await write_queue.add(
+            BusinessFact(
                 customer_id=customer_id,
                 title=f"Staff: {name}",
                 content=f"Role: {role}"
@@ -868,14 +2881,10 @@ async def add_staff_member_chat(
                 category="staff",
                 is_public=True,
             )
-            session.add(staff_fact)
-            await session.commit()
-            await session.refresh(staff_fact)
+        )
 
-            availability_info = (
-                f" with availability: {availability}" if availability else ""
-            )
-            return f"✅ Added staff member: **{name}** as **{role}**{availability_info}"
+        availability_info = f" with availability: {availability}" if availability else ""
+        return f"✅ Added staff member: **{name}** as **{role}**{availability_info}"
     except Exception as e:
         return f"❌ Failed to add staff member: {str(e)}"
 
@@ -889,26 +2898,24 @@ async def update_appointment_availability_chat(
 ) -> str:
     """Update appointment availability for a specific date."""
     try:
-        async with async_session() as session:
-            # Create availability fact
-            status = "available" if is_available else "unavailable"
-            content = f"Date: {date}\nStatus: {status}"
-            if reason:
-                content += f"\nReason: {reason}"
-
-            availability_fact = BusinessFact(
+        # Create availability fact
+        status = "available" if is_available else "unavailable"
+        content = f"Date: {date}\nStatus: {status}"
+        if reason:
+            content += f"\nReason: {reason}"
+
+        await write_queue.add(
+            BusinessFact(
                 customer_id=customer_id,
                 title=f"Availability: {date}",
                 content=content,
                 category="availability",
                 is_public=True,
             )
-            session.add(availability_fact)
-            await session.commit()
-            await session.refresh(availability_fact)
+        )
 
-            reason_info = f" ({reason})" if reason else ""
-            return f"✅ Updated availability for {date}: **{status}**{reason_info}"
+        reason_info = f" ({reason})" if reason else ""
+        return f"✅ Updated availability for {date}: **{status}**{reason_info}"
     except Exception as e:
         return f"❌ Failed to update appointment availability: {str(e)}"
 
@@ -922,61 +2929,52 @@ async def update_business_hours(
     is_closed: Optional[bool] = None,
 ) -> str:
     """Update business hours for a specific day."""
-    try:
-        async with async_session() as session:
-            # Check if hours exist for this day
-            result = await session.execute(
-                select(BusinessHours).where(
-                    BusinessHours.customer_id == customer_id,
-                    BusinessHours.day_of_week == day_of_week,
-                )
+
+    async def set_hours(session):
+        # Check if hours exist for this day
+        result = await session.execute(
+            select(BusinessHours).where(
+                BusinessHours.customer_id == customer_id,
+                BusinessHours.day_of_week == day_of_week,
             )
-            existing_hours = result.scalar_one_or_none()
-
-            days = [
-                "Monday",
-                "Tuesday",
-                "Wednesday",
-                "Thursday",
-                "Friday",
-                "Saturday",
-                "Sunday",
-            ]
-            day_name = days[day_of_week]
-
-            if existing_hours:
-                # Update existing hours
-                if open_time is not None:
-                    existing_hours.open_time = open_time
-                if close_time is not None:
-                    existing_hours.close_time = close_time
-                if is_closed is not None:
-                    existing_hours.is_closed = is_closed
-
-                await session.commit()
-                await session.refresh(existing_hours)
-
-                if existing_hours.is_closed:
-                    return f"✅ Updated {day_name}: **Closed**"
-                else:
-                    return f"✅ Updated {day_name}: **{existing_hours.open_time} - {existing_hours.close_time}**"
-            else:
-                # Create new hours entry
-                new_hours = BusinessHours(
-                    customer_id=customer_id,
-                    day_of_week=day_of_week,
-                    open_time=open_time or "09:00",
-                    close_time=close_time or "17:00",
-                    is_closed=is_closed or False,
-                )
-                session.add(new_hours)
-                await session.commit()
-                await session.refresh(new_hours)
+        )
+        existing_hours = result.scalar_one_or_none()
+        if existing_hours:
+            # Update existing hours
+            if open_time is not None:
+                existing_hours.open_time = open_time
+            if close_time is not None:
+                existing_hours.close_time = close_time
+            if is_closed is not None:
+                existing_hours.is_closed = is_closed
+            return "Updated", existing_hours
+        # Create new hours entry
+        new_hours = BusinessHours(
+            customer_id=customer_id,
+            day_of_week=day_of_week,
+            open_time=open_time or "09:00",
+            close_time=close_time or "17:00",
+            is_closed=is_closed or False,
+        )
+        session.add(new_hours)
+        return "Set", new_hours
 
-                if new_hours.is_closed:
-                    return f"✅ Set {day_name}: **Closed**"
-                else:
-                    return f"✅ Set {day_name}: **{new_hours.open_time} - {new_hours.close_time}**"
+    try:
+        days = [
+            "Monday",
+            "Tuesday",
+            "Wednesday",
+            "Thursday",
+            "Friday",
+            "Saturday",
+            "Sunday",
+        ]
+        day_name = days[day_of_week]
+
+        verb, hours = await write_queue.run(set_hours)
+        if hours.is_closed:
+            return f"✅ {verb} {day_name}: **Closed**"
+        return f"✅ {verb} {day_name}: **{hours.open_time} - {hours.close_time}**"
     except Exception as e:
         return f"❌ Failed to update business hours: {str(e)}"
 
@@ -988,27 +2986,28 @@ async def update_service_price(
     new_price: float,
 ) -> str:
     """Update the price of an existing service."""
-    try:
-        async with async_session() as session:
-            # Find the service by name
-            result = await session.execute(
-                select(BusinessService).where(
-                    BusinessService.customer_id == customer_id,
-                    BusinessService.name == service_name,
-                    BusinessService.is_available == True,
-                )
-            )
-            service = result.scalar_one_or_none()
 
-            if not service:
-                return f"❌ Service '{service_name}' not found. Available services: {await list_business_services(customer_id)}"
-
-            old_price = service.price
-            service.price = new_price
-            await session.commit()
-            await session.refresh(service)
+    async def set_price(session):
+        # Find the service by name
+        result = await session.execute(
+            select(BusinessService).where(
+                BusinessService.customer_id == customer_id,
+                BusinessService.name == service_name,
+                BusinessService.is_available == True,
+            )
+        )
+        service = result.scalar_one_or_none()
+        if not service:
+            return False, None
+        old_price = service.price
+        service.price = new_price
+        return True, old_price
 
-            return f"✅ Updated **{service_name}** price: ${old_price} → ${new_price}"
+    try:
+        found, old_price = await write_queue.run(set_price)
+        if not found:
+            return f"❌ Service '{service_name}' not found. Available services: {await list_business_services.coroutine(customer_id)}"
+        return f"✅ Updated **{service_name}** price: ${old_price} → ${new_price}"
     except Exception as e:
         return f"❌ Failed to update service price: {str(e)}"
 
@@ -1019,37 +3018,37 @@ async def update_business_description(
     description: str,
 ) -> str:
     """Update the business description."""
-    try:
-        async with async_session() as session:
-            # Check if business description fact exists
-            result = await session.execute(
-                select(BusinessFact).where(
-                    BusinessFact.customer_id == customer_id,
-                    BusinessFact.category == "general",
-                    BusinessFact.title == "Business Description",
-                )
+
+    async def set_description(session):
+        # Check if business description fact exists
+        result = await session.execute(
+            select(BusinessFact).where(
+                BusinessFact.customer_id == customer_id,
+                BusinessFact.category == "general",
+                BusinessFact.title == "Business Description",
             )
-            existing_fact = result.scalar_one_or_none()
-
-            if existing_fact:
-                # Update existing description
-                existing_fact.content = description
-                await session.commit()
-                await session.refresh(existing_fact)
-                return f"✅ Updated business description"
-            else:
-                # Create new description fact
-                new_fact = BusinessFact(
-                    customer_id=customer_id,
-                    title="Business Description",
-                    content=description,
-                    category="general",
-                    is_public=True,
-                )
-                session.add(new_fact)
-                await session.commit()
-                await session.refresh(new_fact)
-                return f"✅ Set business description"
+        )
+        existing_fact = result.scalar_one_or_none()
+        if existing_fact:
+            # Update existing description
+            existing_fact.content = description
+            return True
+        # Create new description fact
+        session.add(
+            BusinessFact(
+                customer_id=customer_id,
+                title="Business Description",
+                content=description,
+                category="general",
+                is_public=True,
+            )
+        )
+        return False
+
+    try:
+        if await write_queue.run(set_description):
+            return f"✅ Updated business description"
+        return f"✅ Set business description"
     except Exception as e:
         return f"❌ Failed to update business description: {str(e)}"
 
@@ -1061,62 +3060,59 @@ async def update_business_location(
     service_areas: Optional[str] = None,
 ) -> str:
     """Update business location and service areas."""
-    try:
-        async with async_session() as session:
-            # Update location fact
-            location_result = await session.execute(
-                select(BusinessFact).where(
-                    BusinessFact.customer_id == customer_id,
-                    BusinessFact.category == "location",
-                    BusinessFact.title == "Address",
-                )
-            )
-            location_fact = location_result.scalar_one_or_none()
 
-            if location_fact:
-                location_fact.content = address
-                await session.commit()
-                await session.refresh(location_fact)
-            else:
-                location_fact = BusinessFact(
+    async def set_location(session):
+        # Update location fact
+        location_result = await session.execute(
+            select(BusinessFact).where(
+                BusinessFact.customer_id == customer_id,
+                BusinessFact.category == "location",
+                BusinessFact.title == "Address",
+            )
+        )
+        location_fact = location_result.scalar_one_or_none()
+        if location_fact:
+            location_fact.content = address
+        else:
+            session.add(
+                BusinessFact(
                     customer_id=customer_id,
                     title="Address",
                     content=address,
                     category="location",
                     is_public=True,
                 )
-                session.add(location_fact)
-
-            # Update service areas if provided
-            if service_areas:
-                areas_result = await session.execute(
-                    select(BusinessFact).where(
-                        BusinessFact.customer_id == customer_id,
-                        BusinessFact.category == "location",
-                        BusinessFact.title == "Service Areas",
-                    )
-                )
-                areas_fact = areas_result.scalar_one_or_none()
+            )
 
-                if areas_fact:
-                    areas_fact.content = service_areas
-                    await session.commit()
-                    await session.refresh(areas_fact)
-                else:
-                    areas_fact = BusinessFact(
+        # Update service areas if provided
+        if service_areas:
+            areas_result = await session.execute(
+                select(BusinessFact).where(
+                    BusinessFact.customer_id == customer_id,
+                    BusinessFact.category == "location",
+                    BusinessFact.title == "Service Areas",
+                )
+            )
+            areas_fact = areas_result.scalar_one_or_none()
+            if areas_fact:
+                areas_fact.content = service_areas
+            else:
+                session.add(
+                    BusinessFact(
                         customer_id=customer_id,
                         title="Service Areas",
                         content=service_areas,
                         category="location",
                         is_public=True,
                     )
-                    session.add(areas_fact)
+                )
 
-            await session.commit()
-            response = f"✅ Updated business address: **{address}**"
-            if service_areas:
-                response += f"\n✅ Updated service areas: **{service_areas}**"
-            return response
+    try:
+        await write_queue.run(set_location)
+        response = f"✅ Updated business address: **{address}**"
+        if service_areas:
+            response += f"\n✅ Updated service areas: **{service_areas}**"
+        return response
     except Exception as e:
         return f"❌ Failed to update business location: {str(e)}"
 
@@ -1130,9 +3126,9 @@ async def add_staff_member(
 ) -> str:
     """Add a new staff member."""
     try:
-        async with async_session() as session:
-            # Create staff member as a business fact
-            staff_fact = BusinessFact(
+        # Create staff member as a business fact
+        await write_queue.add(
+            BusinessFact(
                 customer_id=customer_id,
                 title=f"Staff: {name}",
                 content=f"Role: {role}"
@@ -1140,14 +3136,10 @@ async def add_staff_member(
                 category="staff",
                 is_public=True,
             )
-            session.add(staff_fact)
-            await session.commit()
-            await session.refresh(staff_fact)
+        )
 
-            availability_info = (
-                f" with availability: {availability}" if availability else ""
-            )
-            return f"✅ Added staff member: **{name}** as **{role}**{availability_info}"
+        availability_info = f" with availability: {availability}" if availability else ""
+        return f"✅ Added staff member: **{name}** as **{role}**{availability_info}"
     except Exception as e:
         return f"❌ Failed to add staff member: {str(e)}"
 
@@ -1161,65 +3153,606 @@ async def update_appointment_availability(
 ) -> str:
     """Update appointment availability for a specific date."""
     try:
-        async with async_session() as session:
-            # Create availability fact
-            status = "available" if is_available else "unavailable"
-            content = f"Date: {date}\nStatus: {status}"
-            if reason:
-                content += f"\nReason: {reason}"
-
-            availability_fact = BusinessFact(
+        # Create availability fact
+        status = "available" if is_available else "unavailable"
+        content = f"Date: {date}\nStatus: {status}"
+        if reason:
+            content += f"\nReason: {reason}"
+
+        await write_queue.add(
+            BusinessFact(
                 customer_id=customer_id,
                 title=f"Availability: {date}",
                 content=content,
                 category="availability",
                 is_public=True,
             )
-            session.add(availability_fact)
-            await session.commit()
-            await session.refresh(availability_fact)
+        )
 
-            reason_info = f" ({reason})" if reason else ""
-            return f"✅ Updated availability for {date}: **{status}**{reason_info}"
+        reason_info = f" ({reason})" if reason else ""
+        return f"✅ Updated availability for {date}: **{status}**{reason_info}"
     except Exception as e:
         return f"❌ Failed to update appointment availability: {str(e)}"
 
 
+def truncate_to_budget(text: str) -> str:
+    """Last-resort cap for a tool result that ignored its own budget."""
+    max_chars = tool_output_token_budget * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + "\n… (truncated)"
+
+
+class ToolRegistry:
+    """Maps tool names to their coroutines and runs a turn's tool calls.
+
+    Consecutive read-only calls run concurrently; writes run one at a time in
+    the order the model returned them. Every call is timed.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.timings = {}
+
+    def register(
+        self,
+        chat_tool,
+        read_only: bool = False,
+        direct_answer: bool = False,
+        kb_only: bool = False,
+    ):
+        """direct_answer tools return a user-ready reply, so a turn made up
+        only of them needs no second model call. kb_only tools read nothing
+        but knowledge base tables, whose changes bump kb_revisions, so replies
+        built from them can be cached."""
+        self._entries[chat_tool.name] = {
+            "tool": chat_tool,
+            "coroutine": chat_tool.coroutine,
+            "args_schema": chat_tool.args_schema,
+            "read_only": read_only or kb_only,
+            "direct_answer": direct_answer,
+            "kb_only": kb_only,
+        }
+
+    @property
+    def tools(self):
+        return [entry["tool"] for entry in self._entries.values()]
+
+    def is_read_only(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return bool(entry and entry["read_only"])
+
+    def is_direct_answer(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return bool(entry and entry["direct_answer"])
+
+    def is_kb_only(self, name: str) -> bool:
+        entry = self._entries.get(name)
+        return bool(entry and entry["kb_only"])
+
+    def _record(self, name: str, seconds: float, failed: bool):
+        stats = self.timings.setdefault(
+            name, {"calls": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+        stats["calls"] += 1
+        stats["errors"] += int(failed)
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    async def run_call(
+        self, tool_call: dict, customer_id: Optional[int], emit=None
+    ) -> str:
+        name = tool_call["name"]
+        entry = self._entries.get(name)
+        if emit is not None:
+            await emit("tool_start", {"name": name})
+        started = time.perf_counter()
+        # Unknown tools and bad arguments are recorded as failed calls too
+        failed = True
+        try:
+            if entry is None:
+                return "Unknown tool"
+
+            tool_args = dict(tool_call["args"])
+            # Add customer_id to args if not present
+            if "customer_id" not in tool_args and customer_id:
+                tool_args["customer_id"] = customer_id
+            try:
+                validated = dict(entry["args_schema"](**tool_args))
+            except Exception as e:
+                return f"❌ Invalid arguments for {name}: {str(e)}"
+
+            try:
+                result = truncate_to_budget(await entry["coroutine"](**validated))
+            except Exception as e:
+                return f"❌ {name} failed: {str(e)}"
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            self._record(name, seconds, failed)
+            if emit is not None:
+                await emit(
+                    "tool_end",
+                    {"name": name, "ok": not failed, "ms": round(seconds * 1000, 2)},
+                )
+
+    async def run_calls(
+        self, tool_calls: list, customer_id: Optional[int], emit=None
+    ) -> List[str]:
+        results = []
+        batch = []
+        for tool_call in tool_calls:
+            if self.is_read_only(tool_call["name"]):
+                batch.append(tool_call)
+                continue
+            if batch:
+                results.extend(await self._run_concurrently(batch, customer_id, emit))
+                batch = []
+            results.append(await self.run_call(tool_call, customer_id, emit))
+        if batch:
+            results.extend(await self._run_concurrently(batch, customer_id, emit))
+        return results
+
+    async def _run_concurrently(
+        self, tool_calls: list, customer_id: Optional[int], emit=None
+    ):
+        return await asyncio.gather(
+            *(self.run_call(tool_call, customer_id, emit) for tool_call in tool_calls)
+        )
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                **stats,
+                "avg_seconds": round(stats["total_seconds"] / stats["calls"], 6),
+                "total_seconds": round(stats["total_seconds"], 6),
+                "max_seconds": round(stats["max_seconds"], 6),
+            }
+            for name, stats in self.timings.items()
+        }
+
+
+# Tools the model can call from /api/chat
+tool_registry = ToolRegistry()
+for read_tool in [
+    get_customer_services,
+    get_customer_appointments,
+    get_customer_schedule,
+    get_customer_revenue,
+    get_customer_revenue_trend,
+    get_customer_inventory,
+    get_all_customers,
+]:
+    tool_registry.register(read_tool, read_only=True)
+for kb_tool in [
+    get_customer_business_hours,
+    get_customer_business_facts,
+    search_business_facts,
+    retrieve_relevant_knowledge,
+    list_business_services,
+    search_business_services,
+]:
+    tool_registry.register(kb_tool, kb_only=True)
+for write_tool in [
+    add_business_fact,
+    add_business_service,
+    store_unanswered_question,
+    update_business_hours,
+    update_service_price_chat,
+    update_business_description_chat,
+    update_business_location_chat,
+    add_staff_member_chat,
+    update_appointment_availability_chat,
+]:
+    # Write tools already reply with a confirmation such as "✅ Updated ..."
+    tool_registry.register(write_tool, direct_answer=True)
+
+# Converted once at startup and shared by every pooled client
+chat_tool_schemas = [convert_to_openai_tool(t) for t in tool_registry.tools]
+
+
+class IntentRouter:
+    """Answers structured questions by running one read tool directly.
+
+    Regex rules and a small softmax-regression model over embed_text
+    features vote on an intent. Messages that look like updates, or that the
+    router is unsure about, fall through to the LLM.
+    """
+
+    # intent -> tool that answers it
+    INTENT_TOOLS = {
+        "hours": "get_customer_business_hours",
+        "services": "list_business_services",
+        "revenue": "get_customer_revenue",
+        "inventory": "get_customer_inventory",
+        "appointments": "get_customer_appointments",
+        "schedule": "get_customer_schedule",
+    }
+    RULES = {
+        "hours": r"\b(hours|opening times?|what time do you (open|close)|when do you (open|close)|are you open)\b",
+        "services": r"\b(menu|services|what do you (offer|sell|serve)|offerings)\b",
+        "revenue": r"\b(revenue|sales|earnings|how much (did|have) (we|i) (make|made|earn))\b",
+        "inventory": r"\b(inventory|stock levels?|in stock)\b",
+        "appointments": r"\b(appointments|bookings)\b",
+        "schedule": r"\b(schedule|calendar)\b",
+    }
+    # Owner updates and anything date-specific need the model
+    WRITE_GUARD = (
+        r"\b(change|update|set|add|remove|delete|raise|lower|now|new|closed this"
+        r"|we're|we are|cancel|book|yesterday|tomorrow|last|next|week|month)\b"
+        r"|\d|\$"
+    )
+    TRAINING_EXAMPLES = {
+        "hours": [
+            "what are your hours",
+            "when do you open",
+            "when do you close today",
+            "are you open on sunday",
+            "opening times",
+            "what time do you open on saturday",
+            "business hours please",
+            "how late are you open",
+        ],
+        "services": [
+            "what services do you offer",
+            "can i see the menu",
+            "what do you sell",
+            "show me your menu",
+            "list your services",
+            "what food do you have",
+            "what treatments are available",
+            "what's on the menu",
+        ],
+        "revenue": [
+            "what's my revenue today",
+            "how much did we make today",
+            "today's sales",
+            "show revenue",
+            "how are sales today",
+            "total earnings today",
+        ],
+        "inventory": [
+            "what's in stock",
+            "show inventory",
+            "inventory levels",
+            "how many units do we have left",
+            "what products do we have in stock",
+            "stock check",
+        ],
+        "appointments": [
+            "show my appointments",
+            "list appointments",
+            "what bookings do we have",
+            "any appointments coming up",
+            "upcoming bookings",
+            "who is booked",
+        ],
+        "schedule": [
+            "show my schedule",
+            "what's on the calendar",
+            "full schedule please",
+            "what does my schedule look like",
+            "calendar overview",
+        ],
+        "other": [
+            "hello",
+            "thanks so much",
+            "do you have parking",
+            "where are you located",
+            "what is your refund policy",
+            "can i bring my dog",
+            "is there wifi",
+            "tell me about the owner",
+            "do you take credit cards",
+            "i want to speak to a human",
+            "we are closed this friday for a private event",
+            "our facial treatment is now 120",
+            "add pumpkin muffins to the menu",
+            "update our saturday hours",
+            "dentist patel is unavailable next thursday",
+        ],
+    }
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.intents = list(self.TRAINING_EXAMPLES)
+        self._rules = {
+            intent: re.compile(pattern) for intent, pattern in self.RULES.items()
+        }
+        self._guard = re.compile(self.WRITE_GUARD)
+        self.weights, self.bias = self._train()
+        self.routed = {}
+        self.fallthrough = 0
+        self.saved_seconds = 0.0
+        # Moving average of the LLM path, used to estimate saved latency
+        self.llm_seconds_avg = None
+
+    def _train(self, iterations: int = 300, lr: float = 0.5, l2: float = 1e-3):
+        rows = []
+        labels = []
+        for label, examples in self.TRAINING_EXAMPLES.items():
+            for example in examples:
+                rows.append(embed_text(example))
+                labels.append(self.intents.index(label))
+        x = np.stack(rows)
+        y = np.eye(len(self.intents), dtype=np.float32)[labels]
+        weights = np.zeros((x.shape[1], len(self.intents)), dtype=np.float32)
+        bias = np.zeros(len(self.intents), dtype=np.float32)
+        for _ in range(iterations):
+            probs = self._softmax(x @ weights + bias)
+            grad = probs - y
+            weights -= lr * (x.T @ grad / len(x) + l2 * weights)
+            bias -= lr * grad.mean(axis=0)
+        return weights, bias
+
+    @staticmethod
+    def _softmax(logits):
+        exp = np.exp(logits - logits.max(axis=-1, keepdims=True))
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def classify(self, message: str):
+        """Return (intent, confidence); intent is None for "other"."""
+        text = normalize_message(message)
+        if self._guard.search(text):
+            return None, 0.0
+        probs = self._softmax(embed_text(text) @ self.weights + self.bias)
+        rule_hits = [i for i, rule in self._rules.items() if rule.search(text)]
+        if len(rule_hits) == 1:
+            intent = rule_hits[0]
+            confidence = 0.6 + 0.4 * float(probs[self.intents.index(intent)])
+        else:
+            best = int(np.argmax(probs))
+            intent = self.intents[best]
+            confidence = 0.9 * float(probs[best])
+        if intent == "other":
+            return None, confidence
+        return intent, confidence
+
+    def route(self, message: str):
+        """Return (tool_name, intent, confidence) or (None, intent, confidence)."""
+        intent, confidence = self.classify(message)
+        if intent is None or confidence < self.threshold:
+            self.fallthrough += 1
+            return None, intent, confidence
+        return self.INTENT_TOOLS[intent], intent, confidence
+
+    def record_routed(self, intent: str, seconds: float) -> float:
+        self.routed[intent] = self.routed.get(intent, 0) + 1
+        saved = max((self.llm_seconds_avg or 0.0) - seconds, 0.0)
+        self.saved_seconds += saved
+        return saved
+
+    def record_llm(self, seconds: float):
+        if self.llm_seconds_avg is None:
+            self.llm_seconds_avg = seconds
+        else:
+            self.llm_seconds_avg = 0.9 * self.llm_seconds_avg + 0.1 * seconds
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "routed": self.routed,
+            "fallthrough": self.fallthrough,
+            "estimated_saved_seconds": round(self.saved_seconds, 3),
+            "llm_seconds_avg": round(self.llm_seconds_avg or 0.0, 3),
+        }
+
+
+intent_router_enabled = os.environ.get("INTENT_ROUTER_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+intent_router = IntentRouter(
+    threshold=float(os.environ.get("INTENT_ROUTER_THRESHOLD", "0.8"))
+)
+
+
+class LLMPool:
+    """Bounded LRU of Gemini clients, each paired with its tool-bound runnable.
+
+    Reusing a client keeps its transport (and open connections) alive across
+    requests instead of paying construction and TLS setup per message.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._clients = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.construction_seconds = 0.0
+
+    def get(self, api_key: str, model: str, temperature: float, max_tokens: int):
+        key = (api_key, model, temperature, max_tokens)
+        entry = self._clients.get(key)
+        if entry is not None:
+            self._clients.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        started = time.perf_counter()
+        llm = ChatGoogleGenerativeAI(
+            model=model,
+            google_api_key=api_key,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        entry = (llm, llm.bind_tools(chat_tool_schemas))
+        self.construction_seconds += time.perf_counter() - started
+
+        self._clients[key] = entry
+        if len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._clients),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "construction_seconds": round(self.construction_seconds, 6),
+        }
+
+
+llm_pool = LLMPool(max_size=int(os.environ.get("LLM_POOL_SIZE", "32")))
+
+
+# Page sizes for the list endpoints; larger limits are capped at the maximum
+api_page_size = int(os.environ.get("API_PAGE_SIZE", "100"))
+api_max_page_size = int(os.environ.get("API_MAX_PAGE_SIZE", "500"))
+
+
+async def fetch_page(
+    session, response: Response, stmt, model, cursor: Optional[int], limit: Optional[int]
+):
+    """Run stmt for one keyset page: rows with id > cursor in id order. When
+    more rows follow, the last id is returned in the X-Next-Cursor header to
+    pass back as cursor."""
+    size = min(limit or api_page_size, api_max_page_size)
+    if cursor is not None:
+        stmt = stmt.where(model.id > cursor)
+    result = await session.execute(stmt.order_by(model.id).limit(size + 1))
+    rows = result.scalars().all()
+    if len(rows) > size:
+        rows = rows[:size]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows
+
+
+def page_rows(
+    response: Response, rows, cursor: Optional[int], limit: Optional[int]
+) -> list:
+    """fetch_page over rows already in memory in id order, e.g. from kb_cache."""
+    size = min(limit or api_page_size, api_max_page_size)
+    if cursor is not None:
+        rows = rows[bisect.bisect_right(rows, cursor, key=attrgetter("id")) :]
+    if len(rows) > size:
+        rows = rows[:size]
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return list(rows)
+
+
+# Single-row write statements by (kind, table, columns). They take their
+# values as bound parameters, so each shape is built and compiled once.
+row_statements = {}
+
+
+def row_statement(kind: str, table, columns: tuple = ()):
+    key = (kind, table, columns)
+    stmt = row_statements.get(key)
+    if stmt is None:
+        if kind == "update":
+            stmt = (
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values({name: bindparam(f"new_{name}") for name in columns})
+                .returning(*table.c)
+            )
+        elif kind == "delete":
+            stmt = delete(table).where(table.c.id == bindparam("row_id")).returning(*table.c)
+        else:
+            stmt = invoice_revenue_delta(columns)
+        row_statements[key] = stmt
+    return stmt
+
+
+async def update_row(model, row_id: int, values: dict):
+    """Set values on the model row with row_id with a single UPDATE ...
+    RETURNING through the write queue. Returns the updated row, or None when
+    there is no such row."""
+    columns = tuple(values)
+    params = {f"new_{name}": value for name, value in values.items()}
+    params["row_id"] = row_id
+
+    async def apply(session):
+        if model is Invoice:
+            # RETURNING only sees the new row, so revenue_daily is adjusted
+            # first, while the old amount is still there to read
+            await session.execute(row_statement("revenue", model.__table__, columns), params)
+        stmt = row_statement("update", model.__table__, columns)
+        row = (await session.execute(stmt, params)).one_or_none()
+        if row is not None:
+            track_statement_changes(session, model, [row])
+        return row
+
+    return await write_queue.run(apply)
+
+
+async def delete_row(model, row_id: int) -> bool:
+    """Delete the model row with row_id with a single DELETE ... RETURNING
+    through the write queue, returning whether it existed."""
+
+    async def apply(session):
+        stmt = row_statement("delete", model.__table__)
+        row = (await session.execute(stmt, {"row_id": row_id})).one_or_none()
+        if row is None:
+            return False
+        track_statement_changes(session, model, [row], deleted=True)
+        if model is Invoice and row.status == "paid":
+            await session.execute(
+                revenue_upsert(
+                    [
+                        {
+                            "customer_id": row.customer_id,
+                            "day": row.created_date,
+                            "total_amount": -row.total_amount,
+                            "invoice_count": -1,
+                        }
+                    ]
+                )
+            )
+        return True
+
+    return await write_queue.run(apply)
+
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Simple API"}
 
 
 @app.get("/api/customers", response_model=List[CustomerModel])
-async def get_customers():
-    async with async_session() as session:
-        result = await session.execute(select(Customer))
-        customers = result.scalars().all()
-        return customers
+async def get_customers(
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    return await fetch_page(
+        session,
+        response,
+        select(Customer),
+        Customer,
+        cursor,
+        limit,
+    )
 
 
 @app.get("/api/customers/{customer_id}", response_model=CustomerModel)
 async def get_customer(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Customer).where(Customer.id == customer_id)
-        )
-        customer = result.scalar_one_or_none()
-        if customer:
-            return customer
-        return {"error": "Customer not found"}
+    customer = await kb_cache.get_one(customer_id, "customer")
+    if customer:
+        return customer
+    return {"error": "Customer not found"}
 
 
 @app.get("/api/customers/telegram/{telegram_id}", response_model=CustomerModel)
-async def get_customer_by_telegram(telegram_id: str):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Customer).where(Customer.telegram_id == telegram_id)
-        )
-        customer = result.scalar_one_or_none()
-        if customer:
-            return customer
-        return {"error": "Customer not found"}
+async def get_customer_by_telegram(
+    telegram_id: str, session: AsyncSession = Depends(get_db)
+):
+    result = await session.execute(
+        select(Customer).where(Customer.telegram_id == telegram_id)
+    )
+    customer = result.scalar_one_or_none()
+    if customer:
+        return customer
+    return {"error": "Customer not found"}
 
 
 @app.post("/api/customers", response_model=CustomerModel)
@@ -1232,29 +3765,39 @@ async def create_customer(customer: CustomerModel):
         business_type=customer.business_type,
         business_address=customer.business_address,
     )
-    async with async_session() as session:
-        session.add(new_customer)
-        await session.commit()
-        await session.refresh(new_customer)
-        return new_customer
+    return await write_queue.add(new_customer)
 
 
 @app.get("/api/logs", response_model=List[LogModel])
-async def get_logs():
-    async with async_session() as session:
-        result = await session.execute(select(Log))
-        logs = result.scalars().all()
-        return logs
+async def get_logs(
+    response: Response,
+    customer_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    stmt = select(Log)
+    if customer_id is not None:
+        stmt = stmt.where(Log.customer_id == customer_id)
+    return await fetch_page(session, response, stmt, Log, cursor, limit)
 
 
 @app.get("/api/services/{customer_id}", response_model=List[ServiceModel])
-async def get_services(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Service).where(Service.customer_id == customer_id)
-        )
-        services = result.scalars().all()
-        return services
+async def get_services(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    return await fetch_page(
+        session,
+        response,
+        select(Service).where(Service.customer_id == customer_id),
+        Service,
+        cursor,
+        limit,
+    )
 
 
 @app.post("/api/services", response_model=ServiceModel)
@@ -1266,62 +3809,72 @@ async def create_service(service: ServiceModel):
         price=service.price,
         duration=service.duration,
     )
-    async with async_session() as session:
-        session.add(new_service)
-        await session.commit()
-        await session.refresh(new_service)
-        return new_service
+    return await write_queue.add(new_service)
 
 
 @app.put("/api/services/{service_id}", response_model=ServiceModel)
 async def update_service(service_id: int, service: ServiceModel):
-    async with async_session() as session:
-        result = await session.execute(select(Service).where(Service.id == service_id))
-        existing_service = result.scalar_one_or_none()
-        if existing_service:
-            existing_service.name = service.name
-            existing_service.description = service.description
-            existing_service.price = service.price
-            existing_service.duration = service.duration
-            await session.commit()
-            await session.refresh(existing_service)
-            return existing_service
-        return {"error": "Service not found"}
+    existing_service = await update_row(
+        Service,
+        service_id,
+        {
+            "name": service.name,
+            "description": service.description,
+            "price": service.price,
+            "duration": service.duration,
+        },
+    )
+    if not existing_service:
+        raise HTTPException(status_code=404, detail="Service not found")
+    return existing_service
 
 
 @app.get("/api/inventory/{customer_id}", response_model=List[InventoryModel])
-async def get_inventory(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(InventoryItem).where(InventoryItem.customer_id == customer_id)
-        )
-        inventory = result.scalars().all()
-        return inventory
+async def get_inventory(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    return await fetch_page(
+        session,
+        response,
+        select(InventoryItem).where(InventoryItem.customer_id == customer_id),
+        InventoryItem,
+        cursor,
+        limit,
+    )
 
 
 @app.post("/api/inventory", response_model=InventoryModel)
 async def create_inventory_item(item: InventoryModel):
     new_item = InventoryItem(
+        customer_id=item.customer_id,
         name=item.name,
         quantity=item.quantity,
         price=item.price,
         category=item.category,
     )
-    async with async_session() as session:
-        session.add(new_item)
-        await session.commit()
-        await session.refresh(new_item)
-        return new_item
+    return await write_queue.add(new_item)
 
 
 @app.get("/api/appointments/{customer_id}", response_model=List[AppointmentModel])
-async def get_appointments(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Appointment).where(Appointment.customer_id == customer_id)
-        )
-        appointments = result.scalars().all()
-        return appointments
+async def get_appointments(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    return await fetch_page(
+        session,
+        response,
+        select(Appointment).where(Appointment.customer_id == customer_id),
+        Appointment,
+        cursor,
+        limit,
+    )
 
 
 @app.post("/api/appointments", response_model=AppointmentModel)
@@ -1334,19 +3887,21 @@ async def create_appointment(appointment: AppointmentModel):
         status=appointment.status,
         notes=appointment.notes,
     )
-    async with async_session() as session:
-        session.add(new_appointment)
-        await session.commit()
-        await session.refresh(new_appointment)
-        return new_appointment
+    return await write_queue.add(new_appointment)
 
 
 @app.get("/api/invoices", response_model=List[InvoiceModel])
-async def get_invoices():
-    async with async_session() as session:
-        result = await session.execute(select(Invoice))
-        invoices = result.scalars().all()
-        return invoices
+async def get_invoices(
+    response: Response,
+    customer_id: Optional[int] = None,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    stmt = select(Invoice)
+    if customer_id is not None:
+        stmt = stmt.where(Invoice.customer_id == customer_id)
+    return await fetch_page(session, response, stmt, Invoice, cursor, limit)
 
 
 @app.post("/api/invoices", response_model=InvoiceModel)
@@ -1360,21 +3915,37 @@ async def create_invoice(invoice: InvoiceModel):
         due_date=invoice.due_date,
         items=invoice.items,
     )
-    async with async_session() as session:
-        session.add(new_invoice)
-        await session.commit()
-        await session.refresh(new_invoice)
-        return new_invoice
+    return await write_queue.add(new_invoice)
+
+
+@app.put("/api/invoices/{invoice_id}", response_model=InvoiceModel)
+async def update_invoice(invoice_id: int, invoice: InvoiceModel):
+    db_invoice = await update_row(
+        Invoice,
+        invoice_id,
+        {
+            "appointment_id": invoice.appointment_id,
+            "total_amount": invoice.total_amount,
+            "status": invoice.status,
+            "created_date": invoice.created_date,
+            "due_date": invoice.due_date,
+            "items": invoice.items,
+        },
+    )
+    if not db_invoice:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return db_invoice
 
 
 @app.get("/api/business-hours/{customer_id}", response_model=List[BusinessHoursModel])
-async def get_business_hours(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessHours).where(BusinessHours.customer_id == customer_id)
-        )
-        hours = result.scalars().all()
-        return hours
+async def get_business_hours(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    hours = await kb_cache.get(customer_id, "hours")
+    return page_rows(response, hours, cursor, limit)
 
 
 @app.post("/api/business-hours", response_model=BusinessHoursModel)
@@ -1386,65 +3957,57 @@ async def create_business_hours(hours: BusinessHoursModel):
         close_time=hours.close_time,
         is_closed=hours.is_closed,
     )
-    async with async_session() as session:
-        session.add(new_hours)
-        await session.commit()
-        await session.refresh(new_hours)
-        return new_hours
+    return await write_queue.add(new_hours)
 
 
 @app.put("/api/business-hours/{hours_id}", response_model=BusinessHoursModel)
 async def update_business_hours_endpoint(hours_id: int, hours: BusinessHoursModel):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessHours).where(BusinessHours.id == hours_id)
-        )
-        existing_hours = result.scalar_one_or_none()
-        if existing_hours:
-            existing_hours.day_of_week = hours.day_of_week
-            existing_hours.open_time = hours.open_time
-            existing_hours.close_time = hours.close_time
-            existing_hours.is_closed = hours.is_closed
-            await session.commit()
-            await session.refresh(existing_hours)
-            return existing_hours
-        return {"error": "Business hours not found"}
+    existing_hours = await update_row(
+        BusinessHours,
+        hours_id,
+        {
+            "day_of_week": hours.day_of_week,
+            "open_time": hours.open_time,
+            "close_time": hours.close_time,
+            "is_closed": hours.is_closed,
+        },
+    )
+    if not existing_hours:
+        raise HTTPException(status_code=404, detail="Business hours not found")
+    return existing_hours
 
 
 @app.get("/api/policies/{customer_id}", response_model=List[PolicyModel])
-async def get_policies(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Policy).where(Policy.customer_id == customer_id)
-        )
-        policies = result.scalars().all()
-        return policies
+async def get_policies(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    policies = await kb_cache.get(customer_id, "policies")
+    return page_rows(response, policies, cursor, limit)
 
 
 @app.post("/api/policies", response_model=PolicyModel)
 async def create_policy(policy: PolicyModel):
     new_policy = Policy(
+        customer_id=policy.customer_id,
         title=policy.title,
         content=policy.content,
         category=policy.category,
     )
-    async with async_session() as session:
-        session.add(new_policy)
-        await session.commit()
-        await session.refresh(new_policy)
-        return new_policy
+    return await write_queue.add(new_policy)
 
 
 @app.get("/api/business-facts/{customer_id}", response_model=List[BusinessFactModel])
-async def get_business_facts(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessFact).where(
-                BusinessFact.customer_id == customer_id, BusinessFact.is_public == True
-            )
-        )
-        facts = result.scalars().all()
-        return facts
+async def get_business_facts(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    facts = [f for f in await kb_cache.get(customer_id, "facts") if f.is_public]
+    return page_rows(response, facts, cursor, limit)
 
 
 @app.post("/api/business-facts", response_model=BusinessFactModel)
@@ -1456,26 +4019,22 @@ async def create_business_fact(fact: BusinessFactModel):
         category=fact.category,
         is_public=fact.is_public,
     )
-    async with async_session() as session:
-        session.add(new_fact)
-        await session.commit()
-        await session.refresh(new_fact)
-        return new_fact
+    return await write_queue.add(new_fact)
 
 
 @app.get(
     "/api/business-services/{customer_id}", response_model=List[BusinessServiceModel]
 )
-async def get_business_services(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessService).where(
-                BusinessService.customer_id == customer_id,
-                BusinessService.is_available == True,
-            )
-        )
-        services = result.scalars().all()
-        return services
+async def get_business_services(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    services = [
+        s for s in await kb_cache.get(customer_id, "services") if s.is_available
+    ]
+    return page_rows(response, services, cursor, limit)
 
 
 @app.post("/api/business-services", response_model=BusinessServiceModel)
@@ -1490,26 +4049,30 @@ async def create_business_service(service: BusinessServiceModel):
         is_available=service.is_available,
         custom_data=service.custom_data,
     )
-    async with async_session() as session:
-        session.add(new_service)
-        await session.commit()
-        await session.refresh(new_service)
-        return new_service
+    return await write_queue.add(new_service)
 
 
 @app.get(
     "/api/unanswered-questions/{customer_id}",
     response_model=List[UnansweredQuestionModel],
 )
-async def get_unanswered_questions(customer_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(UnansweredQuestion).where(
-                UnansweredQuestion.customer_id == customer_id
-            )
-        )
-        questions = result.scalars().all()
-        return questions
+async def get_unanswered_questions(
+    customer_id: int,
+    response: Response,
+    cursor: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    session: AsyncSession = Depends(get_db),
+):
+    return await fetch_page(
+        session,
+        response,
+        select(UnansweredQuestion).where(
+            UnansweredQuestion.customer_id == customer_id
+        ),
+        UnansweredQuestion,
+        cursor,
+        limit,
+    )
 
 
 @app.post("/api/unanswered-questions", response_model=UnansweredQuestionModel)
@@ -1521,11 +4084,7 @@ async def create_unanswered_question(question: UnansweredQuestionModel):
         status=question.status,
         response=question.response,
     )
-    async with async_session() as session:
-        session.add(new_question)
-        await session.commit()
-        await session.refresh(new_question)
-        return new_question
+    return await write_queue.add(new_question)
 
 
 @app.put(
@@ -1534,59 +4093,421 @@ async def create_unanswered_question(question: UnansweredQuestionModel):
 async def update_unanswered_question(
     question_id: int, question: UnansweredQuestionModel
 ):
-    async with async_session() as session:
-        result = await session.execute(
-            select(UnansweredQuestion).where(UnansweredQuestion.id == question_id)
+    db_question = await update_row(
+        UnansweredQuestion,
+        question_id,
+        {"status": question.status, "response": question.response},
+    )
+    if not db_question:
+        raise HTTPException(status_code=404, detail="Question not found")
+    return db_question
+
+
+# Exportable tables and the column their from/to date filters apply to
+EXPORT_TABLES = {
+    "logs": (Log.__table__, Log.__table__.c.timestamp),
+    "invoices": (Invoice.__table__, Invoice.__table__.c.created_date),
+    "appointments": (Appointment.__table__, Appointment.__table__.c.date),
+}
+export_chunk_rows = int(os.environ.get("EXPORT_CHUNK_ROWS", "2000"))
+
+
+def export_value(value):
+    if isinstance(value, (dt.date, dt.time)):
+        return value.isoformat()
+    return value
+
+
+async def export_chunks(table, filters: list, order_column=None, chunk_rows: int = 0):
+    """Yield the matching rows of table chunk_rows at a time, in (order_column,
+    id) order. Each chunk is its own short keyset query, so memory stays flat
+    and no read transaction is held open for the length of the export."""
+    chunk_rows = chunk_rows or export_chunk_rows
+    keys = [order_column, table.c.id] if order_column is not None else [table.c.id]
+    last = None
+    while True:
+        stmt = select(table).where(*filters).order_by(*keys).limit(chunk_rows)
+        if last is not None:
+            stmt = stmt.where(tuple_(*keys) > tuple_(*last))
+        async with read_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+        if rows:
+            yield rows
+        if len(rows) < chunk_rows:
+            return
+        last = [rows[-1]._mapping[key] for key in keys]
+
+
+@app.get("/api/export/{table}")
+async def export_table(
+    table: Literal["logs", "invoices", "appointments"],
+    fmt: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    gzip: bool = False,
+    customer_id: Optional[int] = None,
+    start: Optional[dt.date] = Query(None, alias="from"),
+    end: Optional[dt.date] = Query(None, alias="to"),
+):
+    """Stream a full dump of logs, invoices or appointments as NDJSON or CSV,
+    optionally gzipped and filtered by customer and an inclusive date range."""
+    source, date_column = EXPORT_TABLES[table]
+    filters = []
+    if customer_id is not None:
+        filters.append(source.c.customer_id == customer_id)
+    is_datetime = isinstance(date_column.type, DateTime)
+
+    def bound(day: dt.date):
+        return dt.datetime.combine(day, dt.time.min) if is_datetime else day
+
+    if start is not None:
+        filters.append(date_column >= bound(start))
+    if end is not None:
+        filters.append(date_column < bound(end + dt.timedelta(days=1)))
+    # Walk the date index when filtering by date, the primary key otherwise
+    order_column = date_column if start is not None or end is not None else None
+    columns = [c.name for c in source.columns]
+
+    def encode(rows) -> str:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows([map(export_value, row) for row in rows])
+            return buffer.getvalue()
+        return "".join(
+            json.dumps(dict(zip(columns, map(export_value, row)))) + "\n"
+            for row in rows
         )
-        db_question = result.scalar_one_or_none()
-        if not db_question:
-            raise HTTPException(status_code=404, detail="Question not found")
 
-        db_question.status = question.status
-        db_question.response = question.response
-        await session.commit()
-        await session.refresh(db_question)
-        return db_question
+    async def body():
+        compressor = zlib.compressobj(wbits=31) if gzip else None
+
+        def output(text: str) -> bytes:
+            data = text.encode()
+            return compressor.compress(data) if compressor is not None else data
+
+        if fmt == "csv":
+            yield output(encode([columns]))
+        async for rows in export_chunks(source, filters, order_column):
+            data = output(encode(rows))
+            if data:
+                yield data
+        if compressor is not None:
+            yield compressor.flush()
+
+    filename = f"{table}.{fmt}" + (".gz" if gzip else "")
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "text/csv"
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if gzip else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 
-@app.post("/api/chat")
-async def chat(chat_message: ChatMessage):
+# Bulk-importable tables as (model, row schema, column upserts match on
+# together with customer_id)
+IMPORT_TABLES = {
+    "business-services": (BusinessService, BusinessServiceModel, "name"),
+    "inventory": (InventoryItem, InventoryModel, "name"),
+    "business-facts": (BusinessFact, BusinessFactModel, "title"),
+    "business-hours": (BusinessHours, BusinessHoursModel, "day_of_week"),
+}
+import_max_rows = int(os.environ.get("IMPORT_MAX_ROWS", "50000"))
+# Per-row errors returned in one import report
+IMPORT_MAX_ERRORS = 100
+
+
+async def read_import_rows(request: Request) -> list:
+    """Rows from a JSON array body, a text/csv body or a multipart "file"
+    upload. Empty CSV cells are left out so model defaults apply."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected a 'file' upload")
+        data = await upload.read()
+        is_csv = upload.content_type == "text/csv" or (upload.filename or "").endswith(
+            ".csv"
+        )
+    else:
+        data = await request.body()
+        is_csv = content_type.startswith("text/csv")
+
+    if is_csv:
+        reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+        return [
+            {k: v for k, v in row.items() if k is not None and v != ""} for row in reader
+        ]
+    try:
+        rows = json.loads(data)
+    except ValueError:
+        rows = None
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array or CSV")
+    return rows
+
+
+@app.post("/api/import/{table}")
+async def import_rows(
+    table: Literal["business-services", "inventory", "business-facts", "business-hours"],
+    request: Request,
+    mode: Literal["insert", "upsert"] = "insert",
+    customer_id: Optional[int] = None,
+    all_or_nothing: bool = False,
+):
+    """Validate every row in one pass, then write the valid ones with
+    executemany in a single transaction. Upserts update the row with the same
+    customer_id and name (title for facts, day_of_week for hours). Rows are
+    reported by their 0-based position in the input."""
+    model, schema, key = IMPORT_TABLES[table]
+    rows = await read_import_rows(request)
+    if len(rows) > import_max_rows:
+        raise HTTPException(
+            status_code=413, detail=f"At most {import_max_rows} rows per import"
+        )
+
+    valid = []
+    errors = []
+    for position, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors.append({"row": position, "errors": ["expected an object"]})
+            continue
+        if customer_id is not None:
+            row.setdefault("customer_id", customer_id)
+        try:
+            item = schema.model_validate(row)
+        except ValidationError as e:
+            errors.append(
+                {
+                    "row": position,
+                    "errors": [
+                        f"{'.'.join(map(str, err['loc']))}: {err['msg']}"
+                        for err in e.errors()
+                    ],
+                }
+            )
+            continue
+        valid.append(item.model_dump(exclude={"id"}))
+
+    inserted = 0
+    updated = 0
+    if valid and not (errors and all_or_nothing):
+        source = model.__table__
+
+        async def import_valid(session):
+            to_insert = valid
+            to_update = []
+            if mode == "upsert":
+                # Later rows win when the input repeats a key
+                by_key = {(row["customer_id"], row[key]): row for row in valid}
+                customer_ids = {customer for customer, _ in by_key}
+                result = await session.execute(
+                    select(source.c.id, source.c.customer_id, source.c[key]).where(
+                        source.c.customer_id.in_(customer_ids)
+                    )
+                )
+                existing = {}
+                for row_id, customer, value in result:
+                    existing.setdefault((customer, value), row_id)
+                to_insert = []
+                for row_key, row in by_key.items():
+                    if row_key in existing:
+                        to_update.append({**row, "row_id": existing[row_key]})
+                    else:
+                        to_insert.append(row)
+                if to_update:
+                    await session.execute(
+                        update(source).where(source.c.id == bindparam("row_id")),
+                        to_update,
+                    )
+            if to_insert:
+                await session.execute(insert(source), to_insert)
+            return len(to_insert), len(to_update)
+
+        # One queued command, so the import is a single transaction on the
+        # writer like every other write
+        inserted, updated = await write_queue.run(import_valid)
+
+        # Core writes skip the session events that keep the KB caches current
+        entity = KB_CACHE_ENTITIES.get(model)
+        for customer in {row["customer_id"] for row in valid}:
+            if entity is not None:
+                kb_cache.invalidate(customer, entity)
+            if model in KB_MODELS:
+                kb_revisions.bump(customer)
+            if model in KNOWLEDGE_KINDS:
+                knowledge_store.discard(customer)
+
+    return {
+        "table": table,
+        "mode": mode,
+        "received": len(rows),
+        "inserted": inserted,
+        "updated": updated,
+        "failed": len(errors),
+        "errors": errors[:IMPORT_MAX_ERRORS],
+    }
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def invoke_llm(llm, messages):
+    """Run one model round trip on the event loop, bounded by llm_timeout_seconds."""
+    return await asyncio.wait_for(llm.ainvoke(messages), timeout=llm_timeout_seconds)
+
+
+async def stream_llm(llm, messages, emit):
+    """Stream one model round trip, emitting text tokens as they arrive.
+
+    Returns the aggregated message, including any tool calls. The whole
+    stream is bounded by llm_timeout_seconds.
+    """
+    response = None
+    async with asyncio.timeout(llm_timeout_seconds):
+        async for chunk in llm.astream(messages):
+            response = chunk if response is None else response + chunk
+            if isinstance(chunk.content, str) and chunk.content:
+                await emit("token", {"text": chunk.content})
+    return response
+
+
+async def call_llm(llm, messages, emit=None):
+    if emit is None:
+        return await invoke_llm(llm, messages)
+    return await stream_llm(llm, messages, emit)
+
+
+async def cancel_on_disconnect(request: Request, coro):
+    """Await coro, cancelling it if the HTTP client disconnects first."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=disconnect_poll_seconds)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise ClientDisconnected()
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def messages_tokens(messages) -> int:
+    return sum(estimate_tokens(str(message.content)) for message in messages)
+
+
+class PromptStats:
+    """Estimated prompt tokens sent to the model per chat turn."""
+
+    def __init__(self):
+        self.turns = 0
+        self.prompt_tokens_total = 0
+        self.prompt_tokens_max = 0
+        self.tool_tokens_total = 0
+        self.tool_tokens_max = 0
+
+    def record(self, prompt_tokens: int, tool_tokens: int):
+        self.turns += 1
+        self.prompt_tokens_total += prompt_tokens
+        self.prompt_tokens_max = max(self.prompt_tokens_max, prompt_tokens)
+        self.tool_tokens_total += tool_tokens
+        self.tool_tokens_max = max(self.tool_tokens_max, tool_tokens)
+
+    def stats(self) -> dict:
+        turns = self.turns or 1
+        return {
+            "turns": self.turns,
+            "avg_prompt_tokens": round(self.prompt_tokens_total / turns, 1),
+            "max_prompt_tokens": self.prompt_tokens_max,
+            "avg_tool_result_tokens": round(self.tool_tokens_total / turns, 1),
+            "max_tool_result_tokens": self.tool_tokens_max,
+        }
+
+
+prompt_stats = PromptStats()
+
+
+async def route_locally(chat_message: ChatMessage, emit=None) -> Optional[str]:
+    """Answer with a single read tool when the intent router is confident."""
+    tool_name, intent, confidence = intent_router.route(chat_message.message)
+    if tool_name is None:
+        print(f"[router] fallthrough intent={intent} confidence={confidence:.2f}")
+        return None
+
+    started = time.perf_counter()
+    result = await tool_registry.run_call(
+        {"name": tool_name, "args": {}}, chat_message.customer_id, emit
+    )
+    elapsed = time.perf_counter() - started
+    if result.startswith("❌"):
+        print(f"[router] tool failed, fallthrough intent={intent} tool={tool_name}")
+        return None
+    saved = intent_router.record_routed(intent, elapsed)
+    print(
+        f"[router] routed intent={intent} tool={tool_name} confidence={confidence:.2f}"
+        f" took_ms={elapsed * 1000:.1f} saved_ms={saved * 1000:.1f}"
+    )
+    return result
+
+
+async def generate_chat_response(chat_message: ChatMessage, emit=None) -> str:
+    """Produce the assistant's reply. When emit is given, model tokens and tool
+    progress are reported through it as they happen."""
+    if intent_router_enabled and chat_message.customer_id:
+        routed = await route_locally(chat_message, emit)
+        if routed is not None:
+            return routed
+
+    started = time.perf_counter()
+    prompt_tokens = 0
+    tool_tokens = 0
     response_text = ""
+    # Only replies whose data is covered by the KB revision in the cache key
+    # are reused: tool-free replies and those built from kb_only tools.
+    # Revenue, appointments, inventory and customers change without a bump.
+    cacheable = False
     # Use API key from request if provided, otherwise fall back to environment variable
     api_key = chat_message.api_key or gemini_api_key
     if not api_key:
         # Mock response for testing
         response_text = f"Got it! I've processed your request: '{chat_message.message}'. This is a mock response since LLM credentials are not configured."
+    elif chat_message.customer_id is not None and (
+        cached := response_cache.get(chat_message.customer_id, chat_message.message)
+    ):
+        return cached
+    elif (
+        semantic_cache_enabled
+        and chat_message.customer_id is not None
+        and (cached := semantic_cache.get(chat_message.customer_id, chat_message.message))
+    ):
+        return cached
     else:
         try:
-            llm = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash",
-                google_api_key=api_key,
-                max_tokens=512,
-                temperature=0.7,
+            llm, llm_with_tools = llm_pool.get(
+                api_key, gemini_model, temperature=0.7, max_tokens=512
             )
 
-            # Bind tools if customer_id is provided
+            # Use the tool-bound model if customer_id is provided
             if chat_message.customer_id:
-                # Temporarily disable tools to test basic LLM functionality
-                llm_with_tools = llm
-
                 system_content = f"""You are a helpful assistant for managing a business. You have access to the customer's data via tools.
 
 Customer ID: {chat_message.customer_id}
 
-**IMPORTANT**: For ANY question about the business, ALWAYS check the business facts first using search_business_facts or get_customer_business_facts before providing information. The business facts are the primary source of truth.
+**IMPORTANT**: For ANY question about the business, ALWAYS check the knowledge base first using retrieve_relevant_knowledge or search_business_facts before providing information. The business facts are the primary source of truth.
 
 Available tools include:
 - get_customer_schedule: Complete schedule with business hours and appointments
 - get_customer_services: List of services offered
 - get_customer_appointments: Individual appointments
 - get_customer_revenue: Revenue information
+- get_customer_revenue_trend: Revenue over a date range by day, week or month
 - get_customer_business_hours: Business operating hours
 - get_customer_inventory: Product inventory
 - get_all_customers: List of all customers in the system
 - get_customer_business_facts: Public business information and facts
 - search_business_facts: Search business facts for specific information using keywords
+- retrieve_relevant_knowledge: The facts, services and policies most relevant to a question
 - add_business_fact: Store new business information in the knowledge base
 - list_business_services: Get all available business services and offerings (dynamic format for any business type)
 - search_business_services: Search for specific business services by name or description
@@ -1594,7 +4515,7 @@ Available tools include:
 - store_unanswered_question: Store unanswered questions for owner review
 
 **RESPONSE STRATEGY**:
-1. When asked about business information (location, hours, policies, services, etc.), FIRST use search_business_facts with relevant keywords
+1. When asked about business information (location, hours, policies, services, etc.), FIRST use retrieve_relevant_knowledge with the customer's question
 2. If no information is found, then check other tools or ask for clarification
 3. When customers provide new information about the business, use add_business_fact to store it for future reference
 4. If you cannot answer a customer's question after checking all available information, use store_unanswered_question to save it for the business owner to review and respond manually
@@ -1612,76 +4533,49 @@ Format your responses using Markdown for better readability:
                 ]
 
                 # Invoke with tool calling
-                response = llm_with_tools.invoke(messages)
+                prompt_tokens += messages_tokens(messages)
+                response = await call_llm(llm_with_tools, messages, emit)
 
                 # If there are tool calls, execute them
                 if hasattr(response, "tool_calls") and response.tool_calls:
-                    tool_results = []
-                    for tool_call in response.tool_calls:
-                        tool_name = tool_call["name"]
-                        tool_args = tool_call["args"]
-                        # Add customer_id to args if not present
-                        if "customer_id" not in tool_args and chat_message.customer_id:
-                            tool_args["customer_id"] = chat_message.customer_id
-
-                        # Execute the tool
-                        if tool_name == "get_customer_services":
-                            result = await get_customer_services(**tool_args)
-                        elif tool_name == "get_customer_appointments":
-                            result = await get_customer_appointments(**tool_args)
-                        elif tool_name == "get_customer_schedule":
-                            result = await get_customer_schedule(**tool_args)
-                        elif tool_name == "get_customer_revenue":
-                            result = await get_customer_revenue(**tool_args)
-                        elif tool_name == "get_customer_business_hours":
-                            result = await get_customer_business_hours(**tool_args)
-                        elif tool_name == "get_customer_inventory":
-                            result = await get_customer_inventory(**tool_args)
-                        elif tool_name == "get_all_customers":
-                            result = await get_all_customers(**tool_args)
-                        elif tool_name == "get_customer_business_facts":
-                            result = await get_customer_business_facts(**tool_args)
-                        elif tool_name == "search_business_facts":
-                            result = await search_business_facts(**tool_args)
-                        elif tool_name == "add_business_fact":
-                            result = await add_business_fact(**tool_args)
-                        elif tool_name == "list_business_services":
-                            result = await list_business_services(**tool_args)
-                        elif tool_name == "search_business_services":
-                            result = await search_business_services(**tool_args)
-                        elif tool_name == "add_business_service":
-                            result = await add_business_service(**tool_args)
-                        elif tool_name == "store_unanswered_question":
-                            result = await store_unanswered_question(**tool_args)
-                        elif tool_name == "update_business_hours":
-                            result = await update_business_hours(**tool_args)
-                        elif tool_name == "update_service_price_chat":
-                            result = await update_service_price_chat(**tool_args)
-                        elif tool_name == "update_business_description_chat":
-                            result = await update_business_description_chat(**tool_args)
-                        elif tool_name == "update_business_location_chat":
-                            result = await update_business_location_chat(**tool_args)
-                        elif tool_name == "add_staff_member_chat":
-                            result = await add_staff_member_chat(**tool_args)
-                        elif tool_name == "update_appointment_availability_chat":
-                            result = await update_appointment_availability_chat(
-                                **tool_args
-                            )
-                        else:
-                            result = "Unknown tool"
-
-                        tool_results.append(result)
+                    tool_results = await tool_registry.run_calls(
+                        response.tool_calls, chat_message.customer_id, emit
+                    )
+                    # Tools are done with the database; don't hold the
+                    # request's connection through the second model call
+                    await release_request_db()
 
                     # Combine results and generate final response
                     tool_summary = "\n\n".join(tool_results)
+                    tool_tokens = estimate_tokens(tool_summary)
+                    if all(
+                        tool_registry.is_direct_answer(tool_call["name"])
+                        for tool_call in response.tool_calls
+                    ):
+                        # Still one model round trip, so it counts towards the
+                        # model path's latency the router is compared against
+                        intent_router.record_llm(time.perf_counter() - started)
+                        prompt_stats.record(prompt_tokens, tool_tokens)
+                        if emit is not None:
+                            # Stream clients build the reply from tokens, and
+                            # any preamble the model streamed isn't the reply
+                            separator = "\n\n" if response.content else ""
+                            await emit("token", {"text": separator + tool_summary})
+                        return tool_summary
                     final_messages = messages + [
                         response,
                         SystemMessage(content=f"Tool results:\n{tool_summary}"),
                     ]
-                    final_response = llm.invoke(final_messages)
+                    prompt_tokens += messages_tokens(final_messages)
+                    final_response = await call_llm(llm, final_messages, emit)
                     response_text = final_response.content
+                    cacheable = all(
+                        tool_registry.is_kb_only(tool_call["name"])
+                        for tool_call in response.tool_calls
+                    )
                 else:
                     response_text = response.content
+                    cacheable = True
             else:
                 # No customer_id, use basic LLM
                 messages = [
@@ -1690,216 +4584,339 @@ Format your responses using Markdown for better readability:
                     ),
                     HumanMessage(content=chat_message.message),
                 ]
-                response = llm.invoke(messages)
+                prompt_tokens += messages_tokens(messages)
+                response = await call_llm(llm, messages, emit)
                 response_text = response.content
 
+            intent_router.record_llm(time.perf_counter() - started)
+            prompt_stats.record(prompt_tokens, tool_tokens)
+        except asyncio.TimeoutError:
+            response_text = "Sorry, the assistant took too long to respond. Please try again."
         except Exception as e:
             response_text = f"Got it! I've processed your request: '{chat_message.message}'. This is a mock response since Gemini credentials are invalid or not configured. Error: {str(e)}"
 
-    # Log the action
-    try:
-        from datetime import datetime
+    if cacheable and isinstance(response_text, str) and response_text:
+        response_cache.put(chat_message.customer_id, chat_message.message, response_text)
+        # Same rule as the exact cache: a near-duplicate match would hand a
+        # revenue or inventory answer to the next paraphrase long after the
+        # data moved on
+        if semantic_cache_enabled:
+            semantic_cache.put(
+                chat_message.customer_id, chat_message.message, response_text
+            )
+    return response_text
+
 
+async def log_chat(chat_message: ChatMessage, response_text: str):
+    try:
         # Only log if we have a customer_id (for authenticated chats)
         if chat_message.customer_id is not None:
-            log_entry = Log(
-                customer_id=chat_message.customer_id,
-                timestamp=datetime.now().isoformat(),
-                action="chat",
-                details=f"Message: {chat_message.message}, Response: {response_text}",
+            await log_writer.submit(
+                {
+                    "customer_id": chat_message.customer_id,
+                    "timestamp": dt.datetime.now(),
+                    "action": "chat",
+                    "details": f"Message: {chat_message.message}, Response: {response_text}",
+                }
             )
-            async with async_session() as session:
-                session.add(log_entry)
-                await session.commit()
     except Exception as e:
         print(f"Error logging chat action: {e}")
 
+
+class LatencyStats:
+    """Time-to-first-byte and total latency for one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.ttfb_total = 0.0
+        self.ttfb_max = 0.0
+        self.total = 0.0
+        self.total_max = 0.0
+
+    def record(self, ttfb: float, total: float):
+        self.requests += 1
+        self.ttfb_total += ttfb
+        self.ttfb_max = max(self.ttfb_max, ttfb)
+        self.total += total
+        self.total_max = max(self.total_max, total)
+
+    def stats(self) -> dict:
+        n = self.requests or 1
+        return {
+            "requests": self.requests,
+            "avg_ttfb_ms": round(self.ttfb_total / n * 1000, 2),
+            "max_ttfb_ms": round(self.ttfb_max * 1000, 2),
+            "avg_total_ms": round(self.total / n * 1000, 2),
+            "max_total_ms": round(self.total_max * 1000, 2),
+        }
+
+
+chat_latency = LatencyStats()
+chat_stream_latency = LatencyStats()
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/chat", dependencies=[Depends(get_db)])
+async def chat(chat_message: ChatMessage, request: Request):
+    started = time.perf_counter()
+    try:
+        response_text = await cancel_on_disconnect(
+            request, generate_chat_response(chat_message)
+        )
+    except ClientDisconnected:
+        # Nobody is left to read the reply, so skip logging it as well
+        return Response(status_code=499)
+
+    # Log the action
+    await log_chat(chat_message, response_text)
+
+    elapsed = time.perf_counter() - started
+    chat_latency.record(elapsed, elapsed)
     return {"response": response_text}
 
 
-@app.get("/api/revenue/{customer_id}")
-async def get_revenue(customer_id: int, date: str = "today"):
-    from datetime import datetime, timedelta
+@app.post("/api/chat/stream", dependencies=[Depends(get_db)])
+async def chat_stream(chat_message: ChatMessage):
+    """Server-Sent Events version of /api/chat.
 
-    if date == "today":
-        today = datetime.now().date()
-        start_date = today.isoformat()
-        end_date = (today + timedelta(days=1)).isoformat()
-    else:
-        # Assume date is in YYYY-MM-DD format
-        start_date = date
-        end_date = (datetime.fromisoformat(date) + timedelta(days=1)).isoformat()
+    Emits `token` events with model text as it arrives, `tool_start` and
+    `tool_end` around each tool call, and a closing `final` event with the
+    full response text and timings.
+    """
+    started = time.perf_counter()
+    queue = asyncio.Queue()
 
-    async with async_session() as session:
-        # Get revenue from paid invoices
-        result = await session.execute(
-            select(Invoice).where(
-                Invoice.customer_id == customer_id,
-                Invoice.status == "paid",
-                Invoice.created_date >= start_date,
-                Invoice.created_date < end_date,
+    async def emit(event: str, data: dict):
+        await queue.put((event, data))
+
+    async def run():
+        try:
+            response_text = await generate_chat_response(chat_message, emit)
+        except Exception as e:
+            response_text = f"Error: {str(e)}"
+        await queue.put(("done", response_text))
+
+    async def events():
+        task = asyncio.create_task(run())
+        first_byte_at = None
+        streamed_text = False
+        try:
+            while True:
+                event, data = await queue.get()
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+                if event == "done":
+                    response_text = data
+                    break
+                streamed_text = streamed_text or event == "token"
+                yield sse_event(event, data)
+
+            # Cached and fallback replies never went through the model stream
+            if not streamed_text and isinstance(response_text, str):
+                yield sse_event("token", {"text": response_text})
+            total = time.perf_counter() - started
+            ttfb = first_byte_at - started
+            chat_stream_latency.record(ttfb, total)
+            yield sse_event(
+                "final",
+                {
+                    "response": response_text,
+                    "ttfb_ms": round(ttfb * 1000, 2),
+                    "total_ms": round(total * 1000, 2),
+                },
             )
-        )
-        invoices = result.scalars().all()
-        total_revenue = sum(invoice.total_amount for invoice in invoices)
+            await log_chat(chat_message, response_text)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return {
+        "llm_pool": llm_pool.stats(),
+        "tools": tool_registry.stats(),
+        "response_cache": response_cache.stats(),
+        "kb_cache": kb_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "intent_router": intent_router.stats(),
+        "log_writer": log_writer.stats(),
+        "write_queue": write_queue.stats(),
+        "db_checkouts": checkout_stats.stats(),
+        "prompt": prompt_stats.stats(),
+        "chat": chat_latency.stats(),
+        "chat_stream": chat_stream_latency.stats(),
+    }
+
+
+@app.get("/api/revenue/{customer_id}")
+async def get_revenue(
+    customer_id: int,
+    date: str = "today",
+    start: Optional[dt.date] = Query(None, alias="from"),
+    end: Optional[dt.date] = Query(None, alias="to"),
+    granularity: Literal["day", "week", "month"] = "day",
+    session: AsyncSession = Depends(get_db),
+):
+    # With from/to, return the range bucketed by granularity; otherwise one day
+    if start is not None or end is not None:
+        end = end or dt.date.today()
+        start = start or end - dt.timedelta(days=30)
+        if start > end:
+            raise HTTPException(status_code=400, detail="from must not be after to")
+        series = await revenue_series(session, customer_id, start, end, granularity)
         return {
-            "date": date,
-            "total_revenue": total_revenue,
-            "invoice_count": len(invoices),
+            "from": start,
+            "to": end,
+            "granularity": granularity,
+            "total_revenue": round(sum(p["total_revenue"] for p in series), 2),
+            "invoice_count": sum(p["invoice_count"] for p in series),
+            "periods": series,
         }
 
+    try:
+        day = parse_day(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD or 'today'")
+
+    series = await revenue_series(session, customer_id, day, day)
+    return {
+        "date": date,
+        "total_revenue": series[0]["total_revenue"] if series else 0,
+        "invoice_count": series[0]["invoice_count"] if series else 0,
+    }
+
 
 # Business Services CRUD endpoints
 @app.put("/api/business-services/{service_id}", response_model=BusinessServiceModel)
 async def update_business_service(service_id: int, service: BusinessServiceModel):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessService).where(BusinessService.id == service_id)
-        )
-        existing_service = result.scalar_one_or_none()
-        if existing_service:
-            existing_service.name = service.name
-            existing_service.description = service.description
-            existing_service.category = service.category
-            existing_service.price = service.price
-            existing_service.duration = service.duration
-            existing_service.is_available = service.is_available
-            existing_service.custom_data = service.custom_data
-            await session.commit()
-            await session.refresh(existing_service)
-            return existing_service
-        return {"error": "Business service not found"}
+    existing_service = await update_row(
+        BusinessService,
+        service_id,
+        {
+            "name": service.name,
+            "description": service.description,
+            "category": service.category,
+            "price": service.price,
+            "duration": service.duration,
+            "is_available": service.is_available,
+            "custom_data": service.custom_data,
+        },
+    )
+    if not existing_service:
+        raise HTTPException(status_code=404, detail="Business service not found")
+    return existing_service
 
 
 @app.delete("/api/business-services/{service_id}")
 async def delete_business_service(service_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessService).where(BusinessService.id == service_id)
-        )
-        service = result.scalar_one_or_none()
-        if service:
-            await session.delete(service)
-            await session.commit()
-            return {"message": "Business service deleted successfully"}
-        return {"error": "Business service not found"}
+    if await delete_row(BusinessService, service_id):
+        return {"message": "Business service deleted successfully"}
+    return {"error": "Business service not found"}
 
 
 # Business Facts CRUD endpoints
 @app.put("/api/business-facts/{fact_id}", response_model=BusinessFactModel)
 async def update_business_fact(fact_id: int, fact: BusinessFactModel):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessFact).where(BusinessFact.id == fact_id)
-        )
-        existing_fact = result.scalar_one_or_none()
-        if existing_fact:
-            existing_fact.title = fact.title
-            existing_fact.content = fact.content
-            existing_fact.category = fact.category
-            existing_fact.is_public = fact.is_public
-            await session.commit()
-            await session.refresh(existing_fact)
-            return existing_fact
-        return {"error": "Business fact not found"}
+    existing_fact = await update_row(
+        BusinessFact,
+        fact_id,
+        {
+            "title": fact.title,
+            "content": fact.content,
+            "category": fact.category,
+            "is_public": fact.is_public,
+        },
+    )
+    if not existing_fact:
+        raise HTTPException(status_code=404, detail="Business fact not found")
+    return existing_fact
 
 
 @app.delete("/api/business-facts/{fact_id}")
 async def delete_business_fact(fact_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(BusinessFact).where(BusinessFact.id == fact_id)
-        )
-        fact = result.scalar_one_or_none()
-        if fact:
-            await session.delete(fact)
-            await session.commit()
-            return {"message": "Business fact deleted successfully"}
-        return {"error": "Business fact not found"}
+    if await delete_row(BusinessFact, fact_id):
+        return {"message": "Business fact deleted successfully"}
+    return {"error": "Business fact not found"}
 
 
 # Customer update endpoint
 @app.put("/api/customers/{customer_id}", response_model=CustomerModel)
 async def update_customer(customer_id: int, customer: CustomerModel):
-    async with async_session() as session:
-        result = await session.execute(
-            select(Customer).where(Customer.id == customer_id)
-        )
-        existing_customer = result.scalar_one_or_none()
-        if existing_customer:
-            existing_customer.name = customer.name
-            existing_customer.email = customer.email
-            existing_customer.phone = customer.phone
-            existing_customer.business_name = customer.business_name
-            existing_customer.business_type = customer.business_type
-            existing_customer.business_address = customer.business_address
-            existing_customer.telegram_id = customer.telegram_id
-            await session.commit()
-            await session.refresh(existing_customer)
-            return existing_customer
-        return {"error": "Customer not found"}
+    existing_customer = await update_row(
+        Customer,
+        customer_id,
+        {
+            "name": customer.name,
+            "email": customer.email,
+            "phone": customer.phone,
+            "business_name": customer.business_name,
+            "business_type": customer.business_type,
+            "business_address": customer.business_address,
+            "telegram_id": customer.telegram_id,
+        },
+    )
+    if not existing_customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    return existing_customer
 
 
 # Policy CRUD endpoints
 @app.put("/api/policies/{policy_id}", response_model=PolicyModel)
 async def update_policy(policy_id: int, policy: PolicyModel):
-    async with async_session() as session:
-        result = await session.execute(select(Policy).where(Policy.id == policy_id))
-        existing_policy = result.scalar_one_or_none()
-        if existing_policy:
-            existing_policy.title = policy.title
-            existing_policy.content = policy.content
-            existing_policy.category = policy.category
-            await session.commit()
-            await session.refresh(existing_policy)
-            return existing_policy
-        return {"error": "Policy not found"}
+    existing_policy = await update_row(
+        Policy,
+        policy_id,
+        {
+            "title": policy.title,
+            "content": policy.content,
+            "category": policy.category,
+        },
+    )
+    if not existing_policy:
+        raise HTTPException(status_code=404, detail="Policy not found")
+    return existing_policy
 
 
 @app.delete("/api/policies/{policy_id}")
 async def delete_policy(policy_id: int):
-    async with async_session() as session:
-        result = await session.execute(select(Policy).where(Policy.id == policy_id))
-        policy = result.scalar_one_or_none()
-        if policy:
-            await session.delete(policy)
-            await session.commit()
-            return {"message": "Policy deleted successfully"}
-        return {"error": "Policy not found"}
+    if await delete_row(Policy, policy_id):
+        return {"message": "Policy deleted successfully"}
+    return {"error": "Policy not found"}
 
 
 # Inventory CRUD endpoints
 @app.put("/api/inventory/{item_id}", response_model=InventoryModel)
 async def update_inventory_item(item_id: int, item: InventoryModel):
-    async with async_session() as session:
-        result = await session.execute(
-            select(InventoryItem).where(InventoryItem.id == item_id)
-        )
-        existing_item = result.scalar_one_or_none()
-        if existing_item:
-            existing_item.name = item.name
-            existing_item.quantity = item.quantity
-            existing_item.price = item.price
-            existing_item.category = item.category
-            await session.commit()
-            await session.refresh(existing_item)
-            return existing_item
-        return {"error": "Inventory item not found"}
+    existing_item = await update_row(
+        InventoryItem,
+        item_id,
+        {
+            "name": item.name,
+            "quantity": item.quantity,
+            "price": item.price,
+            "category": item.category,
+        },
+    )
+    if not existing_item:
+        raise HTTPException(status_code=404, detail="Inventory item not found")
+    return existing_item
 
 
 @app.delete("/api/inventory/{item_id}")
 async def delete_inventory_item(item_id: int):
-    async with async_session() as session:
-        result = await session.execute(
-            select(InventoryItem).where(InventoryItem.id == item_id)
-        )
-        item = result.scalar_one_or_none()
-        if item:
-            await session.delete(item)
-            await session.commit()
-            return {"message": "Inventory item deleted successfully"}
-        return {"error": "Inventory item not found"}
+    if await delete_row(InventoryItem, item_id):
+        return {"message": "Inventory item deleted successfully"}
+    return {"error": "Inventory item not found"}
 
 
 if __name__ == "__main__":
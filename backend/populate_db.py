@@ -12,7 +12,7 @@ from main import (
     Policy,
     Log,
 )
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 import random
 
 
@@ -157,40 +157,40 @@ async def populate_database():
             Appointment(
                 customer_id=1,
                 service_id=1,
-                date="2024-12-01",
-                time="10:00",
+                date=date(2024, 12, 1),
+                time=time(10, 0),
                 status="scheduled",
                 notes="Initial consultation",
             ),
             Appointment(
                 customer_id=2,
                 service_id=2,
-                date="2024-12-01",
-                time="14:00",
+                date=date(2024, 12, 1),
+                time=time(14, 0),
                 status="confirmed",
                 notes="Regular facial",
             ),
             Appointment(
                 customer_id=3,
                 service_id=3,
-                date="2024-12-02",
-                time="11:00",
+                date=date(2024, 12, 2),
+                time=time(11, 0),
                 status="scheduled",
                 notes="Deep tissue session",
             ),
             Appointment(
                 customer_id=4,
                 service_id=4,
-                date="2024-12-02",
-                time="15:30",
+                date=date(2024, 12, 2),
+                time=time(15, 30),
                 status="confirmed",
                 notes="Hair styling appointment",
             ),
             Appointment(
                 customer_id=5,
                 service_id=5,
-                date="2024-12-03",
-                time="13:00",
+                date=date(2024, 12, 3),
+                time=time(13, 0),
                 status="scheduled",
                 notes="Manicure service",
             ),
@@ -199,7 +199,7 @@ async def populate_database():
         await session.commit()
 
         # Create dummy invoices
-        today = datetime.now().date().isoformat()
+        today = date.today()
         invoices = [
             Invoice(
                 customer_id=1,
@@ -207,7 +207,7 @@ async def populate_database():
                 total_amount=150.0,
                 status="paid",
                 created_date=today,
-                due_date="2024-12-01",
+                due_date=date(2024, 12, 1),
                 items='[{"service": "Consultation", "price": 150.0}]',
             ),
             Invoice(
@@ -216,7 +216,7 @@ async def populate_database():
                 total_amount=100.0,
                 status="unpaid",
                 created_date=today,
-                due_date="2024-12-01",
+                due_date=date(2024, 12, 1),
                 items='[{"service": "Facial Treatment", "price": 100.0}]',
             ),
             Invoice(
@@ -225,7 +225,7 @@ async def populate_database():
                 total_amount=120.0,
                 status="paid",
                 created_date=today,
-                due_date="2024-12-02",
+                due_date=date(2024, 12, 2),
                 items='[{"service": "Deep Tissue Massage", "price": 120.0}]',
             ),
             Invoice(
@@ -234,7 +234,7 @@ async def populate_database():
                 total_amount=80.0,
                 status="unpaid",
                 created_date=today,
-                due_date="2024-12-02",
+                due_date=date(2024, 12, 2),
                 items='[{"service": "Hair Styling", "price": 80.0}]',
             ),
             Invoice(
@@ -243,7 +243,7 @@ async def populate_database():
                 total_amount=50.0,
                 status="paid",
                 created_date=today,
-                due_date="2024-12-03",
+                due_date=date(2024, 12, 3),
                 items='[{"service": "Manicure", "price": 50.0}]',
             ),
         ]
@@ -345,31 +345,31 @@ async def populate_database():
         logs = [
             Log(
                 customer_id=1,
-                timestamp=datetime.now().isoformat(),
+                timestamp=datetime.now(),
                 action="customer_created",
                 details="Created customer John Doe",
             ),
             Log(
                 customer_id=1,
-                timestamp=datetime.now().isoformat(),
+                timestamp=datetime.now(),
                 action="service_created",
                 details="Created service Consultation",
             ),
             Log(
                 customer_id=1,
-                timestamp=datetime.now().isoformat(),
+                timestamp=datetime.now(),
                 action="appointment_booked",
                 details="Booked appointment for John Doe",
             ),
             Log(
                 customer_id=1,
-                timestamp=datetime.now().isoformat(),
+                timestamp=datetime.now(),
                 action="invoice_generated",
                 details="Generated invoice for consultation",
             ),
             Log(
                 customer_id=1,
-                timestamp=datetime.now().isoformat(),
+                timestamp=datetime.now(),
                 action="hours_updated",
                 details="Updated business hours",
             ),
@@ -370,7 +370,7 @@ async def populate_restaurant_data():
         # Create log entry
         log_entry = Log(
             customer_id=customer_id,
-            timestamp=datetime.now().isoformat(),
+            timestamp=datetime.now(),
             action="restaurant_setup",
             details="Restaurant data populated with menu, hours, and business information",
         )
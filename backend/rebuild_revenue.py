@@ -0,0 +1,26 @@
+import argparse
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from main import Base, rebuild_revenue_rollups
+
+
+async def rebuild(db_path: str, customer_id):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        rows = await rebuild_revenue_rollups(conn, customer_id)
+    await engine.dispose()
+    scope = f"customer {customer_id}" if customer_id is not None else "all customers"
+    print(f"Rebuilt {rows} daily revenue rows for {scope}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the revenue_daily rollups from the raw invoices"
+    )
+    parser.add_argument("--db", default="./customers.db")
+    parser.add_argument("--customer-id", type=int)
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.db, args.customer_id))
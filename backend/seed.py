@@ -0,0 +1,511 @@
+"""Generate a multi-tenant database at a chosen scale for load testing.
+
+Creates a fresh SQLite file with the app schema and migrations, bulk loads
+synthetic customers, knowledge base rows, appointments, invoices and logs
+with seeded randomness, then builds the search indexes and revenue rollups.
+Dates run up to --anchor-date, which has a fixed default, so the same seed
+gives the same database on any day.
+
+    python seed.py --db bench.db --profile bench
+    python seed.py --db big.db --customers 10000 --appointments 50000000
+"""
+
+import argparse
+import asyncio
+import datetime as dt
+import itertools
+import os
+import random
+import sqlite3
+import sys
+import time
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from main import Base, ensure_search_index, rebuild_revenue_rollups, run_migrations
+
+# "Today" for generated data unless --anchor-date says otherwise
+ANCHOR_DATE = dt.date(2025, 1, 1)
+
+PROFILES = {
+    "dev": dict(customers=20, appointments=2_000, invoices=2_000, logs=10_000),
+    "bench": dict(
+        customers=1_000, appointments=1_000_000, invoices=1_000_000, logs=5_000_000
+    ),
+    "large": dict(
+        customers=10_000,
+        appointments=50_000_000,
+        invoices=50_000_000,
+        logs=50_000_000,
+    ),
+}
+
+# Loading pragmas: no rollback journal or fsyncs, a large page cache. A
+# failed load leaves a broken file, which is fine for a generated fixture.
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA locking_mode = EXCLUSIVE",
+]
+
+# business type -> (service category, [(service, price, duration)], inventory)
+BUSINESS_TYPES = {
+    "Hair Salon": (
+        "service",
+        [
+            ("Haircut", 35.0, "45 min"),
+            ("Coloring", 90.0, "2 hours"),
+            ("Blow Dry", 25.0, "30 min"),
+            ("Beard Trim", 15.0, "15 min"),
+            ("Highlights", 110.0, "2 hours"),
+        ],
+        ["Shampoo", "Conditioner", "Hair Spray", "Color Kit", "Styling Gel"],
+    ),
+    "Restaurant": (
+        "food",
+        [
+            ("Pizza Margherita", 14.0, None),
+            ("Lasagna", 18.0, None),
+            ("Risotto", 21.0, None),
+            ("Tiramisu", 8.0, None),
+            ("Espresso", 3.0, None),
+        ],
+        ["Flour", "Tomatoes", "Mozzarella", "Coffee Beans", "Olive Oil"],
+    ),
+    "Tutoring Center": (
+        "tutoring",
+        [
+            ("Math Tutoring", 40.0, "1 hour"),
+            ("Chemistry Tutoring", 45.0, "1 hour"),
+            ("Essay Review", 30.0, "30 min"),
+            ("SAT Prep", 60.0, "2 hours"),
+        ],
+        ["Workbook", "Flashcards", "Calculator", "Practice Test"],
+    ),
+    "Dental Clinic": (
+        "service",
+        [
+            ("Cleaning", 80.0, "45 min"),
+            ("Whitening", 250.0, "1 hour"),
+            ("X-Ray", 60.0, "20 min"),
+            ("Checkup", 50.0, "30 min"),
+        ],
+        ["Toothbrush", "Floss", "Mouthwash", "Gloves"],
+    ),
+    "Day Spa": (
+        "service",
+        [
+            ("Deep Tissue Massage", 120.0, "1 hour"),
+            ("Facial", 90.0, "1 hour"),
+            ("Manicure", 35.0, "45 min"),
+            ("Pedicure", 45.0, "45 min"),
+        ],
+        ["Massage Oil", "Face Cream", "Nail Polish", "Towels"],
+    ),
+}
+VARIANTS = ["Deluxe", "Express", "Premium", "Student", "Weekend", "Family"]
+FACTS = [
+    ("Parking", "Free parking is available behind {name}.", "location"),
+    ("Wi-Fi", "Guests can use our free Wi-Fi, ask staff for the password.", "general"),
+    ("Gift Cards", "{name} gift cards are sold in store and online.", "general"),
+    ("Accessibility", "Our entrance and restrooms are wheelchair accessible.", "general"),
+    ("Payment Methods", "We accept cash, all major cards and mobile payments.", "general"),
+    ("Holiday Hours", "We close early on public holidays.", "hours"),
+    ("Booking", "Book by phone or chat; walk-ins welcome when we have room.", "services"),
+    ("About Us", "{name} is a family-run {kind} serving {city} since {year}.", "general"),
+]
+POLICIES = [
+    ("Cancellation Policy", "Please cancel at least 24 hours in advance.", "refund"),
+    ("Refund Policy", "Refunds are issued within 14 days of purchase.", "refund"),
+    ("Privacy Policy", "We never share customer data with third parties.", "privacy"),
+]
+CITIES = ["Springfield", "Riverside", "Fairview", "Madison", "Georgetown", "Salem"]
+STREETS = ["Main St", "Oak Ave", "Park Rd", "Elm St", "Maple Dr", "Market St"]
+QUESTIONS = [
+    "Do you have vegan options?",
+    "Can I bring my dog?",
+    "Is there a student discount?",
+    "Do you open on public holidays?",
+    "Can I pay in installments?",
+]
+LOG_ACTIONS = ["chat", "chat", "chat", "appointment_booked", "invoice_generated"]
+PAST_APPOINTMENT_STATUSES = ["completed"] * 9 + ["cancelled"]
+INVOICE_STATUSES = ["paid"] * 7 + ["unpaid"] * 2 + ["overdue"]
+# Columns filled per table, in load order; Generator has a method per table
+TABLE_COLUMNS = {
+    "customers": [
+        "name",
+        "email",
+        "phone",
+        "business_name",
+        "business_type",
+        "business_address",
+        "telegram_id",
+    ],
+    "services": ["customer_id", "name", "description", "price", "duration"],
+    "business_services": [
+        "customer_id",
+        "name",
+        "description",
+        "category",
+        "price",
+        "duration",
+        "is_available",
+        "custom_data",
+    ],
+    "inventory": ["customer_id", "name", "quantity", "price", "category"],
+    "business_hours": ["customer_id", "day_of_week", "open_time", "close_time", "is_closed"],
+    "policies": ["customer_id", "title", "content", "category"],
+    "business_facts": ["customer_id", "title", "content", "category", "is_public"],
+    "appointments": ["customer_id", "service_id", "date", "time", "status", "notes"],
+    "invoices": [
+        "customer_id",
+        "appointment_id",
+        "total_amount",
+        "status",
+        "created_date",
+        "due_date",
+        "items",
+    ],
+    "logs": ["customer_id", "timestamp", "action", "details"],
+    "unanswered_questions": ["customer_id", "question", "timestamp", "status", "response"],
+}
+# Quarter-hour slots between 08:00 and 19:45 in the Time column format
+TIME_SLOTS = [f"{h:02d}:{m:02d}:00.000000" for h in range(8, 20) for m in (0, 15, 30, 45)]
+
+
+class Progress:
+    """One self-updating stderr line per table."""
+
+    def __init__(self, label: str, total: int):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+
+    def update(self, count: int):
+        self.done += count
+        seconds = time.perf_counter() - self.started
+        rate = self.done / seconds if seconds else 0
+        eta = (self.total - self.done) / rate if rate else 0
+        sys.stderr.write(
+            f"\r{self.label:<22}{self.done:>14,}/{self.total:<14,}"
+            f"{self.done / max(self.total, 1):>7.1%}{rate:>12,.0f} rows/s"
+            f"  eta {eta:>5.0f}s "
+        )
+        if self.done >= self.total:
+            sys.stderr.write("\n")
+        sys.stderr.flush()
+
+
+def load(conn, table: str, columns: list, rows, total: int, batch_size: int):
+    """executemany rows into table in batches, reporting progress."""
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})"
+    )
+    progress = Progress(table, total)
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        conn.executemany(sql, batch)
+        progress.update(len(batch))
+    if total == 0:
+        progress.update(0)
+
+
+class Generator:
+    """Synthetic rows for every table, all derived from one seeded RNG."""
+
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.customer_ids = range(1, args.customers + 1)
+        self.types = [rng.choice(list(BUSINESS_TYPES)) for _ in self.customer_ids]
+        # Pareto tenant sizes: a few busy businesses and a long tail
+        weights = [rng.paretovariate(1.16) for _ in self.customer_ids]
+        self.cum_weights = list(itertools.accumulate(weights))
+        today = args.anchor_date
+        self.first_day = today - dt.timedelta(days=args.days)
+        self.days = [
+            (self.first_day + dt.timedelta(days=i)).isoformat()
+            for i in range(args.days + 1)
+        ]
+        # Appointments also run a month ahead
+        self.appointment_days = self.days + [
+            (today + dt.timedelta(days=i)).isoformat() for i in range(1, 31)
+        ]
+
+    def tenants(self, count: int):
+        """count customer ids drawn by tenant size, in batches."""
+        while count > 0:
+            k = min(count, 10_000)
+            yield from self.rng.choices(
+                self.customer_ids, cum_weights=self.cum_weights, k=k
+            )
+            count -= k
+
+    def customers(self):
+        rng = self.rng
+        for customer_id, kind in zip(self.customer_ids, self.types):
+            city = rng.choice(CITIES)
+            name = f"{rng.choice(CITIES)} {kind} {customer_id}"
+            yield (
+                f"Owner {customer_id}",
+                f"owner{customer_id}@example.com",
+                f"+1555{customer_id:07d}",
+                name,
+                kind,
+                f"{rng.randint(1, 999)} {rng.choice(STREETS)}, {city}",
+                f"{100000000 + customer_id}",
+            )
+
+    def offerings(self, customer_id: int):
+        """(name, price, duration, category) for a customer's services."""
+        category, services, _ = BUSINESS_TYPES[self.types[customer_id - 1]]
+        for i in range(self.args.services_per_customer):
+            name, price, duration = services[i % len(services)]
+            if i >= len(services):
+                name = f"{name} {VARIANTS[(i // len(services) - 1) % len(VARIANTS)]} {i}"
+                price = round(price * self.rng.uniform(0.8, 1.6), 2)
+            yield name, price, duration, category
+
+    def services(self):
+        for customer_id in self.customer_ids:
+            for name, price, duration, _ in self.offerings(customer_id):
+                minutes = None
+                if duration:
+                    amount, unit = duration.split()
+                    minutes = int(amount) * (60 if unit.startswith("hour") else 1)
+                yield customer_id, name, f"Our {name.lower()}", price, minutes
+
+    def business_services(self):
+        for customer_id in self.customer_ids:
+            for name, price, duration, category in self.offerings(customer_id):
+                yield (
+                    customer_id,
+                    name,
+                    f"Our popular {name.lower()}",
+                    category,
+                    price,
+                    duration,
+                    self.rng.random() > 0.05,
+                    None,
+                )
+
+    def inventory(self):
+        rng = self.rng
+        for customer_id in self.customer_ids:
+            items = BUSINESS_TYPES[self.types[customer_id - 1]][2]
+            for i in range(self.args.inventory_per_customer):
+                yield (
+                    customer_id,
+                    f"{items[i % len(items)]} #{i + 1}",
+                    rng.randint(0, 200),
+                    round(rng.uniform(1, 80), 2),
+                    "Supplies",
+                )
+
+    def business_hours(self):
+        for customer_id in self.customer_ids:
+            opens = self.rng.choice(["08:00", "09:00", "10:00"])
+            closes = self.rng.choice(["17:00", "18:00", "20:00"])
+            for day in range(7):
+                closed = day == 6 and self.rng.random() < 0.7
+                yield customer_id, day, opens, closes, closed
+
+    def policies(self):
+        for customer_id in self.customer_ids:
+            for title, content, category in POLICIES:
+                yield customer_id, title, content, category
+
+    def business_facts(self):
+        rng = self.rng
+        for customer_id, kind in zip(self.customer_ids, self.types):
+            for i in range(self.args.facts_per_customer):
+                title, content, category = FACTS[i % len(FACTS)]
+                if i >= len(FACTS):
+                    title = f"{title} ({i})"
+                yield (
+                    customer_id,
+                    title,
+                    content.format(
+                        name=f"our {kind.lower()}",
+                        kind=kind.lower(),
+                        city=rng.choice(CITIES),
+                        year=rng.randint(1980, 2022),
+                    ),
+                    category,
+                    rng.random() > 0.1,
+                )
+
+    def appointments(self):
+        rng = self.rng
+        per_customer = self.args.services_per_customer
+        today = len(self.days) - 1
+        for customer_id in self.tenants(self.args.appointments):
+            day = rng.randrange(len(self.appointment_days))
+            yield (
+                customer_id,
+                (customer_id - 1) * per_customer + rng.randrange(per_customer) + 1,
+                self.appointment_days[day],
+                rng.choice(TIME_SLOTS),
+                "scheduled" if day >= today else rng.choice(PAST_APPOINTMENT_STATUSES),
+                None,
+            )
+
+    def invoices(self):
+        rng = self.rng
+        for customer_id in self.tenants(self.args.invoices):
+            created = rng.randrange(len(self.days))
+            due = min(created + 30, len(self.days) - 1)
+            yield (
+                customer_id,
+                None,
+                round(rng.uniform(10, 400), 2),
+                rng.choice(INVOICE_STATUSES),
+                self.days[created],
+                self.days[due],
+                None,
+            )
+
+    def logs(self):
+        rng = self.rng
+        total = self.args.logs
+        # Spread evenly over the window in time order, like appended logs
+        step = dt.timedelta(seconds=self.args.days * 86400 / max(total, 1))
+        timestamp = dt.datetime.combine(self.first_day, dt.time.min)
+        for i, customer_id in enumerate(self.tenants(total)):
+            timestamp += step
+            yield (
+                customer_id,
+                timestamp.strftime("%Y-%m-%d %H:%M:%S.%f"),
+                rng.choice(LOG_ACTIONS),
+                f"Message: question {i}, Response: answer {i}",
+            )
+
+    def unanswered_questions(self):
+        rng = self.rng
+        for customer_id in self.tenants(self.args.questions):
+            yield (
+                customer_id,
+                rng.choice(QUESTIONS),
+                f"{rng.choice(self.days)} {rng.choice(TIME_SLOTS)}",
+                rng.choice(["pending", "pending", "answered"]),
+                None,
+            )
+
+
+async def run_async(path: str, step):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as conn:
+        await step(conn)
+    await engine.dispose()
+
+
+async def create_schema(conn):
+    await conn.run_sync(Base.metadata.create_all)
+    await run_migrations(conn)
+
+
+async def finish_schema(conn):
+    await ensure_search_index(conn)
+    rows = await rebuild_revenue_rollups(conn)
+    print(f"revenue_daily: {rows:,} rollup rows")
+
+
+def seed(args):
+    if os.path.exists(args.db):
+        if not args.overwrite:
+            sys.exit(f"{args.db} exists, pass --overwrite to replace it")
+        os.remove(args.db)
+    started = time.perf_counter()
+    asyncio.run(run_async(args.db, create_schema))
+
+    gen = Generator(args, random.Random(args.seed))
+    customers = args.customers
+    totals = {
+        "customers": customers,
+        "services": customers * args.services_per_customer,
+        "business_services": customers * args.services_per_customer,
+        "inventory": customers * args.inventory_per_customer,
+        "business_hours": customers * 7,
+        "policies": customers * len(POLICIES),
+        "business_facts": customers * args.facts_per_customer,
+        "appointments": args.appointments,
+        "invoices": args.invoices,
+        "logs": args.logs,
+        "unanswered_questions": args.questions,
+    }
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+    # Secondary indexes are dropped for the load and rebuilt in one pass after
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+        f"AND tbl_name IN ({', '.join('?' for _ in TABLE_COLUMNS)})",
+        list(TABLE_COLUMNS),
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+
+    conn.execute("BEGIN")
+    for table, columns in TABLE_COLUMNS.items():
+        rows = getattr(gen, table)()
+        load(conn, table, columns, rows, totals[table], args.batch_size)
+    conn.execute("COMMIT")
+
+    index_started = time.perf_counter()
+    for _, sql in indexes:
+        conn.execute(sql)
+    print(f"Rebuilt {len(indexes)} indexes in {time.perf_counter() - index_started:.1f}s")
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+
+    asyncio.run(run_async(args.db, finish_schema))
+    conn = sqlite3.connect(args.db)
+    conn.execute("ANALYZE")
+    conn.close()
+    size_mb = os.path.getsize(args.db) / 1024 / 1024
+    print(
+        f"Seeded {args.db} ({size_mb:,.0f} MiB) in {time.perf_counter() - started:.1f}s"
+        f" with seed {args.seed}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a multi-tenant database for load tests and benchmarks"
+    )
+    parser.add_argument("--db", required=True, help="SQLite file to create")
+    parser.add_argument("--profile", choices=PROFILES, default="dev")
+    parser.add_argument("--customers", type=int)
+    parser.add_argument("--appointments", type=int)
+    parser.add_argument("--invoices", type=int)
+    parser.add_argument("--logs", type=int)
+    parser.add_argument("--questions", type=int, help="default: 3 per customer")
+    parser.add_argument("--services-per-customer", type=int, default=8)
+    parser.add_argument("--facts-per-customer", type=int, default=10)
+    parser.add_argument("--inventory-per-customer", type=int, default=20)
+    parser.add_argument("--days", type=int, default=730, help="history window")
+    parser.add_argument(
+        "--anchor-date",
+        type=dt.date.fromisoformat,
+        default=ANCHOR_DATE,
+        help="last day of history, YYYY-MM-DD (appointments run a month past it)",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+    for key, value in PROFILES[args.profile].items():
+        if getattr(args, key) is None:
+            setattr(args, key, value)
+    if args.questions is None:
+        args.questions = args.customers * 3
+    seed(args)
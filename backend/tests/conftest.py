@@ -0,0 +1,37 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+@pytest.fixture
+def app_state(tmp_path, monkeypatch):
+    """A fresh database, knowledge index and empty caches for the app."""
+    main.bind_database(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(
+        main, "knowledge_store", main.KnowledgeStore(tmp_path / "knowledge")
+    )
+    monkeypatch.setattr(main, "kb_cache", main.KBCache(max_bytes=1 << 20))
+    # Fresh revisions, so the test's caches are the only subscribers and
+    # nothing outlives the test
+    kb_revisions = main.KBRevisions()
+    monkeypatch.setattr(main, "kb_revisions", kb_revisions)
+    response_cache = main.ResponseCache(
+        max_entries=100, max_bytes=1 << 20, ttl_seconds=3600
+    )
+    kb_revisions.subscribe(response_cache.invalidate)
+    monkeypatch.setattr(main, "response_cache", response_cache)
+    semantic_cache = main.SemanticCache(
+        threshold=0.8, max_per_customer=100, path=str(tmp_path / "semantic_cache")
+    )
+    kb_revisions.subscribe(semantic_cache.invalidate)
+    monkeypatch.setattr(main, "semantic_cache", semantic_cache)
+    monkeypatch.setattr(main, "intent_router_enabled", False)
+    yield tmp_path
+    main.bind_database("sqlite+aiosqlite:///./customers.db")
+
+
+@pytest.fixture
+def client(app_state):
+    with TestClient(main.app) as test_client:
+        yield test_client
@@ -0,0 +1,77 @@
+import json
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+import main
+
+FACT_CALL = {
+    "name": "add_business_fact",
+    "args": {"title": "Parking", "content": "Free parking behind the shop"},
+}
+
+
+class WriteToolLLM:
+    """A tool-bound model that answers with a short preamble and one write
+    tool call, invoked or streamed."""
+
+    async def ainvoke(self, messages):
+        return AIMessage(
+            content="Sure, saving that.", tool_calls=[{**FACT_CALL, "id": "call-1"}]
+        )
+
+    async def astream(self, messages):
+        yield AIMessageChunk(content="Sure, saving that.")
+        yield AIMessageChunk(
+            content="",
+            tool_call_chunks=[
+                {
+                    "name": FACT_CALL["name"],
+                    "args": json.dumps(FACT_CALL["args"]),
+                    "id": "call-1",
+                    "index": 0,
+                }
+            ],
+        )
+
+
+def use_write_tool(monkeypatch):
+    llms = (None, WriteToolLLM())
+    monkeypatch.setattr(main.llm_pool, "get", lambda *args, **kwargs: llms)
+
+
+def test_direct_answer_records_llm_latency(client, monkeypatch):
+    use_write_tool(monkeypatch)
+    recorded = []
+    monkeypatch.setattr(main.intent_router, "record_llm", recorded.append)
+
+    response = client.post(
+        "/api/chat",
+        json={"message": "We have free parking", "customer_id": 1, "api_key": "test"},
+    )
+    assert response.json()["response"].startswith("✅ Successfully stored")
+    assert len(recorded) == 1
+
+
+def stream_tokens(client, message: str) -> str:
+    text = ""
+    with client.stream(
+        "POST",
+        "/api/chat/stream",
+        json={"message": message, "customer_id": 1, "api_key": "test"},
+    ) as response:
+        event = None
+        for line in response.iter_lines():
+            if line.startswith("event: "):
+                event = line[len("event: ") :]
+            elif line.startswith("data: ") and event == "token":
+                text += json.loads(line[len("data: ") :])["text"]
+    return text
+
+
+def test_stream_sends_direct_answer_after_streamed_preamble(client, monkeypatch):
+    use_write_tool(monkeypatch)
+
+    text = stream_tokens(client, "We have free parking")
+    assert text.startswith("Sure, saving that.")
+    assert "✅ Successfully stored: **Parking**" in text
+    assert text.count("✅") == 1
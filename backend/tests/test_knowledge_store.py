@@ -0,0 +1,78 @@
+import asyncio
+
+import main
+
+
+def create_fact(client, customer_id: int, title: str, content: str) -> dict:
+    response = client.post(
+        "/api/business-facts",
+        json={
+            "customer_id": customer_id,
+            "title": title,
+            "content": content,
+            "category": "info",
+        },
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def test_concurrent_cold_gets_build_once(client):
+    create_fact(client, 1, "Parking", "Free parking behind the shop")
+    store = main.knowledge_store
+
+    async def cold_gets():
+        return await asyncio.gather(*(store.get(1) for _ in range(8)))
+
+    indexes = client.portal.call(cold_gets)
+    assert store.builds == 1
+    assert all(index is indexes[0] for index in indexes)
+    assert len(indexes[0]) == 1
+
+
+def test_applied_changes_are_saved_with_their_vectors(client):
+    create_fact(client, 1, "Parking", "Free parking behind the shop")
+    index = client.portal.call(main.knowledge_store.get, 1)
+    create_fact(client, 1, "Wifi", "Guest wifi in the lobby")
+
+    reopened = main.KnowledgeIndex.open(index.path)
+    assert reopened is not None
+    assert sorted(text for text in reopened.texts if text) == [
+        "Parking: Free parking behind the shop",
+        "Wifi: Guest wifi in the lobby",
+    ]
+
+
+def test_vectors_out_of_step_with_metadata_are_rebuilt(client):
+    create_fact(client, 1, "Parking", "Free parking behind the shop")
+    index = client.portal.call(main.knowledge_store.get, 1)
+    # A crash after writing vectors in place but before saving metadata
+    index.vectors[0] = 0
+    index.vectors.flush()
+    assert main.KnowledgeIndex.open(index.path) is None
+
+    store = main.KnowledgeStore(main.knowledge_store.directory)
+    rebuilt = client.portal.call(store.get, 1)
+    assert store.builds == 1
+    assert len(rebuilt) == 1
+
+
+def retrieve(client, query: str, k: int) -> str:
+    return client.portal.call(
+        main.retrieve_relevant_knowledge.ainvoke,
+        {"customer_id": 1, "query": query, "k": k},
+    )
+
+
+def test_retrieve_clamps_k_to_one(client):
+    create_fact(client, 1, "Parking", "Free parking behind the shop")
+    for k in (0, -3):
+        assert "Free parking behind the shop" in retrieve(client, "parking", k)
+
+
+def test_retrieve_tells_empty_index_from_no_match(client):
+    assert retrieve(client, "parking", 5) == "No business information available."
+    create_fact(client, 1, "Parking", "Free parking behind the shop")
+    assert retrieve(client, "zzz qqq", 5) == (
+        "No relevant information found for 'zzz qqq'."
+    )
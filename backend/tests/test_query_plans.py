@@ -0,0 +1,22 @@
+import asyncio
+
+import check_query_plans
+import main
+
+
+def test_hot_tool_queries_use_their_indexes(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(
+        main, "knowledge_store", main.KnowledgeStore(tmp_path / "knowledge")
+    )
+    monkeypatch.setattr(main, "kb_cache", main.KBCache(max_bytes=1 << 20))
+
+    async def check():
+        try:
+            return await check_query_plans.check()
+        finally:
+            # The write tools start the queue on this test's event loop
+            await main.write_queue.stop()
+
+    passed = asyncio.run(check())
+    main.bind_database("sqlite+aiosqlite:///./customers.db")
+    assert passed, capsys.readouterr().out
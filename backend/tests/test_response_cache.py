@@ -0,0 +1,167 @@
+import json
+import sqlite3
+
+import numpy as np
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage
+
+import main
+
+
+class ScriptedLLM:
+    """Stands in for a pooled Gemini client: the tool-bound model asks for
+    one tool call and the plain model echoes the tool results back."""
+
+    def __init__(self, tool_call=None):
+        self.tool_call = tool_call
+
+    async def ainvoke(self, messages):
+        if self.tool_call is not None:
+            tool_calls = [{**self.tool_call, "id": "call-1"}]
+            return AIMessage(content="", tool_calls=tool_calls)
+        return AIMessage(content=messages[-1].content)
+
+
+def use_tool(monkeypatch, name: str, args: dict):
+    llms = (ScriptedLLM(), ScriptedLLM({"name": name, "args": args}))
+    monkeypatch.setattr(main.llm_pool, "get", lambda *args, **kwargs: llms)
+
+
+def create_customer(client) -> int:
+    response = client.post(
+        "/api/customers",
+        json={"name": "Cache", "email": "cache@example.com", "phone": "555-0100"},
+    )
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+def create_invoice(client, customer_id: int, total_amount: float):
+    client.post(
+        "/api/invoices",
+        json={
+            "customer_id": customer_id,
+            "total_amount": total_amount,
+            "status": "paid",
+            "created_date": "2024-01-05",
+            "due_date": "2024-01-05",
+        },
+    ).raise_for_status()
+
+
+def chat(client, customer_id: int, message: str) -> str:
+    response = client.post(
+        "/api/chat",
+        json={"message": message, "customer_id": customer_id, "api_key": "test"},
+    )
+    response.raise_for_status()
+    return response.json()["response"]
+
+
+def test_revenue_reply_misses_cache_after_new_invoice(client, monkeypatch):
+    customer_id = create_customer(client)
+    create_invoice(client, customer_id, 10.0)
+    use_tool(monkeypatch, "get_customer_revenue", {"date": "2024-01-05"})
+
+    question = "What was revenue on 2024-01-05?"
+    assert "$10.0 from 1 invoices" in chat(client, customer_id, question)
+    create_invoice(client, customer_id, 90.0)
+    misses = main.response_cache.misses
+    assert "$100.0 from 2 invoices" in chat(client, customer_id, question)
+    assert main.response_cache.misses == misses + 1
+    assert main.response_cache.hits == 0
+
+
+def test_knowledge_base_reply_is_cached_until_kb_changes(client, monkeypatch):
+    customer_id = create_customer(client)
+    use_tool(monkeypatch, "get_customer_business_facts", {})
+
+    question = "Tell me about the business"
+    assert "No business information available" in chat(client, customer_id, question)
+    assert "No business information available" in chat(client, customer_id, question)
+    assert main.response_cache.hits == 1
+
+    client.post(
+        "/api/business-facts",
+        json={
+            "customer_id": customer_id,
+            "title": "Parking",
+            "content": "Free parking",
+            "category": "info",
+        },
+    ).raise_for_status()
+    assert "Free parking" in chat(client, customer_id, question)
+    assert main.response_cache.hits == 1
+
+
+def test_revenue_reply_is_not_kept_by_semantic_cache(client, monkeypatch):
+    monkeypatch.setattr(main, "semantic_cache_enabled", True)
+    customer_id = create_customer(client)
+    create_invoice(client, customer_id, 10.0)
+    use_tool(monkeypatch, "get_customer_revenue", {"date": "2024-01-05"})
+
+    assert "$10.0" in chat(client, customer_id, "What was revenue on 2024-01-05?")
+    assert main.semantic_cache.stats()["entries"] == 0
+    create_invoice(client, customer_id, 90.0)
+    assert "$100.0" in chat(client, customer_id, "what was the revenue on 2024-01-05")
+    assert main.semantic_cache.hits == 0
+
+
+def test_knowledge_base_reply_is_kept_by_semantic_cache(client, monkeypatch):
+    monkeypatch.setattr(main, "semantic_cache_enabled", True)
+    customer_id = create_customer(client)
+    use_tool(monkeypatch, "list_business_services", {})
+
+    chat(client, customer_id, "Which services do you offer?")
+    assert main.semantic_cache.stats()["entries"] == 1
+
+
+def cache_services_reply(monkeypatch) -> int:
+    """Start the app, cache one knowledge base reply and shut down, which
+    saves the semantic cache."""
+    use_tool(monkeypatch, "list_business_services", {})
+    with TestClient(main.app) as client:
+        customer_id = create_customer(client)
+        chat(client, customer_id, "Which services do you offer?")
+    return customer_id
+
+
+def restart_entries(customer_id: int) -> int:
+    """Entries the semantic cache holds after starting the app again."""
+    main.semantic_cache.invalidate(customer_id)
+    with TestClient(main.app):
+        return main.semantic_cache.stats()["entries"]
+
+
+def test_saved_semantic_cache_survives_restart(app_state, monkeypatch):
+    monkeypatch.setattr(main, "semantic_cache_enabled", True)
+    customer_id = cache_services_reply(monkeypatch)
+    assert restart_entries(customer_id) == 1
+
+
+def test_saved_semantic_cache_skips_kb_written_while_down(app_state, monkeypatch):
+    monkeypatch.setattr(main, "semantic_cache_enabled", True)
+    customer_id = cache_services_reply(monkeypatch)
+    # Another process adds a service while the app is down
+    conn = sqlite3.connect(app_state / "test.db")
+    conn.execute(
+        "INSERT INTO business_services (customer_id, name, category, is_available)"
+        " VALUES (?, 'Color', 'service', 1)",
+        (customer_id,),
+    )
+    conn.commit()
+    conn.close()
+    assert restart_entries(customer_id) == 0
+
+
+def test_saved_semantic_cache_with_mismatched_rows_is_ignored(app_state, monkeypatch):
+    monkeypatch.setattr(main, "semantic_cache_enabled", True)
+    customer_id = cache_services_reply(monkeypatch)
+    path = main.semantic_cache.path + ".npz"
+    with np.load(path) as saved:
+        vectors, meta = saved["vectors"], json.loads(str(saved["meta"]))
+    assert len(meta["rows"]) == len(vectors) == 1
+    # One more row than vectors, as if only half of a save had landed
+    meta["rows"].append([customer_id, "Do you do color?", "Yes"])
+    np.savez(path, vectors=vectors, meta=np.array(json.dumps(meta)))
+    assert restart_entries(customer_id) == 0
@@ -0,0 +1,43 @@
+import pytest
+
+import main
+
+PARAPHRASES = [
+    ("Is parking free?", "is parking free"),
+    ("What are your opening hours?", "what are your opening hours please"),
+    ("Which services do you offer?", "what services do you offer"),
+    ("Are you open on Sunday?", "are you open sunday"),
+    ("How much is a haircut?", "how much does a haircut cost"),
+    ("Do you have vegan options?", "do you have any vegan options"),
+    ("Can I bring my dog?", "can i bring my dog with me"),
+]
+DIFFERENT_QUESTIONS = [
+    ("is parking free", "is parking not free"),
+    ("do you have vegan options", "do you have no vegan options"),
+    ("can i bring my dog", "can't i bring my dog"),
+    ("do you deliver", "dont you deliver"),
+    ("are you open on monday", "are you open on tuesday"),
+    ("is delivery available on friday", "is delivery available on saturday"),
+    ("can i book a haircut at 10:00", "can i book a haircut at 15:00"),
+    ("can i book a haircut at 10am", "can i book a haircut at 3pm"),
+    ("do you open before 9", "do you open after 9"),
+    ("how much is a haircut", "how much is a beard trim"),
+    ("do you have gift cards", "do you have private events"),
+]
+
+
+def cache_with(question: str) -> main.SemanticCache:
+    cache = main.SemanticCache(threshold=0.8, max_per_customer=10, path="/dev/null")
+    cache.put(1, question, "cached answer")
+    return cache
+
+
+@pytest.mark.parametrize("cached, asked", PARAPHRASES)
+def test_paraphrase_hits(cached, asked):
+    assert cache_with(cached).get(1, asked) == "cached answer"
+
+
+@pytest.mark.parametrize("cached, asked", DIFFERENT_QUESTIONS)
+def test_different_question_misses(cached, asked):
+    assert cache_with(cached).get(1, asked) is None
+    assert cache_with(asked).get(1, cached) is None
@@ -0,0 +1,69 @@
+import pytest
+
+import main
+
+
+def create(client, route: str, payload: dict):
+    client.post(f"/api/{route}", json=payload).raise_for_status()
+
+
+def call(client, chat_tool, **args) -> str:
+    return client.portal.call(chat_tool.ainvoke, {"customer_id": 1, **args})
+
+
+@pytest.fixture
+def rows(client, monkeypatch):
+    """Three of each row type for customer 1, with a row budget of two."""
+    monkeypatch.setattr(main, "tool_row_limit", 2)
+    for i in range(3):
+        create(
+            client,
+            "inventory",
+            {"customer_id": 1, "name": f"Item {i}", "quantity": i, "price": 1.0},
+        )
+        create(
+            client,
+            "business-facts",
+            {
+                "customer_id": 1,
+                "title": f"Parking {i}",
+                "content": "Free parking",
+                "category": "info",
+            },
+        )
+        create(
+            client,
+            "business-services",
+            {
+                "customer_id": 1,
+                "name": f"Haircut {i}",
+                "category": "service",
+                "price": 20.0,
+            },
+        )
+    return client
+
+
+@pytest.mark.parametrize("limit", [0, -1, -100])
+def test_zero_and_negative_limits_return_one_row(rows, limit):
+    inventory = call(rows, main.get_customer_inventory, limit=limit)
+    assert inventory.count("- Item") == 1
+    assert "2 more items" in inventory
+
+    facts = call(rows, main.get_customer_business_facts, limit=limit)
+    assert facts.count("**Parking") == 1
+
+    services = call(rows, main.list_business_services, limit=limit)
+    assert services.count("• **Haircut") == 1
+
+    found = call(rows, main.search_business_facts, query="parking", limit=limit)
+    assert found.count("**Parking") == 1
+
+    found = call(rows, main.search_business_services, query="haircut", limit=limit)
+    assert found.count("• **Haircut") == 1
+
+
+def test_limits_above_the_row_budget_are_capped(rows):
+    inventory = call(rows, main.get_customer_inventory, limit=1000)
+    assert inventory.count("- Item") == 2
+    assert "1 more items" in inventory
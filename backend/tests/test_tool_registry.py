@@ -0,0 +1,38 @@
+import asyncio
+
+import main
+
+
+def run_call(tool_call: dict):
+    events = []
+
+    async def emit(event: str, data: dict):
+        events.append((event, data))
+
+    async def run():
+        return await main.tool_registry.run_call(tool_call, 1, emit)
+
+    return asyncio.run(run()), events
+
+
+def test_unknown_tool_is_timed_as_a_failed_call(monkeypatch):
+    monkeypatch.setattr(main.tool_registry, "timings", {})
+    result, events = run_call({"name": "get_weather", "args": {}})
+
+    assert result == "Unknown tool"
+    assert main.tool_registry.timings["get_weather"]["errors"] == 1
+    assert [event for event, _ in events] == ["tool_start", "tool_end"]
+    assert events[-1][1]["ok"] is False
+
+
+def test_invalid_arguments_are_timed_as_a_failed_call(monkeypatch):
+    monkeypatch.setattr(main.tool_registry, "timings", {})
+    result, events = run_call(
+        {"name": "get_customer_revenue", "args": {"date": ["not", "a", "date"]}}
+    )
+
+    assert result.startswith("❌ Invalid arguments for get_customer_revenue")
+    stats = main.tool_registry.timings["get_customer_revenue"]
+    assert (stats["calls"], stats["errors"]) == (1, 1)
+    assert [event for event, _ in events] == ["tool_start", "tool_end"]
+    assert events[-1][1]["ok"] is False
@@ -0,0 +1,78 @@
+import asyncio
+import datetime as dt
+
+from sqlalchemy import func, select
+
+import main
+from main import InventoryItem, Log
+
+
+def count(client, stmt) -> int:
+    async def run():
+        async with main.read_session() as session:
+            return (await session.execute(stmt)).scalar_one()
+
+    return client.portal.call(run)
+
+
+def test_import_runs_as_one_write_queue_command(client):
+    rows = [
+        {"customer_id": 1, "name": "Shampoo", "quantity": 3, "price": 8.5},
+        {"customer_id": 1, "name": "Comb", "quantity": 5, "price": 2.0},
+    ]
+    commands = main.write_queue.commands
+    client.post("/api/import/inventory", json=rows).raise_for_status()
+    assert main.write_queue.commands == commands + 1
+
+    rows[0]["quantity"] = 7
+    response = client.post("/api/import/inventory?mode=upsert", json=rows[:1])
+    assert response.json()["updated"] == 1
+    assert main.write_queue.commands == commands + 2
+    assert count(client, select(func.count()).select_from(InventoryItem)) == 2
+    quantity = select(InventoryItem.quantity).where(InventoryItem.name == "Shampoo")
+    assert count(client, quantity) == 7
+
+
+def test_prune_runs_through_the_write_queue(client):
+    now = dt.datetime.now()
+
+    async def add_logs():
+        for days in (1, 40):
+            timestamp = now - dt.timedelta(days=days)
+            await main.write_queue.add(
+                Log(customer_id=1, timestamp=timestamp, action="chat")
+            )
+
+    client.portal.call(add_logs)
+    writer = main.LogWriter(
+        max_queue=10,
+        batch_size=10,
+        flush_interval=1.0,
+        overflow="block",
+        retention_days=30,
+    )
+    commands = main.write_queue.commands
+    assert client.portal.call(writer.prune) == 1
+    assert main.write_queue.commands == commands + 1
+    assert count(client, select(func.count()).select_from(Log)) == 1
+
+
+def test_log_writer_drains_a_backlog_without_waiting(client):
+    writer = main.LogWriter(
+        max_queue=100, batch_size=2, flush_interval=30.0, overflow="block"
+    )
+    now = dt.datetime.now()
+
+    async def submit_and_wait():
+        for _ in range(6):
+            await writer.submit({"customer_id": 1, "timestamp": now, "action": "chat"})
+        for _ in range(100):
+            if writer.written == 6:
+                break
+            await asyncio.sleep(0.01)
+        written = writer.written
+        await writer.stop()
+        return written
+
+    assert client.portal.call(submit_and_wait) == 6
+    assert writer.flushes == 3